@@ -0,0 +1,357 @@
+import datetime
+import logging
+import sqlite3
+import warnings
+from typing import NamedTuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class Threshold(NamedTuple):
+    """
+    How much worse a metric must get to count as a regression: both the
+    absolute and the relative (to the baseline) change must be reached.
+    """
+    absolute: float
+    relative: float
+
+
+# the metrics analysed by default, and whether a higher value is worse
+METRIC_DIRECTIONS = {
+    'performance_score': False,
+    'first_contentful_paint': True,
+    'speed_index': True,
+    'largest_contentful_paint': True,
+    'cumulative_layout_shift': True,
+    'total_blocking_time': True,
+    'time_to_interactive': True,
+}
+
+DEFAULT_THRESHOLDS = {
+    'performance_score': Threshold(5, 0.05),
+    'first_contentful_paint': Threshold(200, 0.10),
+    'speed_index': Threshold(300, 0.10),
+    'largest_contentful_paint': Threshold(250, 0.10),
+    'cumulative_layout_shift': Threshold(0.05, 0.20),
+    'total_blocking_time': Threshold(50, 0.20),
+    'time_to_interactive': Threshold(300, 0.10),
+}
+
+# the audit profiles analysed by default: the desktop ones, whose metrics are
+# comparable with each other (see lighthouse.profiles)
+DEFAULT_PROFILES = ('full', 'perf')
+
+# rows per block when medians are computed over windows, which bounds the
+# temporary (rows x window) arrays to a few megabytes
+CHUNK_ROWS = 65536
+
+
+class MetricHistory:
+    """
+    The Lighthouse_CPS history as columnar numpy arrays, one entry per row,
+    sorted by (url, environment) group and then by time.
+
+    Attributes:
+        groups (list): (url, environment) of each group code.
+        versions (list): (version, branch) of each version code.
+        group (numpy.ndarray): The group code of each row.
+        version (numpy.ndarray): The version code of each row.
+        epoch (numpy.ndarray): The timestamp of each row, in seconds.
+        metrics (dict): Metric names mapped to float arrays, NaN where the
+        metric is missing.
+    """
+
+    def __init__(self, groups, versions, group, version, epoch, metrics):
+        self.groups = groups
+        self.versions = versions
+        self.group = group
+        self.version = version
+        self.epoch = epoch
+        self.metrics = metrics
+
+        codes = np.arange(len(groups))
+        self.group_start = np.searchsorted(group, codes, side='left')
+        self.group_end = np.searchsorted(group, codes, side='right')
+
+    def __len__(self):
+        return len(self.epoch)
+
+    @classmethod
+    def load(cls, database, metrics=None, since=None, url=None, environment=None,
+             profiles=DEFAULT_PROFILES):
+        """
+        Loads the history in bulk.
+
+        The (url, environment) groups and (version, branch) pairs are
+        numbered in temporary tables, so each row arrives as numbers only;
+        the rows are then converted to arrays and sorted by numpy, without
+        Python code per row.
+
+        Args:
+            database (str or sqlite3.Connection): The database.
+            metrics (list or None): The metric columns, every metric of
+            METRIC_DIRECTIONS if None.
+            since (str or None): The inclusive ISO-8601 lower bound.
+            url (str or None): Only load this URL.
+            environment (str or None): Only load this environment.
+            profiles (tuple or None): Only load rows of these audit profiles
+            (and rows without one); every row if None.
+
+        Returns:
+            MetricHistory: The history; rows without any of the metrics
+            (failed evaluations) are left out.
+        """
+        metrics = list(metrics or METRIC_DIRECTIONS)
+        unknown = [metric for metric in metrics if metric not in METRIC_DIRECTIONS]
+        if unknown:
+            raise ValueError(f'Unknown metrics: {", ".join(unknown)}')
+
+        conditions = ['timestamp IS NOT NULL',
+                      '(' + ' OR '.join(f'{metric} IS NOT NULL' for metric in metrics) + ')']
+        parameters = []
+        for column, value in (('timestamp >=', since), ('url =', url),
+                              ('environment =', environment)):
+            if value is not None:
+                conditions.append(f'{column} ?')
+                parameters.append(value)
+        if profiles is not None:
+            conditions.append(f"(audit_profile IS NULL OR audit_profile IN "
+                              f"({', '.join('?' for _ in profiles)}))")
+            parameters.extend(profiles)
+        where = ' AND '.join(conditions)
+
+        # unixepoch() is several times faster, where available (3.38+)
+        epoch = 'unixepoch(timestamp)' if sqlite3.sqlite_version_info >= (3, 38) \
+            else "CAST(strftime('%s', timestamp) AS INTEGER)"
+
+        connection = database if isinstance(database, sqlite3.Connection) \
+            else sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+        try:
+            groups = cls._number(connection, 'history_groups', 'url', 'environment',
+                                 where, parameters)
+            versions = cls._number(connection, 'history_versions', 'version', 'branch',
+                                   where, parameters)
+            rows = connection.execute(f'''
+                SELECT g.id, v.id, {epoch}, c.id, {', '.join(f'c.{metric}' for metric in metrics)}
+                FROM (SELECT * FROM Lighthouse_CPS WHERE {where}) AS c
+                JOIN temp.history_groups AS g
+                    ON g.url IS c.url AND g.environment IS c.environment
+                JOIN temp.history_versions AS v
+                    ON v.version IS c.version AND v.branch IS c.branch
+            ''', parameters).fetchall()
+        finally:
+            connection.execute('DROP TABLE IF EXISTS temp.history_groups')
+            connection.execute('DROP TABLE IF EXISTS temp.history_versions')
+            if connection is not database:
+                connection.close()
+
+        # a structured array converts every row at C speed, NULL becomes NaN
+        table = np.array(rows, dtype=[('group', np.int64), ('version', np.int64),
+                                      ('epoch', np.int64), ('id', np.int64)] +
+                                     [(metric, np.float64) for metric in metrics])
+        del rows
+        table = table[np.lexsort((table['id'], table['epoch'], table['group']))]
+
+        logger.info(f'Loaded {len(table)} rows of {len(groups)} URLs')
+        return cls(groups, versions, table['group'], table['version'], table['epoch'],
+                   {metric: table[metric] for metric in metrics})
+
+    @staticmethod
+    def _number(connection, table, first, second, where, parameters):
+        """
+        Numbers the distinct (first, second) pairs from 0, in sort order, in
+        a temporary table.
+
+        Returns:
+            list: The pairs, indexed by their number.
+        """
+        connection.execute(f'DROP TABLE IF EXISTS temp.{table}')
+        connection.execute(f'''
+            CREATE TEMP TABLE {table} (
+                id INTEGER PRIMARY KEY,
+                {first} TEXT,
+                {second} TEXT,
+                UNIQUE ({first}, {second})
+            )
+        ''')
+        connection.execute(f'''
+            INSERT INTO temp.{table} (id, {first}, {second})
+            SELECT ROW_NUMBER() OVER (ORDER BY {first}, {second}) - 1, {first}, {second}
+            FROM (SELECT DISTINCT {first}, {second} FROM Lighthouse_CPS WHERE {where})
+        ''', parameters)
+        return connection.execute(f'SELECT {first}, {second} FROM temp.{table} '
+                                  f'ORDER BY id').fetchall()
+
+
+def window_median(values, history, rows, offsets):
+    """
+    The median of each row's window, restricted to the row's group.
+
+    Args:
+        values (numpy.ndarray): The metric of every row.
+        history (MetricHistory): The history the values belong to.
+        rows (numpy.ndarray): The rows whose windows are computed.
+        offsets (numpy.ndarray): The window, relative to each row (e.g.
+        -10..-1 for the ten previous rows).
+
+    Returns:
+        tuple: (medians, counts); the median is NaN for an empty window and
+        the count is the number of non-missing values in it.
+    """
+    medians = np.full(len(rows), np.nan)
+    counts = np.zeros(len(rows), dtype=np.int64)
+
+    for block in range(0, len(rows), CHUNK_ROWS):
+        chunk = rows[block:block + CHUNK_ROWS]
+        index = chunk[:, None] + offsets[None, :]
+        inside = (index >= history.group_start[history.group[chunk]][:, None]) & \
+                 (index < history.group_end[history.group[chunk]][:, None])
+        window = np.where(inside, values[np.clip(index, 0, len(values) - 1)], np.nan)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN windows
+            medians[block:block + CHUNK_ROWS] = np.nanmedian(window, axis=1)
+        counts[block:block + CHUNK_ROWS] = np.count_nonzero(~np.isnan(window), axis=1)
+
+    return medians, counts
+
+
+class RegressionDetector:
+    """
+    Finds the points where a metric of a URL got worse.
+
+    The candidates are
+        - 'version': every row where the version or branch differs from the
+        previous row of the same URL and environment,
+        - 'drift': the start of the last `window` rows of each URL and
+        environment, which catches regressions without a deploy.
+
+    At each candidate the median of the `window` rows before it (the rolling
+    baseline) is compared with the median of the `window` rows from it on.
+    Medians keep a single noisy Lighthouse run from raising an alarm.
+    """
+
+    def __init__(self, thresholds=None, window=10, min_samples=3):
+        """
+        Initialize the RegressionDetector.
+
+        Args:
+            thresholds (dict or None): Metric names mapped to a Threshold,
+            merged into DEFAULT_THRESHOLDS.
+            window (int): The number of rows on each side of a candidate.
+            min_samples (int): The number of values each side needs.
+        """
+        self.thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        self.window = max(1, window)
+        self.min_samples = max(1, min(min_samples, self.window))
+        self._before = np.arange(-self.window, 0)
+        self._after = np.arange(0, self.window)
+
+    def rolling_baseline(self, history, metric):
+        """
+        The baseline of every row: the median of the `window` previous rows
+        of its URL and environment.
+
+        Args:
+            history (MetricHistory): The history.
+            metric (str): The metric.
+
+        Returns:
+            numpy.ndarray: The baseline of each row, NaN where fewer than
+            `min_samples` previous values exist.
+        """
+        medians, counts = window_median(history.metrics[metric], history,
+                                        np.arange(len(history)), self._before)
+        medians[counts < self.min_samples] = np.nan
+        return medians
+
+    def candidates(self, history):
+        """
+        Returns:
+            tuple: (rows, kinds) of the candidate change points, sorted.
+        """
+        same_group = np.zeros(len(history), dtype=bool)
+        same_group[1:] = history.group[1:] == history.group[:-1]
+        changed = np.zeros(len(history), dtype=bool)
+        changed[1:] = history.version[1:] != history.version[:-1]
+        version_rows = np.flatnonzero(same_group & changed)
+
+        sizes = history.group_end - history.group_start
+        tail = np.minimum(self.window, sizes // 2)
+        has_tail = tail >= self.min_samples
+        drift_rows = (history.group_end - tail)[has_tail]
+        drift_rows = drift_rows[~np.isin(drift_rows, version_rows)]
+
+        rows = np.concatenate([version_rows, drift_rows])
+        kinds = np.array(['version'] * len(version_rows) + ['drift'] * len(drift_rows),
+                         dtype=object)
+        order = np.argsort(rows, kind='stable')
+        return rows[order], kinds[order]
+
+    def detect(self, history):
+        """
+        Args:
+            history (MetricHistory): The history.
+
+        Returns:
+            list: One dict per regression, oldest first, with 'url',
+            'environment', 'metric', 'kind', 'timestamp', 'version',
+            'branch', 'previous_version', 'previous_branch', 'baseline',
+            'current', 'change' and 'relative_change'.
+        """
+        rows, kinds = self.candidates(history)
+        if not len(rows):
+            return []
+
+        found = []
+        for metric, values in history.metrics.items():
+            threshold = self.thresholds[metric]
+            direction = 1 if METRIC_DIRECTIONS[metric] else -1
+
+            baseline, before = window_median(values, history, rows, self._before)
+            current, after = window_median(values, history, rows, self._after)
+
+            change = current - baseline
+            worse = change * direction
+            with np.errstate(divide='ignore', invalid='ignore'):
+                relative = worse / np.abs(baseline)
+            relative[(baseline == 0) & (worse > 0)] = np.inf
+
+            flagged = (before >= self.min_samples) & (after >= self.min_samples) & \
+                      (worse >= threshold.absolute) & (relative >= threshold.relative)
+
+            for index in np.flatnonzero(flagged):
+                found.append(self._regression(history, metric, rows[index],
+                                              kinds[index], baseline[index],
+                                              current[index], change[index],
+                                              relative[index] * direction))
+
+        found.sort(key=lambda regression: (regression['timestamp'],
+                                           regression['url'], regression['metric']))
+        return found
+
+    @staticmethod
+    def _regression(history, metric, row, kind, baseline, current, change, relative):
+        url, environment = history.groups[history.group[row]]
+        version, branch = history.versions[history.version[row]]
+        previous_version, previous_branch = history.versions[history.version[row - 1]]
+        timestamp = datetime.datetime.fromtimestamp(
+            int(history.epoch[row]), datetime.timezone.utc).replace(tzinfo=None)
+
+        return {
+            'url': url,
+            'environment': environment,
+            'metric': metric,
+            'kind': kind,
+            'timestamp': timestamp.isoformat(),
+            'version': version,
+            'branch': branch,
+            'previous_version': previous_version,
+            'previous_branch': previous_branch,
+            'baseline': round(float(baseline), 3),
+            'current': round(float(current), 3),
+            'change': round(float(change), 3),
+            'relative_change': round(float(relative), 4),
+        }
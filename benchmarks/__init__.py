@@ -0,0 +1,3 @@
+# used to automatically import the modules (classes) of the package
+import benchmarks.stub_server
+import benchmarks.pipeline_benchmark
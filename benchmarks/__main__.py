@@ -0,0 +1,7 @@
+import sys
+
+#  the work is done by the `benchmark` subcommand of the command line
+#  interface, see command_line/main.py (`perf-test benchmark`)
+from command_line.main import main
+
+sys.exit(main(['benchmark'] + sys.argv[1:]))
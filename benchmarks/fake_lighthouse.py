@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+A stand-in for the Lighthouse CLI, for benchmarks: point LIGHTHOUSE_CMD at
+it (through a wrapper, see PipelineBenchmark) and every audit sleeps and
+then emits a canned report, to --output-path or to stdout like Lighthouse.
+
+Environment:
+    FAKE_LIGHTHOUSE_DELAY: Seconds an audit takes (default 1).
+    FAKE_LIGHTHOUSE_REPORT_BYTES: The approximate size of the report; the
+    padding stands in for the screenshots and audit details of a real one
+    (default 500000).
+    FAKE_LIGHTHOUSE_FAIL_RATE: The fraction of audits that exit with an
+    error (default 0).
+"""
+import json
+import os
+import random
+import sys
+import time
+
+
+def canned_report(url, report_bytes):
+    """
+    Returns:
+        dict: A report with the parts the pipeline reads, padded to about
+        `report_bytes` bytes.
+    """
+    return {
+        'requestedUrl': url,
+        'categories': {
+            'performance': {'score': 0.91},
+            'accessibility': {'score': 0.88},
+            'best-practices': {'score': 0.95},
+            'seo': {'score': 0.9},
+        },
+        'audits': {
+            'metrics': {
+                'details': {
+                    'items': [{
+                        'firstContentfulPaint': 812,
+                        'speedIndex': 1406,
+                        'largestContentfulPaint': 1733,
+                        'cumulativeLayoutShift': 0.021,
+                        'totalBlockingTime': 96,
+                        'interactive': 2290,
+                    }],
+                },
+            },
+            'screenshot-thumbnails': {'details': {'data': 'x' * max(0, report_bytes - 1024)}},
+        },
+    }
+
+
+def main(argv):
+    delay = float(os.environ.get('FAKE_LIGHTHOUSE_DELAY', 1))
+    report_bytes = int(os.environ.get('FAKE_LIGHTHOUSE_REPORT_BYTES', 500000))
+    fail_rate = float(os.environ.get('FAKE_LIGHTHOUSE_FAIL_RATE', 0))
+
+    url = next((arg for arg in argv if not arg.startswith('--')), '')
+    output_path = next((arg.split('=', 1)[1] for arg in argv
+                        if arg.startswith('--output-path=')), None)
+
+    time.sleep(delay)
+
+    if random.random() < fail_rate:
+        sys.stderr.write(f'Runtime error encountered: fake failure for {url}\n')
+        return 1
+
+    report = json.dumps(canned_report(url, report_bytes))
+
+    if output_path:
+        with open(output_path, 'w') as report_file:
+            report_file.write(report)
+    else:
+        sys.stdout.write(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
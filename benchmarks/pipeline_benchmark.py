@@ -0,0 +1,241 @@
+import contextlib
+import csv
+import datetime
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+#  import packages (modules/classes)
+from benchmarks.stub_server import StubServer
+from data_driver.data_drive import DataDrive
+from pipeline.executor import PipelineExecutor
+from pipeline.task_log import configure_logging
+from storage.sqlite import SQLiteDatabase
+from url_information import information
+
+logger = logging.getLogger(__name__)
+
+FAKE_LIGHTHOUSE = Path(__file__).with_name('fake_lighthouse.py')
+
+
+@contextlib.contextmanager
+def offline_environment(directory, server, lighthouse_delay, report_bytes,
+                        lighthouse_fail_rate):
+    """
+    Points Lighthouse at the fake CLI and the version lookups at the stub
+    server for the duration of the block.
+    """
+    # LIGHTHOUSE_CMD is a single executable, so wrap the script with this
+    # interpreter
+    command = Path(directory) / 'lighthouse'
+    command.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_LIGHTHOUSE}" "$@"\n')
+    command.chmod(0o755)
+
+    variables = {
+        'LIGHTHOUSE_CMD': str(command),
+        'FAKE_LIGHTHOUSE_DELAY': str(lighthouse_delay),
+        'FAKE_LIGHTHOUSE_REPORT_BYTES': str(report_bytes),
+        'FAKE_LIGHTHOUSE_FAIL_RATE': str(lighthouse_fail_rate),
+    }
+    saved_variables = {name: os.environ.get(name) for name in variables}
+    saved_urls = dict(information.ENVIRONMENT_URLS)
+
+    os.environ.update(variables)
+    for environment in information.ENVIRONMENT_URLS:
+        information.ENVIRONMENT_URLS[environment] = server.url('/version.txt')
+
+    try:
+        yield
+    finally:
+        information.ENVIRONMENT_URLS.update(saved_urls)
+        for name, value in saved_variables.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def peak_rss_mb():
+    """
+    Returns:
+        tuple: The peak resident memory of this process and of its largest
+        finished child (the Lighthouse stand-ins), in megabytes; (None, None)
+        where the resource module is missing.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None, None
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return (round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1))
+
+
+def git_commit():
+    """
+    Returns:
+        str or None: The commit of the working tree, so results can be
+        compared across changes; None outside a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=Path(__file__).parent, capture_output=True,
+                              text=True, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class PipelineBenchmark:
+    """
+    Measures the framework's own overhead: the 'run' pipeline (CSV, version
+    lookup, up-check/curl probe, Lighthouse, SQLite) is run end to end
+    against a local stub server and a fake Lighthouse, so the numbers do not
+    depend on the network or on Chrome.
+
+    The result is a JSON-serializable dict with the parameters, the URLs per
+    second, the latency of each stage (the pipeline's own stage timers) and
+    the peak memory, tagged with the
+    git commit so runs can be compared over time.
+    """
+
+    def __init__(self, urls=200, io_workers=8, lighthouse_workers=2,
+                 server_latency=0.05, server_jitter=0.0, failure_rate=0.0,
+                 lighthouse_delay=0.5, lighthouse_fail_rate=0.0,
+                 report_bytes=500000, stream_reports=False, batch_size=50,
+                 warm_probe=True, trace_memory=False, seed=0):
+        """
+        Initialize the PipelineBenchmark.
+
+        Args:
+            urls (int): The number of URLs in the generated CSV.
+            io_workers (int): The number of URLs evaluated at the same time.
+            lighthouse_workers (int): The number of audits run at the same
+            time.
+            server_latency (float): Seconds the stub server delays responses.
+            server_jitter (float): The most seconds added to that at random.
+            failure_rate (float): The fraction of URLs answering 503.
+            lighthouse_delay (float): Seconds each fake audit takes.
+            lighthouse_fail_rate (float): The fraction of fake audits failing.
+            report_bytes (int): The size of each fake report.
+            stream_reports (bool): Read reports from the subprocess output.
+            batch_size (int): The number of rows written per transaction.
+            warm_probe (bool): Probe each URL a second time on the same
+            connection, as 'run' does by default.
+            trace_memory (bool): Also measure the peak Python allocations
+            with tracemalloc, which slows the run down.
+            seed (int): Seeds the choice of failing URLs and the jitter.
+        """
+        self.urls = urls
+        self.io_workers = io_workers
+        self.lighthouse_workers = lighthouse_workers
+        self.server_latency = server_latency
+        self.server_jitter = server_jitter
+        self.failure_rate = failure_rate
+        self.lighthouse_delay = lighthouse_delay
+        self.lighthouse_fail_rate = lighthouse_fail_rate
+        self.report_bytes = report_bytes
+        self.stream_reports = stream_reports
+        self.batch_size = batch_size
+        self.warm_probe = warm_probe
+        self.trace_memory = trace_memory
+        self.seed = seed
+
+    @property
+    def parameters(self):
+        """
+        Returns:
+            dict: The benchmark's settings, as recorded with its results.
+        """
+        return {name: getattr(self, name) for name in (
+            'urls', 'io_workers', 'lighthouse_workers', 'server_latency',
+            'server_jitter', 'failure_rate', 'lighthouse_delay',
+            'lighthouse_fail_rate', 'report_bytes', 'stream_reports',
+            'batch_size', 'warm_probe', 'trace_memory', 'seed')}
+
+    def run(self):
+        """
+        Run the benchmark once.
+
+        Returns:
+            dict: 'benchmark', 'timestamp', 'commit', 'python', 'platform',
+            'parameters' and 'results'.
+        """
+        rng = random.Random(self.seed)
+        failing = set(rng.sample(range(self.urls), round(self.urls * self.failure_rate)))
+        statuses = {f'/page/{index}': 503 for index in failing}
+
+        with tempfile.TemporaryDirectory(prefix='perf-benchmark-') as directory, \
+                StubServer(latency=self.server_latency, jitter=self.server_jitter,
+                           statuses=statuses, rng=rng) as server, \
+                offline_environment(directory, server, self.lighthouse_delay,
+                                    self.report_bytes, self.lighthouse_fail_rate):
+            csv_path = self._write_csv(directory, server)
+            database = os.path.join(directory, 'benchmark.db')
+            log_listener = configure_logging(os.path.join(directory, 'benchmark.log'),
+                                             level=logging.INFO)
+
+            executor = PipelineExecutor(directory, database,
+                                        io_workers=self.io_workers,
+                                        lighthouse_workers=self.lighthouse_workers,
+                                        batch_size=self.batch_size,
+                                        stream_reports=self.stream_reports,
+                                        warm_probe=self.warm_probe)
+
+            if self.trace_memory:
+                tracemalloc.start()
+            try:
+                started = time.perf_counter()
+                count = executor.run(DataDrive(csv_path).iter_records())
+                elapsed = time.perf_counter() - started
+                traced_peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+            finally:
+                if self.trace_memory:
+                    tracemalloc.stop()
+                log_listener.stop()
+
+            with SQLiteDatabase(database) as db:
+                stored, failed = db.fetch_data(
+                    'SELECT COUNT(*), COUNT(error_log) FROM Lighthouse_CPS;')[0]
+            requests = server.requests
+
+        rss, children_rss = peak_rss_mb()
+
+        return {
+            'benchmark': 'pipeline',
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'parameters': self.parameters,
+            'results': {
+                'urls': count,
+                'stored': stored,
+                'failed': failed,
+                'http_requests': requests,
+                'elapsed_seconds': round(elapsed, 3),
+                'urls_per_second': round(count / elapsed, 3) if elapsed else None,
+                'stages': executor.stage_histograms.summary(),
+                'peak_rss_mb': rss,
+                'peak_child_rss_mb': children_rss,
+                'peak_traced_mb': None if traced_peak is None
+                else round(traced_peak / (1024 * 1024), 1),
+            },
+        }
+
+    def _write_csv(self, directory, server):
+        path = os.path.join(directory, 'benchmark_urls.csv')
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['URL', 'Description'])
+            for index in range(self.urls):
+                writer.writerow([server.url(f'/page/{index}'), f'page {index}'])
+        return path
@@ -0,0 +1,135 @@
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# what the environments' version.txt looks like, see url_information
+VERSION_TEXT = 'app-1.2.3 (release-1.2.3-build.42)\n'
+
+
+class StubServer:
+    """
+    A local HTTP server standing in for the evaluated sites, so the pipeline
+    can be measured without the network.
+
+    Every request waits `latency` seconds (plus up to `jitter` more) and is
+    answered with the status code configured for its path, 200 by default,
+    and a body of `body_bytes` bytes. '/version.txt' answers with a version
+    string the version lookup understands.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, statuses=None, body_bytes=16384,
+                 host='127.0.0.1', port=0, rng=None):
+        """
+        Initialize the StubServer.
+
+        Args:
+            latency (float): Seconds every response is delayed by.
+            jitter (float): The most seconds added to the latency at random.
+            statuses (dict or None): Paths mapped to the status code they
+            answer with.
+            body_bytes (int): The size of every response body.
+            host (str): The address to listen on.
+            port (int): The port to listen on, any free port if 0.
+            rng (random.Random or None): The source of the jitter.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.statuses = dict(statuses or {})
+        self.body = b'x' * body_bytes
+        self.requests = 0
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    def __enter__(self) -> 'StubServer':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def base_url(self):
+        """
+        Returns:
+            str: The server's URL, without a trailing slash.
+        """
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def url(self, path):
+        """
+        Returns:
+            str: The URL of a path on the server.
+        """
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def start(self):
+        """
+        Serve requests on a background thread.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever,
+                                            name='stub-server', daemon=True)
+            self._thread.start()
+            logger.info(f'Stub server listening on {self.base_url}')
+
+    def stop(self):
+        """
+        Stop serving and close the socket.
+        """
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+    def _respond(self, path):
+        """
+        Returns:
+            tuple: (status code, body) of a request, after its delay.
+        """
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+
+        if delay > 0:
+            time.sleep(delay)
+
+        if path == '/version.txt':
+            return 200, VERSION_TEXT.encode()
+        return self.statuses.get(path, 200), self.body
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body go out in separate writes; with Nagle's
+            # algorithm a kept-alive connection would wait for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                status, body = stub._respond(self.path.split('?', 1)[0])
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_HEAD(self):
+                status, body = stub._respond(self.path.split('?', 1)[0])
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
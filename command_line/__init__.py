@@ -0,0 +1,2 @@
+# used to automatically import the modules (classes) of the package
+import command_line.main
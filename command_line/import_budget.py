@@ -0,0 +1,89 @@
+import argparse
+import re
+import subprocess
+import sys
+
+# modules that must never be imported just to start the CLI
+HEAVY_MODULES = ['requests', 'pycurl', 'pandas', 'numpy', 'pyarrow', 'dotenv',
+                 'ijson', 'urllib.request', 'concurrent.futures']
+
+IMPORT_TIME_LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(\s*)(\S+)')
+
+
+def measure(module='command_line.main', runs=5):
+    """
+    Measures the cold-start import time of a module in fresh interpreters.
+
+    Args:
+        module (str): The module to import.
+        runs (int): The number of interpreters started; the fastest counts,
+        to filter out noise from the machine.
+
+    Returns:
+        tuple: (milliseconds, heavy modules that were imported, the slowest
+        imports as (milliseconds, module) pairs).
+    """
+    check = (f'import sys, {module}; '
+             f'print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))')
+    best = None
+
+    for _ in range(max(1, runs)):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', check],
+                                   capture_output=True, text=True, check=True)
+        timings = {}
+        for line in completed.stderr.splitlines():
+            match = IMPORT_TIME_LINE.match(line)
+            if match:
+                timings[match.group(4)] = int(match.group(2))
+
+        if module not in timings:
+            raise RuntimeError(f'{module} was already imported by the interpreter')
+
+        milliseconds = timings[module] / 1000
+        if best is None or milliseconds < best[0]:
+            slowest = sorted(((microseconds / 1000, name)
+                              for name, microseconds in timings.items()
+                              if name != module), reverse=True)[:10]
+            heavy = [name for name in completed.stdout.strip().split(',') if name]
+            best = (milliseconds, heavy, slowest)
+
+    return best
+
+
+def main(argv=None):
+    """
+    Fails (exit code 1) if importing the CLI takes longer than the budget or
+    pulls in a heavy dependency.
+
+    Args:
+        argv (list or None): The arguments, sys.argv[1:] if None.
+
+    Returns:
+        int: The exit code.
+    """
+    parser = argparse.ArgumentParser(
+        description='Check the cold-start import time of the CLI.')
+    parser.add_argument('--module', default='command_line.main')
+    parser.add_argument('--budget-ms', type=float, default=25.0)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    milliseconds, heavy, slowest = measure(args.module, args.runs)
+
+    print(f'{args.module}: {milliseconds:.1f} ms (budget {args.budget_ms:.1f} ms)')
+    for module_milliseconds, name in slowest:
+        print(f'  {module_milliseconds:8.1f} ms  {name}')
+
+    failed = False
+    if heavy:
+        print(f'FAIL: heavy modules imported at start-up: {", ".join(heavy)}')
+        failed = True
+    if milliseconds > args.budget_ms:
+        print('FAIL: import time is over budget')
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,941 @@
+import argparse
+import logging
+import sys
+
+# Only the standard library is imported here. Every subcommand imports the
+# packages it needs when it runs, so `probe` or `report` never pay for
+# Lighthouse, the pipeline or the HTTP libraries, and the CLI starts in
+# milliseconds (see command_line.import_budget).
+
+# the audit profiles of lighthouse.profiles.AUDIT_PROFILES, listed here so the
+# parser is built without importing the lighthouse package
+AUDIT_PROFILE_NAMES = ['full', 'perf', 'mobile']
+
+
+def load_environment():
+    """
+    Loads the .env file of the working directory into os.environ.
+
+    This must happen before `constants` is imported, since it reads its
+    settings from the environment. python-dotenv is optional.
+    """
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+
+    load_dotenv(dotenv_path='.env')
+
+
+def build_executor(args, run_id=None):
+    """
+    Args:
+        args (argparse.Namespace): The command line options.
+        run_id (int or None): The run whose checkpoint the results update.
+
+    Returns:
+        PipelineExecutor: The executor configured from the constants, with
+        the command line options taking precedence.
+    """
+    #  import packages (modules/classes)
+    from lighthouse.sampling import AdaptiveSampler
+    from pipeline.executor import PipelineExecutor
+
+    #  constants
+    from constants import (
+        ARCHIVE_DATABASE, ARCHIVE_MAX_MB, ARCHIVE_REPORTS, CHROME_MAX_AUDITS,
+        CHROME_POOL, CONNECT_TIMEOUT, DATABASE, DB_BATCH_SIZE,
+        DB_FLUSH_INTERVAL, IO_WORKERS, LIGHTHOUSE_AUDIT, LIGHTHOUSE_MAX_RUNS,
+        LIGHTHOUSE_MIN_RUNS, LIGHTHOUSE_PRECISION, LIGHTHOUSE_STREAM,
+        LIGHTHOUSE_PROFILE, LIGHTHOUSE_WORKERS, METRICS_FILE, METRICS_INTERVAL,
+        PROBE_MAX_BODY_BYTES, PROBE_WARM, REQUEST_TIMEOUT,
+        TASK_LOG_MAX_RECORDS, VERSION_CACHE_TTL
+    )
+
+    # noisy URLs may be audited several times, see LIGHTHOUSE_MAX_RUNS
+    sampler = None
+    if LIGHTHOUSE_MAX_RUNS > 1:
+        sampler = AdaptiveSampler(min_runs=LIGHTHOUSE_MIN_RUNS,
+                                  max_runs=LIGHTHOUSE_MAX_RUNS,
+                                  relative_precision=LIGHTHOUSE_PRECISION)
+
+    return PipelineExecutor(
+        LIGHTHOUSE_AUDIT, args.database or DATABASE,
+        io_workers=args.io_workers or IO_WORKERS,
+        lighthouse_workers=args.lighthouse_workers or LIGHTHOUSE_WORKERS,
+        reuse_browsers=CHROME_POOL,
+        browser_max_audits=CHROME_MAX_AUDITS,
+        probe_settings={
+            'connect_timeout': CONNECT_TIMEOUT,
+            'timeout': REQUEST_TIMEOUT,
+            'max_body_bytes': PROBE_MAX_BODY_BYTES,
+        },
+        version_cache_ttl=VERSION_CACHE_TTL,
+        batch_size=DB_BATCH_SIZE,
+        flush_interval=DB_FLUSH_INTERVAL,
+        stream_reports=LIGHTHOUSE_STREAM,
+        archive_database=ARCHIVE_DATABASE if ARCHIVE_REPORTS else None,
+        archive_max_bytes=ARCHIVE_MAX_MB * 1024 * 1024,
+        sampler=sampler,
+        max_log_records=TASK_LOG_MAX_RECORDS,
+        run_id=run_id,
+        metrics_file=METRICS_FILE,
+        metrics_interval=METRICS_INTERVAL,
+        warm_probe=PROBE_WARM,
+        profile=args.profile or LIGHTHOUSE_PROFILE)
+
+
+def run_command(args):
+    """
+    Evaluates every URL of the CSV and stores the results (what main.py has
+    always done).
+
+    Every run gets an id, and the database records which of its URLs were
+    evaluated as they are stored; --resume continues a run that crashed or
+    was interrupted, skipping the URLs that succeeded.
+    """
+    import datetime
+
+    load_environment()
+
+    #  import packages (modules/classes)
+    from data_driver.data_drive import DataDrive
+    from pipeline.task_log import configure_logging
+    from storage.sqlite import SQLiteDatabase
+
+    #  constants
+    from constants import (
+        CSV_DRIVER, DATABASE, DEDUPE_POLICY, LIGHTHOUSE_AUDIT, LIGHTHOUSE_PROFILE,
+        LOG_FILE, SHARD_COUNT, SHARD_INDEX
+    )
+
+    # 1. create or resume the run
+    with SQLiteDatabase(args.database or DATABASE) as db:
+        db.ensure_schema()
+
+        if args.resume is None:
+            csv = str(args.csv or CSV_DRIVER)
+            run_id = db.start_run(datetime.datetime.now().isoformat(timespec='seconds'),
+                                  csv)
+            succeeded = set()
+        else:
+            run = db.fetch_run(None if args.resume == 'latest' else int(args.resume))
+            if run is None:
+                print(f'No run to resume: {args.resume}', file=sys.stderr)
+                return 2
+
+            run_id, _, _, status, source = run
+            csv = str(args.csv or source or CSV_DRIVER)
+            succeeded = db.fetch_succeeded_urls(run_id)
+            db.finish_run(run_id, None, 'running')
+            print(f'Resuming run {run_id} ({status}), skipping '
+                  f'{len(succeeded)} evaluated URLs')
+
+    print(f'Run {run_id}')
+
+    # 2. create and configure the logger shared by the whole run
+    # every URL task additionally keeps its own log in memory for the
+    # 'error_log' column; the shared log file is written in the background
+    log_listener = configure_logging(f'{LIGHTHOUSE_AUDIT}/{LOG_FILE}')
+
+    # 3. the URLs to be evaluated, read lazily so the first URLs are
+    # evaluated while the rest of the CSV is still being read
+    urls_from_csv = DataDrive(csv).iter_records(
+        shard_index=SHARD_INDEX, shard_count=SHARD_COUNT, dedupe=DEDUPE_POLICY)
+    if succeeded:
+        # a URL without a profile is audited with the run's
+        profile = args.profile or LIGHTHOUSE_PROFILE
+        urls_from_csv = (record for record in urls_from_csv
+                         if (record.url, record.description or '',
+                             record.profile or profile) not in succeeded)
+
+    # 4. evaluate the URLs, several at a time
+    executor = build_executor(args, run_id=run_id)
+    status = 'interrupted'
+
+    try:
+        count = executor.run(urls_from_csv)
+        status = 'finished'
+    finally:
+        log_listener.stop()
+        # a crash leaves the run 'running'; either way it can be resumed
+        with SQLiteDatabase(args.database or DATABASE) as db:
+            db.finish_run(run_id, datetime.datetime.now().isoformat(timespec='seconds'),
+                          status)
+
+    with SQLiteDatabase(args.database or DATABASE) as db:
+        progress = db.fetch_run_progress(run_id)
+
+    print(f"Evaluated {count} URLs; run {run_id}: {progress.get('succeeded', 0)} "
+          f"succeeded, {progress.get('failed', 0)} failed")
+    return 0
+
+
+def schedule_command(args):
+    """
+    Evaluates the URLs of the CSV again and again, each on its own interval,
+    until interrupted.
+    """
+    import signal
+
+    load_environment()
+
+    #  import packages (modules/classes)
+    from data_driver.data_drive import DataDrive
+    from pipeline.task_log import configure_logging
+    from scheduler.daemon import AuditScheduler
+
+    #  constants
+    from constants import (
+        CSV_DRIVER, DEDUPE_POLICY, LIGHTHOUSE_AUDIT, LOG_FILE,
+        SCHEDULE_DEFAULT_INTERVAL, SCHEDULE_JITTER, SCHEDULE_MAX_IN_FLIGHT,
+        SHARD_COUNT, SHARD_INDEX
+    )
+
+    # 1. create and configure the logger
+    log_listener = configure_logging(f'{LIGHTHOUSE_AUDIT}/{LOG_FILE}')
+
+    # 2. the URLs with their optional 'Interval' and 'Priority' columns
+    schedule_from_csv = DataDrive(args.csv or CSV_DRIVER).iter_schedule(
+        shard_index=SHARD_INDEX, shard_count=SHARD_COUNT, dedupe=DEDUPE_POLICY)
+
+    # 3. evaluate each URL whenever it is due, until SIGINT or SIGTERM
+    scheduler = AuditScheduler(
+        build_executor(args),
+        default_interval=args.default_interval or SCHEDULE_DEFAULT_INTERVAL,
+        jitter=SCHEDULE_JITTER if args.jitter is None else args.jitter,
+        max_in_flight=args.max_in_flight or SCHEDULE_MAX_IN_FLIGHT)
+
+    def stop(signum, frame):
+        scheduler.stop()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        scheduler.run(schedule_from_csv)
+    finally:
+        log_listener.stop()
+
+    return 0
+
+
+def coordinator_command(args):
+    """
+    Queues a job for every URL of the CSV, for worker processes to evaluate.
+    """
+    load_environment()
+
+    #  import packages (modules/classes)
+    from data_driver.data_drive import DataDrive
+    from distributed.coordinator import Coordinator
+    from storage.job_queue import JobQueue
+
+    #  constants
+    from constants import (
+        CSV_DRIVER, DEDUPE_POLICY, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS,
+        JOB_QUEUE_DATABASE
+    )
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(name)s:%(message)s')
+
+    # the 'Priority' column orders the jobs
+    records = DataDrive(args.csv or CSV_DRIVER).iter_schedule(dedupe=DEDUPE_POLICY)
+
+    with JobQueue(args.queue_database or JOB_QUEUE_DATABASE,
+                  lease_seconds=JOB_LEASE_SECONDS) as job_queue:
+        coordinator = Coordinator(job_queue)
+        added = coordinator.enqueue(records, max_attempts=args.max_attempts or JOB_MAX_ATTEMPTS)
+        print(f'Queued {added} jobs')
+
+        if args.wait:
+            counts = coordinator.wait()
+            print(', '.join(f'{status}: {count}' for status, count in sorted(counts.items())))
+            return 1 if counts.get('failed') else 0
+
+    return 0
+
+
+def worker_command(args):
+    """
+    Evaluates jobs from the shared queue until interrupted (or until the
+    queue is empty, with --exit-when-empty).
+    """
+    import signal
+
+    load_environment()
+
+    #  import packages (modules/classes)
+    from distributed.worker import QueueWorker
+    from pipeline.task_log import configure_logging
+    from storage.job_queue import JobQueue
+
+    #  constants
+    from constants import (
+        JOB_LEASE_SECONDS, JOB_POLL_INTERVAL, JOB_QUEUE_DATABASE,
+        LIGHTHOUSE_AUDIT, LOG_FILE
+    )
+
+    # 1. create and configure the logger
+    log_listener = configure_logging(f'{LIGHTHOUSE_AUDIT}/{LOG_FILE}')
+
+    # 2. claim jobs and evaluate them; the results go to this worker's
+    # database, the job states to the shared queue
+    with JobQueue(args.queue_database or JOB_QUEUE_DATABASE,
+                  lease_seconds=args.lease or JOB_LEASE_SECONDS) as job_queue:
+        worker = QueueWorker(job_queue, build_executor(args), name=args.name,
+                             poll_interval=JOB_POLL_INTERVAL,
+                             exit_when_empty=args.exit_when_empty)
+
+        def stop(signum, frame):
+            worker.stop()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        try:
+            worker.run()
+        finally:
+            log_listener.stop()
+
+    print(f'Worker {worker.name}: {worker.completed} jobs done, {worker.failed} failed')
+    return 0
+
+
+def probe_command(args):
+    """
+    Checks URLs and prints their curl timings, without Lighthouse or the
+    database.
+    """
+    import json
+
+    load_environment()
+    logging.basicConfig(level=logging.WARNING,
+                        format='%(levelname)s - %(name)s:%(message)s')
+
+    if args.samples > 1:
+        from metrics.curl_batch import CurlBatchMetrics
+
+        results = CurlBatchMetrics(args.urls, samples=args.samples,
+                                   timeout=args.timeout).calculate_ttfb()
+        print(json.dumps(results, indent=2))
+        return 0 if all(result['samples'] for result in results.values()) else 1
+
+    from metrics.curl_metrics import CurlMetrics
+
+    exit_code = 0
+    for url in args.urls:
+        curl_metrics = CurlMetrics(url)
+        probe = curl_metrics.probe_pair if args.warm else curl_metrics.probe
+        ttfb = probe(connect_timeout=args.connect_timeout, timeout=args.timeout,
+                     max_body_bytes=args.max_body_bytes)
+        print(json.dumps({'url': url, **(ttfb or {'up': False})}))
+        if not ttfb or not ttfb['up']:
+            exit_code = 1
+
+    return exit_code
+
+
+def report_command(args):
+    """
+    Prints the latest results of every URL, or the history of one URL.
+    """
+    import os
+
+    from storage.sqlite import SQLiteDatabase
+
+    database = args.database
+    if database is None:
+        from constants import DATABASE
+        database = DATABASE
+
+    if not os.path.exists(database):
+        print(f'No database at {database}', file=sys.stderr)
+        return 1
+
+    if args.trend:
+        if not args.url:
+            print('--trend needs --url', file=sys.stderr)
+            return 2
+        return print_trend(database, args)
+
+    columns = ['url', 'timestamp', 'environment', 'version', 'audit_profile',
+               'performance_score', 'largest_contentful_paint',
+               'total_blocking_time']
+
+    with SQLiteDatabase(database, read_only=True) as db:
+        if schema_behind(db):
+            return 1
+
+        if args.url:
+            rows = db.fetch_data(
+                f"SELECT {', '.join(columns)}, error_log IS NOT NULL "
+                f"FROM Lighthouse_CPS WHERE url = ? "
+                f"ORDER BY timestamp DESC LIMIT ?;", (args.url, args.limit))
+        else:
+            # the latest row of every URL, found through the (url, timestamp)
+            # index
+            rows = db.fetch_data(
+                f"SELECT {', '.join(columns)}, error_log IS NOT NULL "
+                f"FROM Lighthouse_CPS AS latest WHERE timestamp = ("
+                f"SELECT MAX(timestamp) FROM Lighthouse_CPS "
+                f"WHERE url = latest.url) ORDER BY url LIMIT ?;", (args.limit,))
+
+    print_table(columns + ['error'], rows)
+    return 0
+
+
+def print_trend(database, args):
+    """
+    Prints the trend of one metric of a URL, read from the rollup tables.
+    """
+    from storage.sqlite import SQLiteDatabase
+
+    with SQLiteDatabase(database, read_only=True) as db:
+        if schema_behind(db):
+            return 1
+        try:
+            trend = db.fetch_trend(args.url, args.trend, args.granularity,
+                                   environment=args.environment, profile=args.profile)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    if not trend:
+        return 0
+
+    header = list(trend[0])
+    print_table(header, [[point[key] for key in header] for point in trend[-args.limit:]])
+    return 0
+
+
+def resources_command(args):
+    """
+    Prints the heaviest or slowest resources of a page in its latest
+    evaluations, read from the stored Lighthouse network requests.
+    """
+    import json
+    import os
+
+    from storage.sqlite import SQLiteDatabase
+
+    database = args.database
+    if database is None:
+        from constants import DATABASE
+        database = DATABASE
+
+    if not os.path.exists(database):
+        print(f'No database at {database}', file=sys.stderr)
+        return 1
+
+    with SQLiteDatabase(database, read_only=True) as db:
+        if schema_behind(db):
+            return 1
+        resources = db.fetch_top_resources(args.url, by=args.by, limit=args.limit,
+                                           evaluations=args.evaluations,
+                                           environment=args.environment,
+                                           start=args.since, profile=args.profile)
+
+    if args.json:
+        for resource in resources:
+            print(json.dumps(resource))
+        return 0
+
+    if resources:
+        header = ['timestamp', 'version', 'rank', 'resource_type',
+                  'transfer_size', 'duration', 'url']
+        print_table(header, [[resource[key] for key in header] for resource in resources])
+    return 0
+
+
+def schema_behind(db):
+    """
+    Returns True, and says why, if a database needs migrating first; the
+    commands that read the results leave migrating to the ones that write
+    them.
+    """
+    try:
+        db.check_schema()
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return True
+    return False
+
+
+def print_table(header, rows):
+    """
+    Prints rows as left-aligned columns under a header.
+    """
+    table = [header] + [['' if value is None else str(value) for value in row]
+                        for row in rows]
+    widths = [max(len(row[index]) for row in table) for index in range(len(header))]
+
+    for row in table:
+        print('  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+
+
+def rollup_command(args):
+    """
+    Adds every row not rolled up yet to the rollup tables, or rebuilds them.
+    """
+    import os
+
+    from storage.rollup import rebuild_rollups, update_rollups
+    from storage.sqlite import SQLiteDatabase
+
+    database = args.database
+    if database is None:
+        from constants import DATABASE
+        database = DATABASE
+
+    if not os.path.exists(database):
+        print(f'No database at {database}', file=sys.stderr)
+        return 1
+
+    with SQLiteDatabase(database) as db:
+        if schema_behind(db):
+            return 1
+        if args.rebuild:
+            count = rebuild_rollups(db.connection)
+        else:
+            count = update_rollups(db.connection)
+
+    print(f'Rolled up {count} rows')
+    return 0
+
+
+def export_command(args):
+    """
+    Writes the rows added since the last export to partitioned Parquet or
+    Arrow IPC files.
+    """
+    import os
+
+    from storage.export import HistoryExporter
+    from storage.sqlite import SQLiteDatabase
+
+    from constants import DATABASE, EXPORT_DIRECTORY, EXPORT_FORMAT
+
+    database = args.database or DATABASE
+    if not os.path.exists(database):
+        print(f'No database at {database}', file=sys.stderr)
+        return 1
+
+    directory = args.directory or EXPORT_DIRECTORY
+    with SQLiteDatabase(database, read_only=True) as db:
+        if schema_behind(db):
+            return 1
+        try:
+            exporter = HistoryExporter(db.connection, directory,
+                                       file_format=args.format or EXPORT_FORMAT,
+                                       chunk_size=args.chunk_size,
+                                       compression=args.compression)
+            exported = exporter.export()
+        except ImportError:
+            print('The export needs pyarrow: pip install performance-testing[export]',
+                  file=sys.stderr)
+            return 1
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    last_id = exported.pop('last_id')
+    print(f"Exported {', '.join(f'{count} {table}' for table, count in exported.items())} "
+          f"rows to {directory} (up to id {last_id})")
+    return 0
+
+
+def regressions_command(args):
+    """
+    Prints the points where a metric of a URL got worse, from the stored
+    history.
+    """
+    import json
+    import os
+
+    from analysis.regression import (
+        DEFAULT_PROFILES, MetricHistory, RegressionDetector, Threshold
+    )
+
+    database = args.database
+    if database is None:
+        from constants import DATABASE
+        database = DATABASE
+
+    if not os.path.exists(database):
+        print(f'No database at {database}', file=sys.stderr)
+        return 1
+
+    thresholds = {}
+    for setting in args.threshold:
+        try:
+            metric, limits = setting.split('=')
+            absolute, relative = limits.split(':')
+            thresholds[metric] = Threshold(float(absolute), float(relative))
+        except ValueError:
+            print(f'Invalid threshold {setting}, expected METRIC=ABSOLUTE:RELATIVE',
+                  file=sys.stderr)
+            return 2
+
+    try:
+        history = MetricHistory.load(database, metrics=args.metric or None,
+                                     since=args.since, url=args.url,
+                                     environment=args.environment,
+                                     profiles=args.profile or DEFAULT_PROFILES)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    detector = RegressionDetector(thresholds, window=args.window,
+                                  min_samples=args.min_samples)
+    regressions = detector.detect(history)
+
+    for regression in regressions:
+        if args.json:
+            print(json.dumps(regression))
+        else:
+            print(f"{regression['timestamp']}  {regression['url']} "
+                  f"({regression['environment']})  {regression['metric']} "
+                  f"{regression['baseline']} -> {regression['current']} "
+                  f"({regression['relative_change']:+.1%}), "
+                  f"{regression['kind']} {regression['previous_version']} -> "
+                  f"{regression['version']}")
+
+    # like grep, 1 tells scripts that something was found
+    return 1 if regressions else 0
+
+
+def load_test_command(args):
+    """
+    Load tests every URL of the CSV and stores the latency results.
+    """
+    import datetime
+
+    load_environment()
+
+    #  import packages (modules/classes)
+    from data_driver.data_drive import DataDrive
+    from load_test.engine import LoadTestEngine
+    from pipeline.task_log import configure_logging
+    from storage.sqlite import SQLiteDatabase
+
+    #  constants
+    from constants import (
+        CONNECT_TIMEOUT, CSV_DRIVER, DATABASE, DEDUPE_POLICY, LIGHTHOUSE_AUDIT,
+        LOAD_TEST_CONCURRENCY, LOAD_TEST_DURATION, LOAD_TEST_RATE, LOG_FILE,
+        REQUEST_TIMEOUT, SHARD_COUNT, SHARD_INDEX
+    )
+
+    # 1. create and configure the logger
+    log_listener = configure_logging(f'{LIGHTHOUSE_AUDIT}/{LOG_FILE}')
+
+    # 2. the URLs are the same ones the 'run' command evaluates
+    urls_from_csv = DataDrive(args.csv or CSV_DRIVER).iter_records(
+        shard_index=SHARD_INDEX, shard_count=SHARD_COUNT, dedupe=DEDUPE_POLICY)
+
+    # 3. load test each URL and store its result
+    engine = LoadTestEngine(duration=args.duration or LOAD_TEST_DURATION,
+                            concurrency=args.concurrency or LOAD_TEST_CONCURRENCY,
+                            rate=args.rate or LOAD_TEST_RATE,
+                            connect_timeout=CONNECT_TIMEOUT,
+                            timeout=REQUEST_TIMEOUT)
+
+    try:
+        with SQLiteDatabase(args.database or DATABASE) as db:
+            db.ensure_schema()
+            run_id = db.insert_load_test_run(
+                datetime.datetime.now().isoformat(timespec='seconds'),
+                engine.mode, engine.concurrency, engine.rate, engine.duration)
+
+            for result in engine.run(urls_from_csv):
+                db.insert_load_test_result(run_id, result)
+                print(f"{result['url']}: {result['throughput']} req/s, "
+                      f"errors {result['errors']}/{result['requests']}, "
+                      f"p50 {result['p50']} ms, p99 {result['p99']} ms")
+    finally:
+        log_listener.stop()
+
+    return 0
+
+
+def benchmark_command(args):
+    """
+    Measures the pipeline's own throughput, stage latencies and memory
+    offline, and appends the results to a JSON Lines file.
+    """
+    import json
+
+    load_environment()
+
+    #  import packages (modules/classes)
+    from benchmarks.pipeline_benchmark import PipelineBenchmark
+
+    #  constants
+    from constants import BENCHMARK_RESULTS
+
+    benchmark = PipelineBenchmark(
+        urls=args.urls, io_workers=args.io_workers,
+        lighthouse_workers=args.lighthouse_workers,
+        server_latency=args.latency, server_jitter=args.jitter,
+        failure_rate=args.failure_rate, lighthouse_delay=args.lighthouse_delay,
+        lighthouse_fail_rate=args.lighthouse_fail_rate,
+        report_bytes=args.report_bytes, stream_reports=args.stream,
+        warm_probe=not args.cold_only, trace_memory=args.trace_memory, seed=args.seed)
+
+    output = args.output or BENCHMARK_RESULTS
+
+    for repeat in range(args.repeat):
+        result = benchmark.run()
+        result['repeat'] = repeat
+
+        # one JSON document per line, so runs accumulate and can be compared
+        with open(output, 'a') as results_file:
+            results_file.write(json.dumps(result) + '\n')
+
+        if args.json:
+            print(json.dumps(result))
+            continue
+
+        results = result['results']
+        print(f"{results['urls']} URLs in {results['elapsed_seconds']} s: "
+              f"{results['urls_per_second']} URLs/s, {results['failed']} failed, "
+              f"peak RSS {results['peak_rss_mb']} MB")
+        for stage, latency in results['stages'].items():
+            print(f"  {stage:<15} n={latency['count']:<6} mean {latency['mean']} ms, "
+                  f"p50 {latency['p50']} ms, p99 {latency['p99']} ms")
+
+    return 0
+
+
+def build_parser():
+    """
+    Returns:
+        argparse.ArgumentParser: The parser of every subcommand.
+    """
+    parser = argparse.ArgumentParser(
+        prog='perf-test',
+        description='Website performance testing with Lighthouse and curl.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help='evaluate every URL of the CSV')
+    run.add_argument('--csv', help='the URL CSV (default: CPS_url.csv)')
+    run.add_argument('--database', help='the SQLite database')
+    run.add_argument('--io-workers', type=int,
+                     help='URLs evaluated at the same time')
+    run.add_argument('--lighthouse-workers', type=int,
+                     help='Lighthouse audits run at the same time')
+    run.add_argument('--resume', nargs='?', const='latest', metavar='RUN_ID',
+                     help='continue a run (default: the latest), evaluating '
+                          'only the URLs that failed or were not reached')
+    run.add_argument('--profile', choices=AUDIT_PROFILE_NAMES,
+                     help='the audit profile of URLs without a Profile column '
+                          '(default: full)')
+    run.set_defaults(handler=run_command)
+
+    schedule = subparsers.add_parser(
+        'schedule', help='evaluate the URLs of the CSV on their intervals')
+    schedule.add_argument('--csv', help='the URL CSV (default: CPS_url.csv)')
+    schedule.add_argument('--database', help='the SQLite database')
+    schedule.add_argument('--io-workers', type=int,
+                          help='URLs evaluated at the same time')
+    schedule.add_argument('--lighthouse-workers', type=int,
+                          help='Lighthouse audits run at the same time')
+    schedule.add_argument('--default-interval', type=float,
+                          help='seconds between evaluations of URLs without '
+                               'an Interval column')
+    schedule.add_argument('--jitter', type=float,
+                          help='the random fraction of the interval each run '
+                               'is moved by')
+    schedule.add_argument('--max-in-flight', type=int,
+                          help='URLs submitted to the workers at the same time')
+    schedule.add_argument('--profile', choices=AUDIT_PROFILE_NAMES,
+                          help='the audit profile of URLs without a Profile column '
+                               '(default: full)')
+    schedule.set_defaults(handler=schedule_command)
+
+    coordinator = subparsers.add_parser(
+        'coordinator', help='queue a job for every URL of the CSV')
+    coordinator.add_argument('--csv', help='the URL CSV (default: CPS_url.csv)')
+    coordinator.add_argument('--queue-database', help='the job queue database')
+    coordinator.add_argument('--max-attempts', type=int,
+                             help='the number of times a job is tried')
+    coordinator.add_argument('--wait', action='store_true',
+                             help='wait until every job is done or failed')
+    coordinator.set_defaults(handler=coordinator_command)
+
+    worker = subparsers.add_parser('worker', help='evaluate jobs from the queue')
+    worker.add_argument('--queue-database', help='the job queue database')
+    worker.add_argument('--database', help='the SQLite database for the results')
+    worker.add_argument('--io-workers', type=int,
+                        help='URLs evaluated at the same time')
+    worker.add_argument('--lighthouse-workers', type=int,
+                        help='Lighthouse audits run at the same time')
+    worker.add_argument('--name', help='a unique worker name (default: host-pid)')
+    worker.add_argument('--lease', type=float,
+                        help='seconds a claimed job is held without a heartbeat')
+    worker.add_argument('--exit-when-empty', action='store_true',
+                        help='stop once no job is left')
+    worker.add_argument('--profile', choices=AUDIT_PROFILE_NAMES,
+                        help='the audit profile of every job (default: full)')
+    worker.set_defaults(handler=worker_command)
+
+    probe = subparsers.add_parser('probe', help='check URLs with curl only')
+    probe.add_argument('urls', nargs='+', metavar='URL')
+    probe.add_argument('--samples', type=int, default=1,
+                       help='samples per URL, more than 1 reports percentiles')
+    probe.add_argument('--connect-timeout', type=float, default=10)
+    probe.add_argument('--timeout', type=float, default=30)
+    probe.add_argument('--max-body-bytes', type=int,
+                       help='stop reading the body after this many bytes')
+    probe.add_argument('--warm', action='store_true',
+                       help='probe again on the same connection, to show what '
+                            'keep-alive and TLS session reuse save')
+    probe.set_defaults(handler=probe_command)
+
+    report = subparsers.add_parser('report', help='print stored results')
+    report.add_argument('--database', help='the SQLite database')
+    report.add_argument('--url', help='print the history of this URL')
+    report.add_argument('--limit', type=int, default=50)
+    report.add_argument('--trend', metavar='METRIC',
+                        help='print the trend of this metric of --url, from '
+                             'the rollup tables')
+    report.add_argument('--granularity', choices=['hour', 'day', 'version'],
+                        default='day', help='the buckets of --trend')
+    report.add_argument('--environment', help='only this environment (--trend)')
+    report.add_argument('--profile', choices=AUDIT_PROFILE_NAMES,
+                        help='only this Lighthouse audit profile (--trend)')
+    report.set_defaults(handler=report_command)
+
+    resources = subparsers.add_parser(
+        'resources', help='print the heaviest or slowest resources of a page')
+    resources.add_argument('--database', help='the SQLite database')
+    resources.add_argument('--url', required=True, help='the page URL')
+    resources.add_argument('--by', choices=['size', 'duration'], default='size',
+                           help='rank by transfer size or duration (default: size)')
+    resources.add_argument('--limit', type=int, default=10,
+                           help='resources per evaluation (default: 10)')
+    resources.add_argument('--evaluations', type=int, default=20,
+                           help='the latest evaluations read (default: 20)')
+    resources.add_argument('--environment', help='only this environment')
+    resources.add_argument('--since', help='only evaluations from this ISO-8601 time')
+    resources.add_argument('--profile', choices=AUDIT_PROFILE_NAMES,
+                           help='only this Lighthouse audit profile')
+    resources.add_argument('--json', action='store_true',
+                           help='print one JSON object per resource')
+    resources.set_defaults(handler=resources_command)
+
+    rollup = subparsers.add_parser(
+        'rollup', help='roll up the rows not in the rollup tables yet')
+    rollup.add_argument('--database', help='the SQLite database')
+    rollup.add_argument('--rebuild', action='store_true',
+                        help='empty the rollup tables and roll up every row')
+    rollup.set_defaults(handler=rollup_command)
+
+    export = subparsers.add_parser(
+        'export', help='write the rows added since the last export to '
+                       'Parquet or Arrow files')
+    export.add_argument('--database', help='the SQLite database')
+    export.add_argument('--directory', help='the export directory (default: export)')
+    export.add_argument('--format', choices=['parquet', 'arrow'],
+                        help='the file format (default: parquet)')
+    export.add_argument('--chunk-size', type=int, default=50000,
+                        help='rows read at a time (default: 50000)')
+    export.add_argument('--compression', choices=['zstd', 'lz4', 'none'],
+                        default='zstd', help='the codec (default: zstd)')
+    export.set_defaults(handler=export_command)
+
+    regressions = subparsers.add_parser(
+        'regressions', help='find metrics that got worse in the stored history')
+    regressions.add_argument('--database', help='the SQLite database')
+    regressions.add_argument('--url', help='only analyse this URL')
+    regressions.add_argument('--environment', help='only analyse this environment')
+    regressions.add_argument('--since', help='only analyse rows from this ISO-8601 time')
+    regressions.add_argument('--profile', action='append',
+                             choices=AUDIT_PROFILE_NAMES,
+                             help='an audit profile to analyse, may be repeated '
+                                  '(default: full and perf)')
+    regressions.add_argument('--metric', action='append',
+                             help='a metric to analyse, may be repeated '
+                                  '(default: all)')
+    regressions.add_argument('--window', type=int, default=10,
+                             help='rows compared on each side of a change')
+    regressions.add_argument('--min-samples', type=int, default=3,
+                             help='rows needed on each side of a change')
+    regressions.add_argument('--threshold', action='append', default=[],
+                             metavar='METRIC=ABSOLUTE:RELATIVE',
+                             help='e.g. largest_contentful_paint=250:0.1')
+    regressions.add_argument('--json', action='store_true',
+                             help='print one JSON object per regression')
+    regressions.set_defaults(handler=regressions_command)
+
+    load_test = subparsers.add_parser('load-test',
+                                      help='load test every URL of the CSV')
+    load_test.add_argument('--csv', help='the URL CSV (default: CPS_url.csv)')
+    load_test.add_argument('--database', help='the SQLite database')
+    load_test.add_argument('--duration', type=float, help='seconds per URL')
+    load_test.add_argument('--concurrency', type=int,
+                           help='requests in flight')
+    load_test.add_argument('--rate', type=float,
+                           help='requests per second (open loop)')
+    load_test.set_defaults(handler=load_test_command)
+
+    benchmark = subparsers.add_parser(
+        'benchmark', help='measure the pipeline offline, with a stub server '
+                          'and a fake Lighthouse')
+    benchmark.add_argument('--urls', type=int, default=200,
+                           help='URLs evaluated (default: 200)')
+    benchmark.add_argument('--io-workers', type=int, default=8,
+                           help='URLs evaluated at the same time (default: 8)')
+    benchmark.add_argument('--lighthouse-workers', type=int, default=2,
+                           help='audits run at the same time (default: 2)')
+    benchmark.add_argument('--latency', type=float, default=0.05,
+                           help='seconds the stub server delays each response '
+                                '(default: 0.05)')
+    benchmark.add_argument('--jitter', type=float, default=0.0,
+                           help='the most seconds added to the latency at random')
+    benchmark.add_argument('--failure-rate', type=float, default=0.0,
+                           help='the fraction of URLs answering 503')
+    benchmark.add_argument('--lighthouse-delay', type=float, default=0.5,
+                           help='seconds each fake audit takes (default: 0.5)')
+    benchmark.add_argument('--lighthouse-fail-rate', type=float, default=0.0,
+                           help='the fraction of fake audits that fail')
+    benchmark.add_argument('--report-bytes', type=int, default=500000,
+                           help='the size of each fake report (default: 500000)')
+    benchmark.add_argument('--stream', action='store_true',
+                           help='read the reports from the Lighthouse output')
+    benchmark.add_argument('--cold-only', action='store_true',
+                           help='probe each URL once, without the warm probe')
+    benchmark.add_argument('--trace-memory', action='store_true',
+                           help='also measure the peak Python allocations '
+                                '(slower)')
+    benchmark.add_argument('--seed', type=int, default=0,
+                           help='seeds the failing URLs and the jitter')
+    benchmark.add_argument('--repeat', type=int, default=1,
+                           help='the number of runs (default: 1)')
+    benchmark.add_argument('--output',
+                           help='the JSON Lines file the results are appended '
+                                'to (default: benchmark_results.jsonl)')
+    benchmark.add_argument('--json', action='store_true',
+                           help='print the results as JSON')
+    benchmark.set_defaults(handler=benchmark_command)
+
+    return parser
+
+
+def main(argv=None):
+    """
+    The entry point of the `perf-test` command.
+
+    Args:
+        argv (list or None): The arguments, sys.argv[1:] if None.
+
+    Returns:
+        int: The exit code.
+    """
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 current_directory = Path.cwd()
@@ -6,3 +7,93 @@ CSV_DRIVER = current_directory / 'CPS_url.csv'
 DATABASE = current_directory / 'lighthouse_cps.db'
 LIGHTHOUSE_AUDIT = current_directory / 'lighthouse_audits'
 LOG_FILE = 'performance_data_errors.log'
+ARCHIVE_DATABASE = current_directory / 'lighthouse_reports.db'
+
+# pipeline concurrency (overridable from the environment / .env)
+IO_WORKERS = int(os.environ.get('IO_WORKERS', 8))
+LIGHTHOUSE_WORKERS = int(os.environ.get('LIGHTHOUSE_WORKERS', 2))
+
+# keep long-lived Chrome instances for Lighthouse (1) or cold-start (0)
+CHROME_POOL = os.environ.get('CHROME_POOL', '0') == '1'
+CHROME_MAX_AUDITS = int(os.environ.get('CHROME_MAX_AUDITS', 50))
+
+# up-check/curl probe limits, in seconds; PROBE_MAX_BODY_BYTES unset reads the
+# whole body
+CONNECT_TIMEOUT = float(os.environ.get('CONNECT_TIMEOUT', 10))
+REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', 30))
+PROBE_MAX_BODY_BYTES = int(os.environ['PROBE_MAX_BODY_BYTES']) \
+    if os.environ.get('PROBE_MAX_BODY_BYTES') else None
+
+# probe every URL a second time on the same connection (1) to measure what
+# keep-alive and TLS session reuse save, or only once (0)
+PROBE_WARM = os.environ.get('PROBE_WARM', '1') == '1'
+
+# seconds an environment's version.txt lookup is reused within a run
+VERSION_CACHE_TTL = float(os.environ.get('VERSION_CACHE_TTL', 300))
+
+# rows written per SQLite transaction, and the longest a row waits (seconds)
+DB_BATCH_SIZE = int(os.environ.get('DB_BATCH_SIZE', 50))
+DB_FLUSH_INTERVAL = float(os.environ.get('DB_FLUSH_INTERVAL', 5))
+
+# read Lighthouse reports from stdout (1) instead of writing them to files (0)
+LIGHTHOUSE_STREAM = os.environ.get('LIGHTHOUSE_STREAM', '0') == '1'
+
+# keep compressed full reports (1) and cap the archive size in megabytes
+ARCHIVE_REPORTS = os.environ.get('ARCHIVE_REPORTS', '0') == '1'
+ARCHIVE_MAX_MB = int(os.environ.get('ARCHIVE_MAX_MB', 2048))
+
+# the Lighthouse audit profile of URLs whose CSV row has no 'Profile': 'full',
+# 'perf' (performance category only) or 'mobile', see lighthouse.profiles
+LIGHTHOUSE_PROFILE = os.environ.get('LIGHTHOUSE_PROFILE', 'full')
+
+# adaptive Lighthouse sampling, enabled when LIGHTHOUSE_MAX_RUNS is above 1
+LIGHTHOUSE_MIN_RUNS = int(os.environ.get('LIGHTHOUSE_MIN_RUNS', 3))
+LIGHTHOUSE_MAX_RUNS = int(os.environ.get('LIGHTHOUSE_MAX_RUNS', 1))
+LIGHTHOUSE_PRECISION = float(os.environ.get('LIGHTHOUSE_PRECISION', 0.05))
+
+# log lines kept in memory per URL for the 'error_log' column
+TASK_LOG_MAX_RECORDS = int(os.environ.get('TASK_LOG_MAX_RECORDS', 1000))
+
+# the OpenMetrics file the stage timings are exported to, e.g.
+# /var/lib/node_exporter/textfile/perf_test.prom (unset: not exported), and
+# the minimum seconds between two writes during a run
+METRICS_FILE = os.environ.get('METRICS_FILE') or None
+METRICS_INTERVAL = float(os.environ.get('METRICS_INTERVAL', 15))
+
+# load test mode: seconds per URL, requests in flight, and requests per second
+# (LOAD_TEST_RATE unset or 0 keeps `LOAD_TEST_CONCURRENCY` requests in flight)
+LOAD_TEST_DURATION = float(os.environ.get('LOAD_TEST_DURATION', 30))
+LOAD_TEST_CONCURRENCY = int(os.environ.get('LOAD_TEST_CONCURRENCY', 10))
+LOAD_TEST_RATE = float(os.environ.get('LOAD_TEST_RATE', 0)) or None
+
+# this worker's share of the CSV (worker SHARD_INDEX of SHARD_COUNT) and how
+# repeated URLs are handled: 'none', 'first' or 'url_description'
+SHARD_INDEX = int(os.environ.get('SHARD_INDEX', 0))
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 1))
+DEDUPE_POLICY = os.environ.get('DEDUPE_POLICY', 'first')
+
+# scheduler mode: seconds between evaluations of URLs without an 'Interval'
+# column, the random fraction of the interval each run is moved by, and the
+# URLs evaluated at the same time (SCHEDULE_MAX_IN_FLIGHT unset uses
+# IO_WORKERS)
+SCHEDULE_DEFAULT_INTERVAL = float(os.environ.get('SCHEDULE_DEFAULT_INTERVAL', 86400))
+SCHEDULE_JITTER = float(os.environ.get('SCHEDULE_JITTER', 0.1))
+SCHEDULE_MAX_IN_FLIGHT = int(os.environ.get('SCHEDULE_MAX_IN_FLIGHT', 0)) or None
+
+# coordinator/worker mode: the shared job queue, how long a claimed job's
+# lease lasts without a heartbeat (seconds), the attempts per job, and the
+# seconds an idle worker waits before it looks for new jobs
+JOB_QUEUE_DATABASE = os.environ.get('JOB_QUEUE_DATABASE',
+                                    current_directory / 'job_queue.db')
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 600))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 5))
+
+# where 'perf-test benchmark' appends its results, one JSON document per run
+BENCHMARK_RESULTS = os.environ.get('BENCHMARK_RESULTS',
+                                   current_directory / 'benchmark_results.jsonl')
+
+# where 'perf-test export' writes the Parquet (or Arrow IPC) history, and
+# its format: 'parquet' or 'arrow'
+EXPORT_DIRECTORY = os.environ.get('EXPORT_DIRECTORY', current_directory / 'export')
+EXPORT_FORMAT = os.environ.get('EXPORT_FORMAT', 'parquet')
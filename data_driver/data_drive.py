@@ -1,4 +1,96 @@
-import pandas as pd
+import csv
+import io
+import logging
+import re
+import zlib
+from typing import NamedTuple, Optional
+
+from lighthouse.profiles import AUDIT_PROFILES
+
+logger = logging.getLogger(__name__)
+
+# how repeated URLs in the CSV are handled by DataDrive.iter_records; rows
+# with different 'Profile' cells are never duplicates
+DEDUPE_POLICIES = (
+    'none',             # yield every row
+    'first',            # yield only the first row of each URL
+    'url_description',  # yield only the first row of each (URL, description)
+)
+
+# units accepted by the optional 'Interval' column, e.g. '15m', '6h', '1d'
+INTERVAL_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+INTERVAL_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*$', re.IGNORECASE)
+
+
+def parse_interval(value):
+    """
+    Parses an 'Interval' cell of the CSV.
+
+    Parameters:
+    - value (str): Seconds ('900') or a number with a unit ('15m', '6h', '1d').
+
+    Returns:
+    - float or None: The interval in seconds, None for an empty cell.
+
+    """
+    if value is None or not value.strip():
+        return None
+
+    match = INTERVAL_PATTERN.match(value)
+    if match is None or float(match.group(1)) <= 0:
+        raise ValueError(f'Invalid interval: {value}')
+
+    return float(match.group(1)) * INTERVAL_UNITS[match.group(2).lower()]
+
+
+def parse_profile(value):
+    """
+    Parses a 'Profile' cell of the CSV.
+
+    Parameters:
+    - value (str): An audit profile, e.g. 'perf', see
+      lighthouse.profiles.AUDIT_PROFILES.
+
+    Returns:
+    - str or None: The profile, None for an empty cell.
+
+    """
+    if value is None or not value.strip():
+        return None
+
+    profile = value.strip().lower()
+    if profile not in AUDIT_PROFILES:
+        raise ValueError(f'Unknown audit profile: {value}')
+
+    return profile
+
+
+class UrlRecord(NamedTuple):
+    """
+    One row of the URL CSV.
+
+    'profile' is None when the 'Profile' cell is empty (or missing), the
+    default audit profile is then used.
+    """
+    url: str
+    description: str
+    profile: Optional[str] = None
+
+
+class ScheduledRecord(NamedTuple):
+    """
+    One row of the URL CSV with its optional scheduling columns.
+
+    'interval' is in seconds and None when the 'Interval' cell is empty;
+    'priority' is 0 when the 'Priority' cell is empty, higher runs first;
+    'profile' is None when the 'Profile' cell is empty.
+    """
+    url: str
+    description: str
+    interval: Optional[float]
+    priority: int
+    profile: Optional[str] = None
 
 
 class DataDrive:
@@ -16,13 +108,119 @@ class DataDrive:
         """
         Reads the CSV file and returns a dictionary of URLs and their corresponding descriptions.
 
+        A URL listed more than once keeps its first position and its last
+        description. Prefer iter_records for large files.
+
         Returns:
         - data_drive_dict (dict): A dictionary mapping URLs to descriptions.
 
         """
-        data_driver_urls = pd.read_csv(self.csv_source)
+        data_drive_dict = {}
 
-        data_drive_dict = {row['URL']: row['Description'] for _, row in
-                           data_driver_urls.iterrows()}
+        for record in self.iter_records(dedupe='none'):
+            data_drive_dict[record.url] = record.description
 
         return data_drive_dict
+
+    def iter_records(self, shard_index=0, shard_count=1, dedupe='first'):
+        """
+        Lazily reads the CSV file, one row at a time.
+
+        Parameters:
+        - shard_index (int): The shard to read, from 0 to shard_count - 1.
+        - shard_count (int): The number of shards the URLs are split into.
+          A URL always falls into the same shard, so n workers reading
+          shards 0..n-1 cover every URL exactly once.
+        - dedupe (str): One of DEDUPE_POLICIES.
+
+        Yields:
+        - UrlRecord: The URL, description and audit profile of each
+          selected row. A row with an unknown profile is skipped.
+
+        """
+        for line_number, row, url, description in self._iter_rows(
+                shard_index, shard_count, dedupe):
+            try:
+                profile = parse_profile(row.get('Profile'))
+            except ValueError as e:
+                logger.warning(f'Skipping CSV line {line_number}: {e}')
+                continue
+
+            yield UrlRecord(url, description, profile)
+
+    def iter_schedule(self, shard_index=0, shard_count=1, dedupe='first'):
+        """
+        Lazily reads the CSV file with its optional 'Interval', 'Priority'
+        and 'Profile' columns, see iter_records for the parameters.
+
+        A URL may be listed once per profile, e.g. a cheap 'perf' audit
+        every 15 minutes and a 'full' audit once a day.
+
+        Yields:
+        - ScheduledRecord: The URL, description, interval, priority and
+          audit profile of each selected row. A row with an invalid
+          interval, priority or profile is skipped.
+
+        """
+        for line_number, row, url, description in self._iter_rows(
+                shard_index, shard_count, dedupe):
+            try:
+                interval = parse_interval(row.get('Interval'))
+                priority = int((row.get('Priority') or '0').strip() or 0)
+                profile = parse_profile(row.get('Profile'))
+            except ValueError as e:
+                logger.warning(f'Skipping CSV line {line_number}: {e}')
+                continue
+
+            yield ScheduledRecord(url, description, interval, priority, profile)
+
+    def _iter_rows(self, shard_index, shard_count, dedupe):
+        """
+        Yields (line number, row, URL, description) of every row selected by
+        the shard and dedupe policy.
+        """
+        if dedupe not in DEDUPE_POLICIES:
+            raise ValueError(f'Unknown dedupe policy: {dedupe}')
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f'Invalid shard {shard_index} of {shard_count}')
+
+        seen = set()
+
+        with self._open() as csv_file:
+            for line_number, row in enumerate(csv.DictReader(csv_file), start=2):
+                url = (row.get('URL') or '').strip()
+                if not url:
+                    logger.warning(f'Skipping CSV line {line_number}: no URL')
+                    continue
+
+                if shard_count > 1 and \
+                        zlib.crc32(url.encode('utf-8')) % shard_count != shard_index:
+                    continue
+
+                description = (row.get('Description') or '').strip()
+
+                if dedupe != 'none':
+                    # the same URL may be listed once per audit profile
+                    profile = (row.get('Profile') or '').strip().lower()
+                    key = (url, profile) if dedupe == 'first' \
+                        else (url, description, profile)
+                    if key in seen:
+                        logger.info(f'Skipping duplicate CSV line {line_number}: {url}')
+                        continue
+                    seen.add(key)
+
+                yield line_number, row, url, description
+
+    def _open(self):
+        """
+        Opens the CSV source, a local path or an http(s) URL, as text.
+        """
+        source = str(self.csv_source)
+
+        if source.startswith(('http://', 'https://')):
+            import urllib.request  # only needed for remote sources
+
+            return io.TextIOWrapper(urllib.request.urlopen(source),
+                                    encoding='utf-8-sig', newline='')
+
+        return open(source, encoding='utf-8-sig', newline='')
@@ -0,0 +1,3 @@
+# used to automatically import the modules (classes) of the package
+import distributed.coordinator
+import distributed.worker
@@ -0,0 +1,63 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Coordinator:
+    """
+    Fills the job queue that QueueWorker processes consume, and follows
+    their progress.
+    """
+
+    def __init__(self, job_queue):
+        """
+        Initialize the Coordinator.
+
+        Args:
+            job_queue (JobQueue): The shared job queue.
+        """
+        self.job_queue = job_queue
+
+    def enqueue(self, records, max_attempts=3):
+        """
+        Queue a job per URL; URLs already queued or running are skipped, so
+        a coordinator can run again (e.g. from cron) without piling up jobs.
+
+        Args:
+            records (iterable): (url, description) pairs, or the records of
+            DataDrive.iter_schedule to use the 'Priority' and 'Profile'
+            columns.
+            max_attempts (int): The number of times a job is tried.
+
+        Returns:
+            int: The number of jobs added.
+        """
+        return self.job_queue.enqueue(records, max_attempts=max_attempts)
+
+    def wait(self, poll_interval=10, progress=None):
+        """
+        Wait until no job is queued or running.
+
+        Args:
+            poll_interval (float): Seconds between two looks at the queue.
+            progress (callable or None): Called with the counts per status
+            whenever they change.
+
+        Returns:
+            dict: The final number of jobs in each status.
+        """
+        previous = None
+
+        while True:
+            counts = self.job_queue.counts()
+            if counts != previous:
+                logger.info(f'Job queue: {counts}')
+                if progress is not None:
+                    progress(counts)
+                previous = counts
+
+            if not counts.get('queued') and not counts.get('leased'):
+                return counts
+
+            time.sleep(poll_interval)
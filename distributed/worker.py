@@ -0,0 +1,153 @@
+import logging
+import os
+import socket
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class QueueWorker:
+    """
+    Evaluates the URL jobs of a shared JobQueue with a PipelineExecutor.
+
+    The worker claims as many jobs as it has free slots, renews their
+    leases from a heartbeat thread while they run, and marks each one done
+    or failed when its evaluation finished. The results themselves are
+    stored by the executor, as in a single-process run. A job is failed
+    (and retried while it has attempts left) when its evaluation raised or
+    stored an error log.
+    """
+
+    def __init__(self, job_queue, executor, name=None, max_in_flight=None,
+                 poll_interval=5, heartbeat_interval=None, exit_when_empty=False):
+        """
+        Initialize the QueueWorker.
+
+        Args:
+            job_queue (JobQueue): The shared job queue.
+            executor (PipelineExecutor): Evaluates and stores the URLs.
+            name (str or None): The lease owner name, host and process id if
+            None; it must be unique among the workers.
+            max_in_flight (int or None): The number of jobs held at the same
+            time, the executor's number of I/O workers if None.
+            poll_interval (float): Seconds between two claims while the
+            queue is empty or every slot is busy.
+            heartbeat_interval (float or None): Seconds between two lease
+            renewals, a third of the lease if None.
+            exit_when_empty (bool): Return once the queue has no job left to
+            claim and every claimed one finished, instead of waiting for
+            new jobs.
+        """
+        self.job_queue = job_queue
+        self.executor = executor
+        self.name = name or f'{socket.gethostname()}-{os.getpid()}'
+        self.max_in_flight = max(1, max_in_flight or executor.io_workers)
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval or job_queue.lease_seconds / 3
+        self.exit_when_empty = exit_when_empty
+        self._running = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        # set only once every claimed job finished, so their leases are
+        # renewed while run() waits for them after stop()
+        self._heartbeat_stopped = threading.Event()
+        self.completed = 0
+        self.failed = 0
+
+    def stop(self):
+        """
+        Stop claiming jobs; run() returns once the claimed ones finish.
+        """
+        self._stopped.set()
+        self._wake.set()
+
+    def run(self):
+        """
+        Claim and evaluate jobs until stop() is called (or the queue is
+        empty, with exit_when_empty).
+        """
+        heartbeat = threading.Thread(target=self._heartbeat, name='job-heartbeat',
+                                     daemon=True)
+        logger.info(f'Worker {self.name} started')
+        heartbeat.start()
+
+        try:
+            with self.executor:
+                while not self._stopped.is_set():
+                    self._wake.clear()
+                    free = self.max_in_flight - self.executor.in_flight
+                    jobs = self.job_queue.claim(self.name, free) if free > 0 else []
+
+                    for job in jobs:
+                        self._submit(job)
+
+                    if not jobs and self.exit_when_empty and free >= self.max_in_flight:
+                        break
+
+                    if len(jobs) < free or free <= 0:
+                        # woken early when a job finishes and frees a slot
+                        self._wake.wait(self.poll_interval)
+        finally:
+            # leaving the executor waited for the jobs in flight
+            self._heartbeat_stopped.set()
+            heartbeat.join()
+
+        logger.info(f'Worker {self.name} stopped: {self.completed} jobs done, '
+                    f'{self.failed} failed')
+
+    def _submit(self, job):
+        with self._lock:
+            self._running[job.id] = job
+
+        try:
+            future = self.executor.submit(job.url, job.description, job.profile)
+        except Exception as e:
+            logger.exception(f'Could not submit job {job.id} ({job.url}): {e}')
+            self._finish(job, None)
+            return
+
+        future.add_done_callback(lambda done: self._done(job, done))
+
+    def _done(self, job, future):
+        error = future.exception()
+        if error is not None:
+            # e.g. the result could not be stored; fail the job and release
+            # its lease rather than renewing it forever
+            logger.error(f'Job {job.id} ({job.url}) raised: {error!r}')
+            self._finish(job, None)
+            return
+
+        self._finish(job, future.result())
+
+    def _finish(self, job, url_data):
+        with self._lock:
+            self._running.pop(job.id, None)
+
+        if url_data is None:
+            error = 'unexpected error, see the log'
+        else:
+            error = url_data.get('error_log')
+
+        if error:
+            reported = self.job_queue.fail(self.name, job.id, error[-2000:])
+            with self._lock:
+                self.failed += 1
+        else:
+            reported = self.job_queue.complete(self.name, job.id)
+            with self._lock:
+                self.completed += 1
+
+        if not reported:
+            logger.warning(f'Job {job.id} ({job.url}) finished after its lease '
+                           f'was lost, the result is stored but not reported')
+        self._wake.set()
+
+    def _heartbeat(self):
+        while not self._heartbeat_stopped.wait(self.heartbeat_interval):
+            with self._lock:
+                job_ids = list(self._running)
+            try:
+                self.job_queue.heartbeat(self.name, job_ids)
+            except Exception as e:
+                logger.error(f'Heartbeat of worker {self.name} failed: {e}')
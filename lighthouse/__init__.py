@@ -1,2 +1,5 @@
 # used to automatically import the modules (classes) of the package
+import lighthouse.profiles
 import lighthouse.lighthouse_metrics
+import lighthouse.chrome_pool
+import lighthouse.sampling
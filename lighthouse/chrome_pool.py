@@ -0,0 +1,205 @@
+import logging
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CHROME_CANDIDATES = ['google-chrome', 'google-chrome-stable', 'chromium',
+                     'chromium-browser', 'chrome']
+
+
+def find_chrome():
+    """
+    Find the Chrome executable, preferring the CHROME_PATH environment
+    variable that the Lighthouse CLI itself honours.
+
+    Returns:
+        str or None: The path of the Chrome executable, or None if not found.
+    """
+    chrome_path = os.environ.get('CHROME_PATH')
+    if chrome_path:
+        return chrome_path
+
+    for candidate in CHROME_CANDIDATES:
+        found = shutil.which(candidate)
+        if found:
+            return found
+
+    return None
+
+
+class ChromeInstance:
+    """
+    A long-lived headless Chrome that Lighthouse can attach to with --port.
+    """
+
+    def __init__(self, chrome_path, startup_timeout=15):
+        """
+        Initialize the ChromeInstance.
+
+        Args:
+            chrome_path (str): The path of the Chrome executable.
+            startup_timeout (float): Seconds to wait for the DevTools endpoint.
+        """
+        self.chrome_path = chrome_path
+        self.startup_timeout = startup_timeout
+        self.port = None
+        self.audits = 0
+        self.crashed = False
+        self._process = None
+        self._profile_dir = None
+
+    def start(self):
+        """
+        Launch Chrome and wait until its DevTools endpoint answers.
+
+        Raises:
+            RuntimeError: If Chrome does not come up in time.
+        """
+        self.port = self._free_port()
+        self._profile_dir = tempfile.mkdtemp(prefix='lighthouse-chrome-')
+        self.audits = 0
+        self.crashed = False
+
+        command = [
+            self.chrome_path,
+            '--headless',
+            f'--remote-debugging-port={self.port}',
+            f'--user-data-dir={self._profile_dir}',
+            '--no-first-run',
+            '--no-default-browser-check',
+            '--disable-extensions',
+            'about:blank'
+        ]
+
+        import urllib.request  # only needed while a browser starts
+
+        self._process = subprocess.Popen(command, stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.DEVNULL)
+
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                break
+            try:
+                with urllib.request.urlopen(
+                        f'http://127.0.0.1:{self.port}/json/version', timeout=1):
+                    logger.info(f'Started Chrome on port {self.port}')
+                    return
+            except OSError:
+                time.sleep(0.1)
+
+        self.stop()
+        raise RuntimeError(f'Chrome did not start on port {self.port}')
+
+    def stop(self):
+        """
+        Terminate Chrome and remove its temporary profile.
+        """
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+            self._process = None
+
+        if self._profile_dir is not None:
+            shutil.rmtree(self._profile_dir, ignore_errors=True)
+            self._profile_dir = None
+
+    def is_alive(self):
+        """
+        Returns:
+            bool: True if the Chrome process is still running.
+        """
+        return self._process is not None and self._process.poll() is None
+
+    @staticmethod
+    def _free_port():
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+
+class ChromePool:
+    """
+    A pool of long-lived headless Chrome instances shared by Lighthouse runs.
+
+    A browser is recycled (restarted) after `max_audits` audits, or as soon as
+    it has crashed or an audit using it has failed.
+    """
+
+    def __init__(self, size, max_audits=50, chrome_path=None):
+        """
+        Initialize the ChromePool.
+
+        Args:
+            size (int): The number of Chrome instances.
+            max_audits (int): The number of audits after which a browser is
+            restarted.
+            chrome_path (str or None): The path of the Chrome executable,
+            detected if omitted.
+        """
+        self.size = max(1, size)
+        self.max_audits = max(1, max_audits)
+        self.chrome_path = chrome_path or find_chrome()
+        self._idle = queue.Queue()
+        self._instances = []
+
+        if self.chrome_path is None:
+            raise RuntimeError('Chrome executable not found, set CHROME_PATH')
+
+        for _ in range(self.size):
+            instance = ChromeInstance(self.chrome_path)
+            self._instances.append(instance)
+            self._idle.put(instance)
+
+    def __enter__(self) -> 'ChromePool':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @contextmanager
+    def browser(self):
+        """
+        Check out a running browser for the duration of one audit.
+
+        Yields:
+            ChromeInstance: A running browser; set `crashed` on it to have it
+            restarted before its next use.
+        """
+        instance = self._idle.get()
+
+        try:
+            if instance.crashed or instance.audits >= self.max_audits \
+                    or not instance.is_alive():
+                self._recycle(instance)
+
+            yield instance
+            instance.audits += 1
+        finally:
+            self._idle.put(instance)
+
+    def close(self):
+        """
+        Stop every browser in the pool.
+        """
+        for instance in self._instances:
+            instance.stop()
+
+    @staticmethod
+    def _recycle(instance):
+        if instance.is_alive():
+            logger.info(f'Recycling Chrome on port {instance.port} after '
+                        f'{instance.audits} audits')
+        instance.stop()
+        instance.start()
@@ -1,13 +1,198 @@
+import io
 import json
 import logging
 import os
 import subprocess
-from dotenv import load_dotenv
-from pathlib import Path
+import threading
+import time
 
-#  constants (includes from .env)
-env_path = Path('.env')
-load_dotenv(dotenv_path=env_path)
+from lighthouse.profiles import DEFAULT_PROFILE, profile_options
+from metrics.stage_timer import timed
+
+try:
+    import ijson
+except ImportError:  # optional, reports are then parsed with the json module
+    ijson = None
+
+# report categories and the 'lighthouse_metrics' keys of their scores
+CATEGORY_SCORES = {
+    'seo': 'seo_score',
+    'accessibility': 'accessibility_score',
+    'performance': 'performance_score',
+    'best-practices': 'best_practices_score',
+}
+
+# fields of the first 'audits.metrics' item and their 'lighthouse_metrics' keys
+METRIC_ITEMS = {
+    'firstContentfulPaint': 'first_contentful_paint',
+    'speedIndex': 'speed_index',
+    'largestContentfulPaint': 'largest_contentful_paint',
+    'cumulativeLayoutShift': 'cumulative_layout_shift',
+    'totalBlockingTime': 'total_blocking_time',
+    'interactive': 'time_to_interactive',
+}
+
+# fields of each 'network-requests' item and their keys; Lighthouse 10
+# renamed startTime/endTime to networkRequestTime/networkEndTime
+NETWORK_REQUEST_FIELDS = {
+    'url': 'url',
+    'resourceType': 'resource_type',
+    'mimeType': 'mime_type',
+    'statusCode': 'status_code',
+    'protocol': 'protocol',
+    'transferSize': 'transfer_size',
+    'resourceSize': 'resource_size',
+    'startTime': 'start_time',
+    'endTime': 'end_time',
+    'networkRequestTime': 'start_time',
+    'networkEndTime': 'end_time',
+}
+
+# fields of each 'resource-summary' item and their keys
+RESOURCE_SUMMARY_FIELDS = {
+    'resourceType': 'resource_type',
+    'requestCount': 'request_count',
+    'transferSize': 'transfer_size',
+}
+
+# the resource audits: (audit id, metrics key, fields)
+RESOURCE_AUDITS = (
+    ('network-requests', 'network_requests', NETWORK_REQUEST_FIELDS),
+    ('resource-summary', 'resource_summary', RESOURCE_SUMMARY_FIELDS),
+)
+
+REPORT_ERRORS = (ValueError, KeyError, IndexError, TypeError) + \
+    ((ijson.JSONError,) if ijson is not None else ())
+
+
+def format_audit_metrics(scores, items):
+    """
+    Builds the audit metrics dictionary from raw report values.
+
+    Args:
+        scores (dict): Category id mapped to its score (0 to 1).
+        items (dict): The fields of the first 'audits.metrics' item.
+
+    Returns:
+        dict: The audit metrics, see LighthouseRunner.get_audit_metrics.
+        Values missing from the report are None.
+    """
+    lighthouse_metrics = {}
+
+    for category, key in CATEGORY_SCORES.items():
+        score = scores.get(category)
+        lighthouse_metrics[key] = None if score is None else str(round(score * 100))
+
+    for field, key in METRIC_ITEMS.items():
+        lighthouse_metrics[key] = items.get(field)
+
+    cls = lighthouse_metrics['cumulative_layout_shift']
+    if cls is not None:
+        lighthouse_metrics['cumulative_layout_shift'] = str(round(cls, 0))
+
+    return lighthouse_metrics
+
+
+def format_resource_items(items, fields):
+    """
+    Keeps the wanted fields of 'network-requests' or 'resource-summary'
+    items, under their keys.
+
+    Args:
+        items (list): The raw items of the audit.
+        fields (dict): Report field mapped to key, e.g. NETWORK_REQUEST_FIELDS.
+
+    Returns:
+        list: One dictionary per item; network requests also get a
+        'duration' (end_time - start_time, in milliseconds).
+    """
+    formatted = []
+
+    for item in items:
+        resource = {}
+        for field, key in fields.items():
+            value = item.get(field)
+            if value is not None or key not in resource:
+                resource[key] = value
+
+        if 'start_time' in resource:
+            start, end = resource.get('start_time'), resource.pop('end_time', None)
+            resource['duration'] = None if start is None or end is None else end - start
+
+        formatted.append(resource)
+
+    return formatted
+
+
+@timed('report_parse')
+def extract_audit_metrics(report_stream):
+    """
+    Extracts the audit metrics from a JSON report stream.
+
+    With ijson installed the report is parsed incrementally and only the
+    category scores, the 'audits.metrics' item and the fields of the
+    'network-requests' and 'resource-summary' items are kept, so the full
+    object tree of a multi-megabyte report is never built.
+
+    Args:
+        report_stream (file): A binary file object positioned at the start of
+        the report.
+
+    Returns:
+        dict: The audit metrics, see LighthouseRunner.get_audit_metrics, plus
+        'network_requests' and 'resource_summary' (see
+        format_resource_items).
+    """
+    if ijson is None:
+        loaded_json = json.load(report_stream)
+        audits = loaded_json["audits"]
+        lighthouse_metrics = format_audit_metrics(
+            {category: value.get('score')
+             for category, value in loaded_json.get('categories', {}).items()},
+            audits["metrics"]["details"]["items"][0])
+        for audit, key, fields in RESOURCE_AUDITS:
+            lighthouse_metrics[key] = format_resource_items(
+                (audits.get(audit) or {}).get('details', {}).get('items', []), fields)
+        return lighthouse_metrics
+
+    scores = {}
+    items = {}
+    item_prefix = 'audits.metrics.details.items.item.'
+    first_item = True
+
+    # the items of each resource audit, and the one being read
+    resource_prefixes = {f'audits.{audit}.details.items.item': (key, fields)
+                         for audit, key, fields in RESOURCE_AUDITS}
+    resources = {key: [] for _, key, _ in RESOURCE_AUDITS}
+    resource = None
+
+    for prefix, event, value in ijson.parse(report_stream, use_float=True):
+        if prefix.startswith('categories.') and prefix.endswith('.score') \
+                and prefix.count('.') == 2:
+            scores[prefix.split('.')[1]] = value
+        elif first_item and prefix.startswith(item_prefix):
+            items[prefix[len(item_prefix):]] = value
+        elif first_item and prefix == 'audits.metrics.details.items.item' \
+                and event == 'end_map':
+            first_item = False
+        elif prefix in resource_prefixes:
+            if event == 'start_map':
+                resource = {}
+            elif event == 'end_map' and resource is not None:
+                resources[resource_prefixes[prefix][0]].append(resource)
+                resource = None
+        elif resource is not None and event not in ('start_map', 'start_array'):
+            item, _, field = prefix.rpartition('.')
+            if item in resource_prefixes and field in resource_prefixes[item][1]:
+                resource[field] = value
+
+    if not items:
+        raise KeyError('audits.metrics')
+
+    lighthouse_metrics = format_audit_metrics(scores, items)
+    for _, key, fields in RESOURCE_AUDITS:
+        lighthouse_metrics[key] = format_resource_items(resources[key], fields)
+    return lighthouse_metrics
 
 
 class LighthouseRunner:
@@ -15,15 +200,26 @@ class LighthouseRunner:
     A class for running Lighthouse audits and saving the JSON output to files.
     """
 
-    def __init__(self, output_directory):
+    def __init__(self, output_directory, chrome_pool=None, profile=DEFAULT_PROFILE):
         """
         Initialize the LighthouseRunner instance.
 
         Args:
             output_directory (str): The directory where the JSON output files
             will be saved.
+            chrome_pool (ChromePool or None): If given, audits attach to one
+            of the pool's long-lived browsers instead of letting Lighthouse
+            start a fresh Chrome for every URL.
+            profile (str): The audit profile, one of
+            lighthouse.profiles.AUDIT_PROFILES.
+
+        Raises:
+            ValueError: If the profile is unknown.
         """
         self.output_directory = output_directory
+        self.chrome_pool = chrome_pool
+        self.profile = profile
+        self.profile_options = profile_options(profile)
 
     def run_lighthouse(self, url, filename):
         """
@@ -39,27 +235,135 @@ class LighthouseRunner:
         """
         output_path = os.path.join(self.output_directory, f"{filename}.json")
 
+        success, _ = self._audit(url, ["--output-path=" + output_path])
+        return success
+
+    def run_lighthouse_metrics(self, url, report_sink=None):
+        """
+        Run the Lighthouse audit and extract its metrics straight from the
+        subprocess output, without writing the report to disk.
+
+        Args:
+            url (str): The URL to run the Lighthouse audit on.
+            report_sink (callable or None): If given, the whole report is read
+            into memory and passed to it as bytes (e.g. to archive it) before
+            the metrics are extracted.
+
+        Returns:
+            dict or None: The audit metrics (see get_audit_metrics), or None
+            if an error was encountered.
+        """
+        read_report = extract_audit_metrics
+
+        if report_sink is not None:
+            def read_report(report_stream):
+                report = report_stream.read()
+                report_sink(report)
+                return extract_audit_metrics(io.BytesIO(report))
+
+        success, lighthouse_metrics = self._audit(url, [], read_report)
+        return lighthouse_metrics if success else None
+
+    def _audit(self, url, output_args, read_report=None):
+        """
+        Run the Lighthouse CLI, on a pooled browser if there is a pool.
+
+        Args:
+            url (str): The URL to run the Lighthouse audit on.
+            output_args (list): Extra output options for the command line.
+            read_report (callable or None): Called with the subprocess stdout
+            to read the report; None leaves stdout alone.
+
+        Returns:
+            tuple: (success, result of read_report or None)
+        """
         command = [
             os.environ.get('LIGHTHOUSE_CMD', 'lighthouse'),
             url,
             "--output=json",
-            "--output-path=" + output_path,
+            *output_args,
             "--no-enable-error-reporting",
             "--no-update-notifier",
-            "--chrome-flags=\"--headless\"",
             "--quiet",
-            "--preset",
-            "desktop"
+            *self.profile_options
         ]
 
+        if self.chrome_pool is None:
+            command.append("--chrome-flags=\"--headless\"")
+            return self._run_command(command, url, 'cold-start', read_report)
+
         try:
-            subprocess.run(command, check=True, capture_output=True, text=True)
-        except subprocess.CalledProcessError as e:
-            logging.error(f'Failed to run Lighthouse audit for URL: {url}\n'
-                          f'Error: {e.stderr}')
-            return False
+            with self.chrome_pool.browser() as chrome:
+                success, result = self._run_command(
+                    command + [f"--port={chrome.port}"], url, 'pooled',
+                    read_report)
+                if not success:
+                    # the browser may be in a bad state, start a fresh one
+                    chrome.crashed = True
+        except RuntimeError as e:
+            logging.error(f'No browser available for URL: {url}\nError: {e}')
+            return False, None
 
-        return True
+        return success, result
+
+    @staticmethod
+    @timed('lighthouse')
+    def _run_command(command, url, mode, read_report=None):
+        """
+        Run the Lighthouse CLI and log how long the audit took.
+
+        Args:
+            command (list): The Lighthouse command line.
+            url (str): The URL being audited.
+            mode (str): 'cold-start' or 'pooled', logged with the duration.
+            read_report (callable or None): Called with the subprocess stdout
+            while Lighthouse is running.
+
+        Returns:
+            tuple: (success, result of read_report or None)
+        """
+        started = time.perf_counter()
+        result = None
+
+        if read_report is None:
+            try:
+                subprocess.run(command, check=True, capture_output=True, text=True)
+            except subprocess.CalledProcessError as e:
+                logging.error(f'Failed to run Lighthouse audit for URL: {url}\n'
+                              f'Error: {e.stderr}')
+                return False, None
+        else:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+            # drain stderr on the side so a chatty Lighthouse cannot block
+            stderr = []
+            drain = threading.Thread(
+                target=lambda: stderr.append(process.stderr.read()), daemon=True)
+            drain.start()
+
+            try:
+                result = read_report(process.stdout)
+            except REPORT_ERRORS as e:
+                logging.error(f'Error reading the Lighthouse report for URL: '
+                              f'{url}\nError: {e}')
+            finally:
+                # discard whatever the reader did not need so Lighthouse exits
+                while process.stdout.read(65536):
+                    pass
+                process.wait()
+                drain.join()
+
+            if process.returncode != 0:
+                logging.error(f'Failed to run Lighthouse audit for URL: {url}\n'
+                              f"Error: {b''.join(stderr).decode(errors='replace')}")
+                return False, None
+
+            if result is None:
+                return False, None
+
+        logging.info(f'Lighthouse audit ({mode}) took '
+                     f'{time.perf_counter() - started:.2f}s for URL: {url}')
+        return True, result
 
     def audit_exists(self, filename):
         """
@@ -89,7 +393,8 @@ class LighthouseRunner:
             extension).
 
         Returns:
-            dict: A dictionary containing the audit metrics.
+            dict or None: A dictionary containing the audit metrics, or None
+            if the file could not be read.
                 - 'seo_score': The SEO score as a percentage.
                 - 'accessibility_score': The accessibility score as a
                 percentage.
@@ -111,37 +416,38 @@ class LighthouseRunner:
         file_path = os.path.join(self.output_directory, f"{filename}.json")
 
         try:
-            with open(file_path, encoding='utf-8') as json_file:
-                loaded_json = json.load(json_file)
+            with open(file_path, 'rb') as json_file:
+                return extract_audit_metrics(json_file)
         except FileNotFoundError as e:
             logging.error(f"File not found: '{file_path}' : {e} ")
-        except (KeyError, IndexError, TypeError) as e:
+        except REPORT_ERRORS as e:
             logging.error(f'Error occurred while accessing audit metrics: {e}')
         except Exception as e:
             logging.exception(f'An unexpected error occurred: {e}')
-
-        try:
-            lighthouse_metrics = {
-                'seo_score': str(round(loaded_json["categories"]["seo"]["score"] * 100)),
-                'accessibility_score': str(round(loaded_json["categories"]["accessibility"]["score"] * 100)),
-                'performance_score': str(round(loaded_json["categories"]["performance"]["score"] * 100)),
-                'best_practices_score': str(round(loaded_json["categories"]["best-practices"]["score"] * 100)),
-                'first_contentful_paint': loaded_json["audits"]["metrics"]["details"]["items"][0][
-                    "firstContentfulPaint"],
-                'speed_index': loaded_json["audits"]["metrics"]["details"]["items"][0]["speedIndex"],
-                'largest_contentful_paint': loaded_json["audits"]["metrics"]["details"]["items"][0][
-                    "largestContentfulPaint"],
-                'cumulative_layout_shift': str(
-                    round(loaded_json["audits"]["metrics"]["details"]["items"][0]["cumulativeLayoutShift"], 0)),
-                'total_blocking_time': loaded_json["audits"]["metrics"]["details"]["items"][0]["totalBlockingTime"],
-                'time_to_interactive': loaded_json["audits"]["metrics"]["details"]["items"][0]["interactive"]
-            }
-
-            return lighthouse_metrics
-
         finally:
             logging.info("Audit metrics retrieval completed.")
 
+        return None
+
+    def read_audit_report(self, filename):
+        """
+        Read the raw audit JSON file.
+
+        Args:
+            filename (str): The name of the audit file (without extension).
+
+        Returns:
+            bytes or None: The report, or None if it could not be read.
+        """
+        audit_json = os.path.join(self.output_directory, f"{filename}.json")
+
+        try:
+            with open(audit_json, 'rb') as json_file:
+                return json_file.read()
+        except OSError as e:
+            logging.error(f"Error reading the audit file '{audit_json}': {e}")
+            return None
+
     def delete_audit_file(self, filename):
         """
         Delete an audit file.
@@ -0,0 +1,32 @@
+# the Lighthouse command line options of each audit profile
+AUDIT_PROFILES = {
+    # every category with desktop emulation, what every audit ran before
+    # there were profiles
+    'full': ['--preset', 'desktop'],
+    # the performance category only, without the screenshots: the metrics,
+    # network requests and resource summary at a fraction of the audit time;
+    # the other scores are left empty
+    'perf': ['--preset', 'desktop', '--only-categories=performance',
+             '--skip-audits=screenshot-thumbnails,final-screenshot',
+             '--disable-full-page-screenshot'],
+    # every category with Lighthouse's mobile emulation and throttling; its
+    # metrics are not comparable with the desktop profiles
+    'mobile': ['--form-factor=mobile'],
+}
+
+# the profile of URLs that do not pick one
+DEFAULT_PROFILE = 'full'
+
+
+def profile_options(profile):
+    """
+    Args:
+        profile (str): One of AUDIT_PROFILES.
+
+    Returns:
+        list: The Lighthouse command line options of the profile.
+    """
+    try:
+        return list(AUDIT_PROFILES[profile])
+    except KeyError:
+        raise ValueError(f'Unknown audit profile: {profile}') from None
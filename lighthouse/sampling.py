@@ -0,0 +1,168 @@
+import logging
+import math
+import statistics
+
+logger = logging.getLogger(__name__)
+
+# the metrics whose confidence interval decides when to stop sampling, with
+# the absolute half-width that is always precise enough (so metrics close to
+# zero, like a small TBT, can converge too)
+KEY_METRICS = {
+    'performance_score': 2,
+    'largest_contentful_paint': 100,
+    'total_blocking_time': 25,
+}
+
+# metrics stored as rounded strings by format_audit_metrics
+SCORE_METRICS = ['seo_score', 'accessibility_score', 'performance_score',
+                 'best_practices_score']
+
+# two-sided 95% Student's t critical values by degrees of freedom
+T_CRITICAL_95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365,
+    8: 2.306, 9: 2.262, 10: 2.228, 11: 2.201, 12: 2.179, 13: 2.160,
+    14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093,
+    20: 2.086, 25: 2.060, 30: 2.042,
+}
+
+
+def t_critical(degrees_of_freedom):
+    """
+    Returns the two-sided 95% t critical value, falling back to the next
+    smaller tabulated degrees of freedom (which errs on the wide side) and to
+    the normal value beyond the table.
+    """
+    if degrees_of_freedom > 30:
+        return 1.96
+
+    tabulated = max(df for df in T_CRITICAL_95 if df <= degrees_of_freedom)
+    return T_CRITICAL_95[tabulated]
+
+
+class AdaptiveSampler:
+    """
+    Runs a Lighthouse audit repeatedly until the 95% confidence interval of
+    every key metric is tight enough, or the run budget is spent.
+
+    Stable URLs stop after `min_runs`; only noisy ones use up to `max_runs`.
+    """
+
+    def __init__(self, min_runs=3, max_runs=9, relative_precision=0.05,
+                 key_metrics=None):
+        """
+        Initialize the AdaptiveSampler.
+
+        Args:
+            min_runs (int): The number of successful runs always made.
+            max_runs (int): The maximum number of runs, failed ones included.
+            relative_precision (float): The accepted confidence interval
+            half-width, relative to the mean (0.05 is +/- 5%).
+            key_metrics (dict or None): Metric names mapped to an absolute
+            half-width that is always accepted; defaults to KEY_METRICS.
+        """
+        self.min_runs = max(2, min_runs)
+        self.max_runs = max(self.min_runs, max_runs)
+        self.relative_precision = relative_precision
+        self.key_metrics = KEY_METRICS if key_metrics is None else key_metrics
+
+    def sample(self, run_once):
+        """
+        Run the audit until it converges or the budget is spent.
+
+        Args:
+            run_once (callable): Runs one audit and returns its metrics
+            dictionary, or None if the audit failed.
+
+        Returns:
+            tuple: (metrics, spread, runs) where
+                - metrics (dict or None): The median of every metric, formatted
+                like a single run's metrics; None if no run succeeded.
+                - spread (dict): Metric name mapped to the 'min', 'max' and
+                'stdev' of its samples.
+                - runs (int): The number of successful runs.
+        """
+        samples = []
+
+        for attempt in range(1, self.max_runs + 1):
+            lighthouse_metrics = run_once()
+            if lighthouse_metrics is not None:
+                samples.append(lighthouse_metrics)
+
+            if len(samples) >= self.min_runs and self.converged(samples):
+                logger.info(f'Lighthouse metrics converged after {attempt} runs')
+                break
+        else:
+            logger.info(f'Lighthouse metrics did not converge within '
+                        f'{self.max_runs} runs')
+
+        if not samples:
+            return None, {}, 0
+
+        return self.summarize(samples) + (len(samples),)
+
+    def converged(self, samples):
+        """
+        Args:
+            samples (list): The metrics dictionaries of the successful runs.
+
+        Returns:
+            bool: True if the confidence interval of every key metric is
+            within the relative precision or its absolute tolerance.
+        """
+        for metric, absolute_precision in self.key_metrics.items():
+            values = self._values(samples, metric)
+            if len(values) < 2:
+                continue
+
+            mean = statistics.fmean(values)
+            half_width = t_critical(len(values) - 1) * \
+                statistics.stdev(values) / math.sqrt(len(values))
+
+            if half_width > max(self.relative_precision * abs(mean),
+                                absolute_precision):
+                return False
+
+        return True
+
+    def summarize(self, samples):
+        """
+        Args:
+            samples (list): The metrics dictionaries of the successful runs.
+
+        Returns:
+            tuple: (metrics, spread), see sample().
+        """
+        lighthouse_metrics = {}
+        spread = {}
+
+        for metric in samples[0]:
+            values = self._values(samples, metric)
+            if not values:
+                lighthouse_metrics[metric] = None
+                continue
+
+            median = statistics.median(values)
+
+            if metric in SCORE_METRICS:
+                lighthouse_metrics[metric] = str(round(median))
+            elif metric == 'cumulative_layout_shift':
+                lighthouse_metrics[metric] = str(round(median, 0))
+            else:
+                lighthouse_metrics[metric] = median
+
+            spread[metric] = {
+                'min': min(values),
+                'max': max(values),
+                'stdev': round(statistics.stdev(values), 3) if len(values) > 1 else 0.0,
+            }
+
+        return lighthouse_metrics, spread
+
+    @staticmethod
+    def _values(samples, metric):
+        values = []
+        for lighthouse_metrics in samples:
+            value = lighthouse_metrics.get(metric)
+            if value is not None:
+                values.append(float(value))
+        return values
@@ -0,0 +1,7 @@
+import sys
+
+#  the work is done by the `load-test` subcommand of the command line
+#  interface, see command_line/main.py (`perf-test load-test`)
+from command_line.main import main
+
+sys.exit(main(['load-test'] + sys.argv[1:]))
@@ -0,0 +1,199 @@
+import datetime
+import logging
+import time
+
+import pycurl
+
+from metrics.histogram import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+class LoadTestEngine:
+    """
+    Drives HTTP load against one URL at a time with pycurl.CurlMulti.
+
+    Two modes are supported:
+        - closed loop (rate is None): `concurrency` requests are always in
+        flight, each one started as soon as the previous one finished.
+        - open loop (rate set): requests are started at a fixed rate, with up
+        to `concurrency` in flight. Latency is measured from the moment a
+        request was due, not when it could actually be sent, so a server that
+        falls behind is not hidden by the load generator waiting for it
+        (coordinated omission).
+
+    Successful latencies are recorded in a LatencyHistogram.
+    """
+
+    def __init__(self, duration=30, concurrency=10, rate=None,
+                 connect_timeout=10, timeout=30):
+        """
+        Initialize the LoadTestEngine.
+
+        Args:
+            duration (float): Seconds of load per URL.
+            concurrency (int): The maximum number of requests in flight.
+            rate (float or None): Requests per second (open loop), None for
+            closed loop.
+            connect_timeout (float): The maximum time to connect, in seconds.
+            timeout (float): The maximum time for one request, in seconds.
+        """
+        self.duration = duration
+        self.concurrency = max(1, concurrency)
+        self.rate = rate if rate else None
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+
+    @property
+    def mode(self):
+        """
+        Returns:
+            str: 'rate' for open loop, 'concurrency' for closed loop.
+        """
+        return 'rate' if self.rate else 'concurrency'
+
+    def run(self, records):
+        """
+        Load test every URL in turn.
+
+        Args:
+            records (iterable): (url, description) pairs, or the records of
+            DataDrive.iter_records (the audit profile is ignored).
+
+        Yields:
+            dict: The result of each URL, see run_url.
+        """
+        for url, description, *_ in records:
+            result = self.run_url(url)
+            result['description'] = description
+            yield result
+
+    def run_url(self, url):
+        """
+        Load test one URL for `duration` seconds.
+
+        Args:
+            url (str): The URL.
+
+        Returns:
+            dict: The result with:
+                - 'url', 'timestamp' (ISO-8601 start time)
+                - 'requests' (int): Completed requests, failed ones included.
+                - 'errors' (int): Transport errors and status codes outside
+                200-399.
+                - 'throughput' (float): Successful requests per second.
+                - 'error_rate' (float): errors / requests.
+                - 'p50', 'p95', 'p99', 'p999', 'min', 'max', 'mean' (float):
+                Latencies of successful requests in milliseconds.
+                - 'histogram' (LatencyHistogram): All successful latencies.
+        """
+        histogram = LatencyHistogram()
+        requests = 0
+        errors = 0
+        timestamp = datetime.datetime.now().isoformat(timespec='seconds')
+
+        multi = pycurl.CurlMulti()
+        handles = [self._new_handle(url) for _ in range(self.concurrency)]
+        idle = list(handles)
+        active = 0
+
+        started = time.monotonic()
+        deadline = started + self.duration
+        interval = 1 / self.rate if self.rate else None
+        next_due = started
+
+        def finish(handle, ok):
+            nonlocal requests, errors, active
+            requests += 1
+            if ok and 200 <= handle.getinfo(pycurl.RESPONSE_CODE) < 400:
+                histogram.record((time.monotonic() - handle.due) * 1000)
+            else:
+                errors += 1
+            multi.remove_handle(handle)
+            idle.append(handle)
+            active -= 1
+
+        try:
+            while True:
+                now = time.monotonic()
+
+                while idle and now < deadline and (interval is None or next_due <= now):
+                    handle = idle.pop()
+                    # open loop measures from when the request was due
+                    handle.due = next_due if interval is not None else now
+                    multi.add_handle(handle)
+                    active += 1
+                    if interval is not None:
+                        next_due += interval
+                        if next_due >= deadline:
+                            break
+
+                if not active and (now >= deadline or
+                                   (interval is not None and next_due >= deadline)):
+                    break
+
+                while True:
+                    ret, _ = multi.perform()
+                    if ret != pycurl.E_CALL_MULTI_PERFORM:
+                        break
+
+                while True:
+                    queued, succeeded, failed = multi.info_read()
+                    for handle in succeeded:
+                        finish(handle, True)
+                    for handle, errno, message in failed:
+                        if not errors:
+                            # only the first one, a failing URL fails fast
+                            logger.warning(f'Request to {url} failed: '
+                                           f'({errno}) {message}')
+                        finish(handle, False)
+                    if queued == 0:
+                        break
+
+                wait = 0.1
+                if interval is not None:
+                    wait = min(wait, max(0.0, next_due - time.monotonic()))
+                if active:
+                    multi.select(wait)
+                elif interval is not None and wait > 0:
+                    # open loop and nothing in flight, wait for the next request
+                    time.sleep(wait)
+        finally:
+            for handle in handles:
+                handle.close()
+            multi.close()
+
+        elapsed = max(time.monotonic() - started, 1e-9)
+        successes = requests - errors
+
+        result = {
+            'url': url,
+            'timestamp': timestamp,
+            'requests': requests,
+            'errors': errors,
+            'throughput': round(successes / elapsed, 2),
+            'error_rate': round(errors / requests, 4) if requests else None,
+            'p50': histogram.percentile(50),
+            'p95': histogram.percentile(95),
+            'p99': histogram.percentile(99),
+            'p999': histogram.percentile(99.9),
+            'min': histogram.percentile(0),
+            'max': histogram.percentile(100),
+            'mean': histogram.mean(),
+            'histogram': histogram,
+        }
+
+        logger.info(f"Load test of {url}: {requests} requests, {errors} errors, "
+                    f"{result['throughput']} req/s, p99 {result['p99']} ms")
+        return result
+
+    def _new_handle(self, url):
+        handle = pycurl.Curl()
+        handle.setopt(pycurl.URL, url)
+        handle.setopt(pycurl.FOLLOWLOCATION, 1)
+        handle.setopt(pycurl.NOSIGNAL, 1)
+        handle.setopt(pycurl.CONNECTTIMEOUT_MS, int(self.connect_timeout * 1000))
+        handle.setopt(pycurl.TIMEOUT_MS, int(self.timeout * 1000))
+        handle.setopt(pycurl.WRITEFUNCTION, lambda data: None)
+        handle.due = None
+        return handle
@@ -1,2 +1,5 @@
 # used to automatically import the modules (classes) of the package
 import metrics.curl_metrics
+import metrics.curl_batch
+import metrics.histogram
+import metrics.stage_timer
@@ -0,0 +1,185 @@
+import logging
+import math
+import statistics
+from collections import deque
+
+import pycurl
+
+#  import packages (modules/classes)
+#  the timing phases reported for each URL, as in CurlMetrics.calculate_ttfb
+from metrics.curl_metrics import TIMING_PHASES
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values, q):
+    """
+    Calculate a percentile with the nearest-rank method.
+
+    Args:
+        values (list): The sample values, in any order.
+        q (float): The percentile, between 0 and 100.
+
+    Returns:
+        float or None: The percentile, or None if there are no values.
+    """
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    """
+    Summarize timing samples.
+
+    Args:
+        values (list): The samples in milliseconds.
+
+    Returns:
+        dict: 'min', 'median', 'p90' and 'p99' of the samples (None if there
+        are no samples).
+    """
+    if not values:
+        return {'min': None, 'median': None, 'p90': None, 'p99': None}
+
+    return {
+        'min': min(values),
+        'median': statistics.median(values),
+        'p90': percentile(values, 90),
+        'p99': percentile(values, 99),
+    }
+
+
+class CurlBatchMetrics:
+    """
+    Probes many URLs in parallel with pycurl.CurlMulti, taking several timing
+    samples per URL.
+
+    Curl handles are reused from sample to sample and share one DNS cache, but
+    every sample opens a fresh connection so that connect times stay
+    comparable with CurlMetrics.calculate_ttfb.
+    """
+
+    def __init__(self, urls, samples=5, concurrency=10, timeout=30):
+        """
+        Initialize the CurlBatchMetrics object.
+
+        Args:
+            urls (iterable): The URLs to probe.
+            samples (int): The number of samples taken for each URL.
+            concurrency (int): The maximum number of requests in flight.
+            timeout (float): The maximum time for a single request in seconds.
+        """
+        self.urls = list(dict.fromkeys(urls))
+        self.samples = max(1, samples)
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+
+    def calculate_ttfb(self):
+        """
+        Probe every URL `samples` times and summarize the timings.
+
+        Returns:
+            dict: Maps each URL to a dictionary with:
+                - 'samples' (int): The number of successful samples.
+                - 'errors' (int): The number of failed samples.
+                - one entry per timing phase of TIMING_PHASES ('dns_lookup',
+                'connect_time', 'app_connect_time', ..., 'redirect_time'),
+                each a dictionary of 'min', 'median', 'p90' and 'p99' in
+                milliseconds.
+        """
+        timings = {url: {phase: [] for phase in TIMING_PHASES} for url in self.urls}
+        errors = {url: 0 for url in self.urls}
+
+        # interleave the URLs so the samples of one URL are spread over time
+        jobs = deque(url for _ in range(self.samples) for url in self.urls)
+
+        share = pycurl.CurlShare()
+        share.setopt(pycurl.SH_SHARE, pycurl.LOCK_DATA_DNS)
+
+        multi = pycurl.CurlMulti()
+        handles = [self._new_handle(share)
+                   for _ in range(min(self.concurrency, len(jobs)))]
+        idle = list(handles)
+        active = 0
+
+        try:
+            while jobs or active:
+                while jobs and idle:
+                    handle = idle.pop()
+                    handle.url = jobs.popleft()
+                    handle.setopt(pycurl.URL, handle.url)
+                    multi.add_handle(handle)
+                    active += 1
+
+                while True:
+                    ret, _ = multi.perform()
+                    if ret != pycurl.E_CALL_MULTI_PERFORM:
+                        break
+
+                while True:
+                    queued, succeeded, failed = multi.info_read()
+
+                    for handle in succeeded:
+                        for phase, info in TIMING_PHASES.items():
+                            timings[handle.url][phase].append(
+                                round(handle.getinfo(info) * 1000, 1))
+                        multi.remove_handle(handle)
+                        idle.append(handle)
+                        active -= 1
+
+                    for handle, errno, message in failed:
+                        logger.error(f'Curl request failed for {handle.url}: '
+                                     f'({errno}) {message}')
+                        errors[handle.url] += 1
+                        multi.remove_handle(handle)
+                        idle.append(handle)
+                        active -= 1
+
+                    if queued == 0:
+                        break
+
+                if active:
+                    multi.select(1.0)
+        finally:
+            for handle in handles:
+                handle.close()
+            multi.close()
+            share.close()
+
+        results = {}
+        for url in self.urls:
+            results[url] = {
+                'samples': len(timings[url]['total_time']),
+                'errors': errors[url],
+            }
+            for phase, values in timings[url].items():
+                results[url][phase] = summarize(values)
+
+        return results
+
+    def _new_handle(self, share):
+        """
+        Create a Curl handle configured for timing samples.
+
+        Args:
+            share (pycurl.CurlShare): The share object holding the DNS cache.
+
+        Returns:
+            pycurl.Curl: The configured handle.
+        """
+        handle = pycurl.Curl()
+        handle.setopt(pycurl.SHARE, share)
+        handle.setopt(pycurl.FOLLOWLOCATION, 1)
+        # in milliseconds, as TIMEOUT only takes whole seconds
+        handle.setopt(pycurl.CONNECTTIMEOUT_MS, int(self.timeout * 1000))
+        handle.setopt(pycurl.TIMEOUT_MS, int(self.timeout * 1000))
+        handle.setopt(pycurl.FRESH_CONNECT, 1)
+        handle.setopt(pycurl.FORBID_REUSE, 1)
+        handle.setopt(pycurl.NOSIGNAL, 1)
+        # the body is not needed, only the timings
+        handle.setopt(pycurl.WRITEFUNCTION, lambda data: None)
+        return handle
@@ -2,11 +2,62 @@ import logging
 import pycurl
 from io import BytesIO
 
-#  set the logging behaviour
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s '
-                                                '- %(name)s:%(message)s')
+from metrics.stage_timer import timed
+
 logger = logging.getLogger(__name__)
 
+# the timing phases of a request, in milliseconds since it started; libcurl
+# reports them cumulatively, e.g. 'app_connect_time' (TLS handshake done)
+# includes 'connect_time', and 0 when a phase did not happen (plain HTTP, a
+# reused connection)
+TIMING_PHASES = {
+    'dns_lookup': pycurl.NAMELOOKUP_TIME,
+    'connect_time': pycurl.CONNECT_TIME,
+    'app_connect_time': pycurl.APPCONNECT_TIME,
+    'pretransfer_time': pycurl.PRETRANSFER_TIME,
+    'start_transfer_time': pycurl.STARTTRANSFER_TIME,
+    'total_time': pycurl.TOTAL_TIME,
+    'redirect_time': pycurl.REDIRECT_TIME,
+}
+
+# the HTTP versions libcurl reports for CURLINFO_HTTP_VERSION
+HTTP_VERSIONS = {
+    pycurl.CURL_HTTP_VERSION_1_0: '1.0',
+    pycurl.CURL_HTTP_VERSION_1_1: '1.1',
+    pycurl.CURL_HTTP_VERSION_2_0: '2',
+    getattr(pycurl, 'CURL_HTTP_VERSION_3', 30): '3',
+}
+
+
+def read_transfer_info(curl):
+    """
+    Read the timings and transfer details of a finished request.
+
+    Args:
+        curl (pycurl.Curl): The handle that performed the request.
+
+    Returns:
+        dict: Every TIMING_PHASES entry in milliseconds, plus:
+            - redirect_count (int): The number of redirects followed.
+            - size_download (int): The body bytes received.
+            - speed_download (int): The average download speed in bytes per
+            second.
+            - http_version (str or None): The negotiated HTTP version, e.g.
+            '1.1' or '2'.
+            - new_connections (int): The connections opened for the request,
+            0 if an existing one was reused.
+    """
+    transfer_info = {phase: round(curl.getinfo(info) * 1000)
+                     for phase, info in TIMING_PHASES.items()}
+    transfer_info.update({
+        'redirect_count': curl.getinfo(pycurl.REDIRECT_COUNT),
+        'size_download': round(curl.getinfo(pycurl.SIZE_DOWNLOAD)),
+        'speed_download': round(curl.getinfo(pycurl.SPEED_DOWNLOAD)),
+        'http_version': HTTP_VERSIONS.get(curl.getinfo(pycurl.INFO_HTTP_VERSION)),
+        'new_connections': curl.getinfo(pycurl.NUM_CONNECTS),
+    })
+    return transfer_info
+
 
 class CurlMetrics:
     """
@@ -29,6 +80,7 @@ class CurlMetrics:
         """
         self.curl.close()
 
+    @timed('curl')
     def calculate_ttfb(self):
         """
         Perform a Curl request and calculate the time to first byte (TTFB).
@@ -38,9 +90,18 @@ class CurlMetrics:
             request is successful:
                 - dns_lookup (int): Time taken for DNS lookup in milliseconds.
                 - connect_time (int): Time taken to establish a connection in milliseconds.
+                - app_connect_time (int): Time when the TLS handshake was done
+                in milliseconds (0 for plain HTTP).
+                - pretransfer_time (int): Time when the request was about to be
+                sent in milliseconds.
                 - start_transfer_time (int): Time when the first byte is received in
                 milliseconds.
                 - total_time (int): Total time taken for the request in milliseconds.
+                - redirect_time (int): Time spent following redirects in
+                milliseconds.
+                - the transfer details of read_transfer_info ('redirect_count',
+                'size_download', 'speed_download', 'http_version',
+                'new_connections').
 
             If the Curl request fails, None is returned.
         """
@@ -54,16 +115,101 @@ class CurlMetrics:
                 logging.error(f'Curl request failed: {e}')
                 return None
 
-            dns_time = self.curl.getinfo(pycurl.NAMELOOKUP_TIME)
-            connect_time = self.curl.getinfo(pycurl.CONNECT_TIME)
-            start_transfer_time = self.curl.getinfo(pycurl.STARTTRANSFER_TIME)
-            total_time = self.curl.getinfo(pycurl.TOTAL_TIME)
+            return read_transfer_info(self.curl)
+
+    @timed('probe')
+    def probe(self, connect_timeout=10, timeout=30, max_body_bytes=None):
+        """
+        Check that the URL is up and measure its timings with a single request.
+
+        Args:
+            connect_timeout (float): The maximum time to connect, in seconds.
+            timeout (float): The maximum time for the whole request, in
+            seconds.
+            max_body_bytes (int or None): Stop reading the body after this
+            many bytes; None reads the whole body.
+
+        Returns:
+            dict or None: The metrics returned by calculate_ttfb plus:
+                - status_code (int): The HTTP status code of the response.
+                - up (bool): True if the status code is between 200 and 399
+                (inclusive).
+                - truncated (bool): True if the body was not read completely.
+
+            If the request fails (including a timeout), None is returned.
+        """
+        received = 0
+        truncated = False
+
+        def write(data):
+            nonlocal received, truncated
+            received += len(data)
+            if max_body_bytes is not None and received > max_body_bytes:
+                # returning a short count makes curl abort the transfer
+                truncated = True
+                return 0
+            return None
+
+        try:
+            self.curl.setopt(pycurl.URL, self.url)
+            self.curl.setopt(pycurl.WRITEFUNCTION, write)
+            self.curl.setopt(pycurl.FOLLOWLOCATION, 1)
+            self.curl.setopt(pycurl.NOSIGNAL, 1)
+            self.curl.setopt(pycurl.CONNECTTIMEOUT_MS, int(connect_timeout * 1000))
+            self.curl.setopt(pycurl.TIMEOUT_MS, int(timeout * 1000))
+            self.curl.perform()
+        except pycurl.error as e:
+            if not (truncated and e.args[0] == pycurl.E_WRITE_ERROR):
+                logging.error(f'Curl request failed: {e}')
+                return None
+
+        status_code = self.curl.getinfo(pycurl.RESPONSE_CODE)
+
+        curl_metrics = {
+            'status_code': status_code,
+            'up': 200 <= status_code < 400,
+            'truncated': truncated,
+            **read_transfer_info(self.curl),
+        }
+
+        if not curl_metrics['up']:
+            logging.error(f'URL returned status code {status_code}: {self.url}')
+
+        return curl_metrics
+
+    def probe_pair(self, connect_timeout=10, timeout=30, max_body_bytes=None):
+        """
+        Probe the URL twice on the same handle: cold, on a fresh handle (DNS
+        lookup, TCP connect and full TLS handshake), then warm, on the
+        connection, DNS cache and TLS session the first request left behind.
+        The difference is what keep-alive and session reuse save each page
+        view after the first.
+
+        A server that closes the connection (or a truncated body) makes the
+        warm request connect again; its 'new_connections' is then 1 instead
+        of 0.
+
+        Args:
+            connect_timeout (float): The maximum time to connect, in seconds.
+            timeout (float): The maximum time for each request, in seconds.
+            max_body_bytes (int or None): Stop reading each body after this
+            many bytes; None reads the whole body.
+
+        Returns:
+            dict or None: The cold probe (see probe), with the warm probe
+            under 'warm' (None if it failed, or was skipped as the URL is
+            down); None if the cold probe failed.
+        """
+        cold = self.probe(connect_timeout=connect_timeout, timeout=timeout,
+                          max_body_bytes=max_body_bytes)
+        if cold is None:
+            return None
 
-            curl_metrics = {
-                'dns_lookup': round(dns_time * 1000),
-                'connect_time': round(connect_time * 1000),
-                'start_transfer_time': round(start_transfer_time * 1000),
-                'total_time': round(total_time * 1000)
-            }
+        if not cold['up']:
+            # a URL that is down would only cost another timeout
+            cold['warm'] = None
+            return cold
 
-            return curl_metrics
+        cold['warm'] = self.probe(connect_timeout=connect_timeout,
+                                  timeout=timeout, max_body_bytes=max_body_bytes)
+        return cold
@@ -0,0 +1,164 @@
+import json
+
+
+class LatencyHistogram:
+    """
+    An HDR-style log-linear latency histogram.
+
+    Values are recorded in microseconds. Values below `2 ** sub_bucket_bits`
+    are counted exactly; above that every power-of-two range is split into
+    `2 ** (sub_bucket_bits - 1)` linear buckets, so any recorded value is
+    reported within a relative error of 1 / 2 ** (sub_bucket_bits - 1) (under
+    1% with the default of 8 bits) however large it is. Counts are kept
+    sparsely, so histograms stay small and merge cheaply.
+    """
+
+    def __init__(self, sub_bucket_bits=8):
+        """
+        Initialize the LatencyHistogram.
+
+        Args:
+            sub_bucket_bits (int): log2 of the number of exact buckets; sets
+            the precision.
+        """
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts = {}
+        self.total_count = 0
+        self.min_value = None
+        self.max_value = None
+        self.total_value = 0
+
+    def record(self, milliseconds, count=1):
+        """
+        Record a latency.
+
+        Args:
+            milliseconds (float): The latency in milliseconds.
+            count (int): How many times to record it.
+        """
+        value = max(0, round(milliseconds * 1000))
+        index = self._index(value)
+
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.total_count += count
+        self.total_value += value * count
+        self.min_value = value if self.min_value is None else min(self.min_value, value)
+        self.max_value = value if self.max_value is None else max(self.max_value, value)
+
+    def merge(self, other):
+        """
+        Add the counts of another histogram with the same precision.
+
+        Args:
+            other (LatencyHistogram): The histogram to add.
+        """
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError('Cannot merge histograms of different precision')
+
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+
+        self.total_count += other.total_count
+        self.total_value += other.total_value
+        for value in (other.min_value, other.max_value):
+            if value is not None:
+                self.min_value = value if self.min_value is None else min(self.min_value, value)
+                self.max_value = value if self.max_value is None else max(self.max_value, value)
+
+    def percentile(self, q):
+        """
+        Args:
+            q (float): The percentile, between 0 and 100.
+
+        Returns:
+            float or None: The latency in milliseconds at or below which `q`
+            percent of the recorded values fall, or None if empty.
+        """
+        if not self.total_count:
+            return None
+
+        rank = max(1, round(q / 100 * self.total_count + 0.4999))
+        seen = 0
+
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                value = min(self._highest_equivalent(index), self.max_value)
+                return max(value, self.min_value) / 1000
+
+        return self.max_value / 1000
+
+    def mean(self):
+        """
+        Returns:
+            float or None: The mean latency in milliseconds, or None if empty.
+        """
+        if not self.total_count:
+            return None
+        return self.total_value / self.total_count / 1000
+
+    def count_at_or_below(self, milliseconds):
+        """
+        Args:
+            milliseconds (float): The upper bound.
+
+        Returns:
+            int: The number of recorded values at or below the bound; values
+            within the bucket precision of it may be counted either way.
+        """
+        bound = round(milliseconds * 1000)
+        return sum(count for index, count in self.counts.items()
+                   if self._highest_equivalent(index) <= bound)
+
+    def to_json(self):
+        """
+        Returns:
+            str: The histogram serialized as JSON.
+        """
+        return json.dumps({
+            'bits': self.sub_bucket_bits,
+            'counts': {str(index): count for index, count in sorted(self.counts.items())},
+            'min': self.min_value,
+            'max': self.max_value,
+            'sum': self.total_value,
+        }, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, serialized):
+        """
+        Args:
+            serialized (str): A histogram serialized with to_json.
+
+        Returns:
+            LatencyHistogram: The histogram.
+        """
+        data = json.loads(serialized)
+        histogram = cls(data['bits'])
+        histogram.counts = {int(index): count for index, count in data['counts'].items()}
+        histogram.total_count = sum(histogram.counts.values())
+        histogram.min_value = data['min']
+        histogram.max_value = data['max']
+        histogram.total_value = data['sum']
+        return histogram
+
+    def _index(self, value):
+        sub_bucket_count = 1 << self.sub_bucket_bits
+        if value < sub_bucket_count:
+            return value
+
+        half = sub_bucket_count >> 1
+        shift = value.bit_length() - self.sub_bucket_bits
+        return sub_bucket_count + (shift - 1) * half + (value >> shift) - half
+
+    def _highest_equivalent(self, index):
+        """
+        Returns the highest value (in microseconds) counted in a bucket.
+        """
+        sub_bucket_count = 1 << self.sub_bucket_bits
+        if index < sub_bucket_count:
+            return index
+
+        half = sub_bucket_count >> 1
+        shift, offset = divmod(index - sub_bucket_count, half)
+        shift += 1
+        return ((half + offset + 1) << shift) - 1
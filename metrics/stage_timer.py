@@ -0,0 +1,226 @@
+import contextvars
+import functools
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics.histogram import LatencyHistogram
+
+# where the stages timed in the current context are recorded: the
+# StageTimings of a URL task, or StageHistograms directly (e.g. in the
+# database writer thread)
+current_stage_timings = contextvars.ContextVar('current_stage_timings', default=None)
+
+# the upper bounds of the exported histogram buckets, in seconds; Lighthouse
+# audits take tens of seconds, database writes a few milliseconds
+BUCKET_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30,
+                 60, 120)
+
+METRIC_PREFIX = 'perf_test'
+
+
+class StageTimings:
+    """
+    The stage durations of one URL. A stage that runs several times (e.g.
+    repeated audits) adds up its calls and durations.
+    """
+
+    def __init__(self):
+        self.stages = {}  # stage: [calls, milliseconds]
+
+    def add(self, stage, milliseconds):
+        """
+        Record one call of a stage.
+
+        Args:
+            stage (str): The stage name.
+            milliseconds (float): How long it took.
+        """
+        timing = self.stages.get(stage)
+        if timing is None:
+            self.stages[stage] = [1, milliseconds]
+        else:
+            timing[0] += 1
+            timing[1] += milliseconds
+
+    def rows(self):
+        """
+        Returns:
+            list: (stage, calls, milliseconds) tuples.
+        """
+        return [(stage, calls, round(milliseconds, 3))
+                for stage, (calls, milliseconds) in self.stages.items()]
+
+
+@contextmanager
+def capture_stage_timings(timings=None):
+    """
+    Record the stages timed in the current context.
+
+    Args:
+        timings (StageTimings, StageHistograms or None): The collector, a new
+        StageTimings if None.
+
+    Yields:
+        The collector.
+    """
+    timings = StageTimings() if timings is None else timings
+    token = current_stage_timings.set(timings)
+
+    try:
+        yield timings
+    finally:
+        current_stage_timings.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block as a stage of the current context; outside a capture the
+    block only costs a context variable lookup.
+
+    Args:
+        name (str): The stage name.
+    """
+    timings = current_stage_timings.get()
+    if timings is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - started) * 1000)
+
+
+def timed(name):
+    """
+    Decorate a function so each call is timed as a stage, see stage().
+
+    Args:
+        name (str): The stage name.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StageHistograms:
+    """
+    The stage durations of every URL of a run (or of a scheduler's lifetime),
+    as one LatencyHistogram per stage, plus the number of URLs by outcome.
+    Safe to fill from several threads.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.urls = {'succeeded': 0, 'failed': 0}
+        self._lock = threading.Lock()
+
+    def add(self, stage, milliseconds):
+        """
+        Record one call of a stage.
+
+        Args:
+            stage (str): The stage name.
+            milliseconds (float): How long it took.
+        """
+        with self._lock:
+            self._histogram(stage).record(milliseconds)
+
+    def add_timings(self, timings, succeeded=True):
+        """
+        Record the stages of one URL, each call as a single value.
+
+        Args:
+            timings (StageTimings): The URL's stage durations.
+            succeeded (bool): Whether the URL was evaluated without an error.
+        """
+        with self._lock:
+            for stage_name, calls, milliseconds in timings.rows():
+                self._histogram(stage_name).record(milliseconds / calls, calls)
+            self.urls['succeeded' if succeeded else 'failed'] += 1
+
+    def summary(self, percentiles=(50, 90, 99)):
+        """
+        Returns:
+            dict: Each stage mapped to its 'count', 'mean', percentiles and
+            'max', in milliseconds.
+        """
+        with self._lock:
+            summary = {}
+            for stage_name, histogram in self.histograms.items():
+                summary[stage_name] = {'count': histogram.total_count,
+                                       'mean': round(histogram.mean(), 3)}
+                for q in percentiles:
+                    summary[stage_name][f'p{q}'] = histogram.percentile(q)
+                summary[stage_name]['max'] = histogram.max_value / 1000
+            return summary
+
+    def to_openmetrics(self):
+        """
+        Returns:
+            str: The stage histograms and URL counts in the OpenMetrics text
+            format, which node_exporter's textfile collector also reads.
+        """
+        name = f'{METRIC_PREFIX}_stage_duration_seconds'
+        lines = [f'# TYPE {name} histogram',
+                 f'# UNIT {name} seconds',
+                 f'# HELP {name} Time spent in each stage of a URL evaluation.']
+
+        with self._lock:
+            for stage_name in sorted(self.histograms):
+                histogram = self.histograms[stage_name]
+                label = f'stage="{stage_name}"'
+                for bound in BUCKET_BOUNDS:
+                    count = histogram.count_at_or_below(bound * 1000)
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.total_count}')
+                lines.append(f'{name}_count{{{label}}} {histogram.total_count}')
+                lines.append(f'{name}_sum{{{label}}} {histogram.total_value / 1e6}')
+
+            urls = f'{METRIC_PREFIX}_urls'
+            lines += [f'# TYPE {urls} counter',
+                      f'# HELP {urls} URLs evaluated, by outcome.']
+            for status, count in sorted(self.urls.items()):
+                lines.append(f'{urls}_total{{status="{status}"}} {count}')
+
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def write_openmetrics(self, path):
+        """
+        Write the metrics to a file atomically: a temporary file in the same
+        directory is renamed over it, so a collector never reads half a file.
+
+        Args:
+            path (str): The file, e.g. in node_exporter's textfile directory
+            (the collector only reads '*.prom' files).
+        """
+        text = self.to_openmetrics()
+        directory = os.path.dirname(os.path.abspath(path))
+
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.perf_test.',
+                                                 suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w') as metrics_file:
+                metrics_file.write(text)
+            os.chmod(temporary, 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+
+    def _histogram(self, stage_name):
+        histogram = self.histograms.get(stage_name)
+        if histogram is None:
+            histogram = self.histograms[stage_name] = LatencyHistogram()
+        return histogram
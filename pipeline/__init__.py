@@ -0,0 +1,4 @@
+# used to automatically import the modules (classes) of the package
+import pipeline.task_log
+import pipeline.url_task
+import pipeline.executor
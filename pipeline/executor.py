@@ -0,0 +1,307 @@
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+#  import packages (modules/classes)
+from lighthouse.chrome_pool import ChromePool
+from lighthouse.profiles import AUDIT_PROFILES, DEFAULT_PROFILE
+from metrics.stage_timer import StageHistograms
+from pipeline.url_task import UrlTask
+from storage.archive import ReportArchive
+from storage.sqlite import SQLiteWriter
+from url_information.version_cache import VersionCache
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineExecutor:
+    """
+    Evaluates URLs concurrently.
+
+    The I/O bound stages (version lookup, up-check/curl probe and storage)
+    of up to `io_workers` URLs run side by side, while at most
+    `lighthouse_workers` Lighthouse subprocesses run at any one time.
+
+    The duration of every stage is kept per URL (see UrlTask) and in
+    `stage_histograms` for the executor's lifetime, which can be exported
+    to an OpenMetrics file.
+    """
+
+    def __init__(self, output_directory, database, io_workers=8,
+                 lighthouse_workers=2, reuse_browsers=False,
+                 browser_max_audits=50, probe_settings=None,
+                 version_cache_ttl=300, batch_size=50, flush_interval=5.0,
+                 stream_reports=False, archive_database=None,
+                 archive_max_bytes=None, sampler=None, max_log_records=1000,
+                 run_id=None, metrics_file=None, metrics_interval=15.0,
+                 warm_probe=False, profile=DEFAULT_PROFILE):
+        """
+        Initialize the PipelineExecutor instance.
+
+        Args:
+            output_directory (str): The directory for audit files.
+            database (str): The path of the SQLite database file.
+            io_workers (int): The number of URLs evaluated at the same time.
+            lighthouse_workers (int): The number of Lighthouse audits that may
+            run at the same time.
+            reuse_browsers (bool): Keep one long-lived Chrome per Lighthouse
+            worker instead of starting a fresh Chrome for every audit.
+            browser_max_audits (int): The number of audits after which a
+            long-lived Chrome is restarted.
+            probe_settings (dict or None): Keyword arguments for
+            CurlMetrics.probe ('connect_timeout', 'timeout',
+            'max_body_bytes').
+            version_cache_ttl (float): Seconds an environment's version
+            information is reused before version.txt is requested again.
+            batch_size (int): The number of rows written per transaction.
+            flush_interval (float): The maximum seconds a row waits before it
+            is written.
+            stream_reports (bool): Read Lighthouse reports from the subprocess
+            output instead of writing them to files.
+            archive_database (str or None): The path of the report archive
+            database; None discards the full reports.
+            archive_max_bytes (int or None): The size cap of the archive.
+            sampler (AdaptiveSampler or None): Repeats each audit until its
+            metrics are stable, None audits every URL once.
+            max_log_records (int): The number of log lines kept per URL for
+            the 'error_log' column.
+            run_id (int or None): The run the URLs belong to; their results
+            update the run's checkpoint, so it can be resumed.
+            metrics_file (str or None): The OpenMetrics file the stage
+            histograms are written to, e.g. for node_exporter's textfile
+            collector; None does not export them.
+            metrics_interval (float): The minimum seconds between two writes
+            of the metrics file while URLs are evaluated.
+            warm_probe (bool): Probe every URL a second time on the same
+            connection, to measure what connection reuse saves.
+            profile (str): The Lighthouse audit profile of URLs submitted
+            without one, see lighthouse.profiles.AUDIT_PROFILES.
+
+        Raises:
+            ValueError: If the profile is unknown.
+        """
+        if profile not in AUDIT_PROFILES:
+            raise ValueError(f'Unknown audit profile: {profile}')
+
+        self.output_directory = output_directory
+        self.database = database
+        self.io_workers = max(1, io_workers)
+        self.lighthouse_workers = max(1, lighthouse_workers)
+        self.reuse_browsers = reuse_browsers
+        self.browser_max_audits = browser_max_audits
+        self.probe_settings = probe_settings
+        self.version_cache = VersionCache(ttl=version_cache_ttl)
+        self.stream_reports = stream_reports
+        self.archive_database = archive_database
+        self.archive_max_bytes = archive_max_bytes
+        self.sampler = sampler
+        self.max_log_records = max_log_records
+        self.run_id = run_id
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        self.warm_probe = warm_probe
+        self.profile = profile
+        self.stage_histograms = StageHistograms()
+        self._metrics_written = time.monotonic()
+
+        self._lighthouse_slots = threading.BoundedSemaphore(self.lighthouse_workers)
+        # never queue more than two URLs per worker, so the source can be lazy
+        self._pending = threading.BoundedSemaphore(self.io_workers * 2)
+        self._writer = SQLiteWriter(database, batch_size=batch_size,
+                                    flush_interval=flush_interval,
+                                    stage_histograms=self.stage_histograms)
+        # submit() is called from several threads (scheduler, worker)
+        self._task_ids = itertools.count(1)
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._pool = None
+        self._chrome_pool = None
+        self._report_archive = None
+
+    def __enter__(self) -> 'PipelineExecutor':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def start(self):
+        """
+        Start the worker pool and the database writer.
+        """
+        self._writer.start()
+
+        if self.reuse_browsers and self._chrome_pool is None:
+            self._chrome_pool = ChromePool(self.lighthouse_workers,
+                                           max_audits=self.browser_max_audits)
+
+        if self.archive_database is not None and self._report_archive is None:
+            self._report_archive = ReportArchive(self.archive_database,
+                                                 max_bytes=self.archive_max_bytes)
+
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.io_workers,
+                                            thread_name_prefix='url-task')
+
+    def shutdown(self):
+        """
+        Wait for every submitted URL to finish, stop the worker pool and
+        flush the database writer.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+        if self._chrome_pool is not None:
+            self._chrome_pool.close()
+            self._chrome_pool = None
+
+        try:
+            # raises if rows could not be written
+            self._writer.close()
+        finally:
+            if self._report_archive is not None:
+                self._report_archive.close()
+                self._report_archive = None
+
+            self.write_metrics()
+
+    def write_metrics(self):
+        """
+        Write the stage histograms to the metrics file, if there is one. A
+        failure is only logged, metrics never stop a run.
+        """
+        self._metrics_written = time.monotonic()
+        if self.metrics_file is None:
+            return
+
+        try:
+            self.stage_histograms.write_openmetrics(self.metrics_file)
+        except OSError as e:
+            logger.error(f'Could not write the metrics file {self.metrics_file}: {e}')
+
+    @property
+    def in_flight(self):
+        """
+        Returns:
+            int: The number of submitted URLs that have not finished yet.
+        """
+        with self._in_flight_lock:
+            return self._in_flight
+
+    def submit(self, url, description, profile=None):
+        """
+        Queue a URL for evaluation, blocking while the queue is full.
+
+        Args:
+            url (str): The URL to be evaluated.
+            description (str): The description of the URL.
+            profile (str or None): The Lighthouse audit profile, the
+            executor's profile if None.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the stored URL data.
+        """
+        self.start()
+        self._pending.acquire()
+
+        task = UrlTask(next(self._task_ids), url, description, self.output_directory,
+                       lighthouse_slots=self._lighthouse_slots,
+                       chrome_pool=self._chrome_pool,
+                       probe_settings=self.probe_settings,
+                       warm_probe=self.warm_probe,
+                       version_cache=self.version_cache,
+                       stream_reports=self.stream_reports,
+                       report_archive=self._report_archive,
+                       sampler=self.sampler,
+                       max_log_records=self.max_log_records,
+                       profile=profile or self.profile)
+
+        with self._in_flight_lock:
+            self._in_flight += 1
+
+        try:
+            future = self._pool.submit(self._process, task)
+        except Exception:
+            self._finished()
+            raise
+
+        future.add_done_callback(lambda _: self._finished())
+        return future
+
+    def run(self, urls):
+        """
+        Evaluate every URL and wait for all of them to finish.
+
+        Args:
+            urls (dict or iterable): URLs mapped to their descriptions, or
+            (url, description) pairs or (url, description, profile) records
+            such as DataDrive.iter_records yields; an iterable is consumed
+            lazily.
+
+        Returns:
+            int: The number of URLs evaluated.
+        """
+        items = urls.items() if isinstance(urls, dict) else urls
+        count = 0
+
+        with self:
+            for record in items:
+                self.submit(*record)
+                count += 1
+
+        return count
+
+    def _finished(self):
+        with self._in_flight_lock:
+            self._in_flight -= 1
+            export = self.metrics_file is not None and \
+                time.monotonic() - self._metrics_written >= self.metrics_interval
+            if export:
+                self._metrics_written = time.monotonic()
+        self._pending.release()
+
+        if export:
+            self.write_metrics()
+
+    def _process(self, task):
+        """
+        Evaluate a single URL and store the result.
+
+        Args:
+            task (UrlTask): The task to run.
+
+        Returns:
+            dict or None: The stored URL data, or None if the task failed.
+
+        Raises:
+            RuntimeError: If the result could not be stored; it is logged
+            here, as run() does not look at the futures.
+        """
+        try:
+            url_data = task.run()
+        except Exception as e:
+            logger.exception(f'Unexpected error evaluating {task.url}: {e}')
+            return None
+
+        self.stage_histograms.add_timings(url_data['stage_timings'],
+                                          succeeded=not url_data.get('error_log'))
+        try:
+            self._store(url_data)
+        except Exception as e:
+            logger.error(f'Could not store the result of {task.url}: {e}')
+            raise
+        return url_data
+
+    def _store(self, url_data):
+        """
+        Queue the URL data for the batched database writer.
+
+        Args:
+            url_data (dict): The URL data to be stored.
+        """
+        if self.run_id is not None:
+            url_data['run_id'] = self.run_id
+        self._writer.insert_url_data(url_data)
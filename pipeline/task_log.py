@@ -0,0 +1,120 @@
+import contextvars
+import logging
+import logging.handlers
+import queue
+from collections import deque
+from contextlib import contextmanager
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s:%(message)s'
+
+# the log buffer of the URL task running in the current context
+current_task_log = contextvars.ContextVar('current_task_log', default=None)
+
+
+class TaskLogBuffer:
+    """
+    A bounded in-memory log for one URL task. Once full, the oldest lines
+    are dropped.
+    """
+
+    def __init__(self, max_records=1000):
+        """
+        Initialize the TaskLogBuffer.
+
+        Args:
+            max_records (int): The maximum number of lines kept.
+        """
+        self._lines = deque(maxlen=max(1, max_records))
+        self.dropped = 0
+
+    def append(self, line):
+        """
+        Add a formatted log line.
+
+        Args:
+            line (str): The formatted log record.
+        """
+        if len(self._lines) == self._lines.maxlen:
+            self.dropped += 1
+        self._lines.append(line)
+
+    def getvalue(self):
+        """
+        Returns:
+            str: Every kept line, as it would have been written to a log file.
+        """
+        lines = list(self._lines)
+        if self.dropped:
+            lines.insert(0, f'... {self.dropped} earlier log lines dropped')
+        return ''.join(f'{line}\n' for line in lines)
+
+
+class TaskLogHandler(logging.Handler):
+    """
+    Copies every record into the log buffer of the task in whose context it
+    was emitted; records emitted outside a task are ignored.
+    """
+
+    def emit(self, record):
+        buffer = current_task_log.get()
+        if buffer is None:
+            return
+
+        try:
+            buffer.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+@contextmanager
+def capture_task_log(max_records=1000):
+    """
+    Capture the log records of the current context in a new buffer.
+
+    Args:
+        max_records (int): The maximum number of lines kept.
+
+    Yields:
+        TaskLogBuffer: The buffer the records are captured in.
+    """
+    buffer = TaskLogBuffer(max_records)
+    token = current_task_log.set(buffer)
+
+    try:
+        yield buffer
+    finally:
+        current_task_log.reset(token)
+
+
+def configure_logging(log_file, level=logging.DEBUG):
+    """
+    Configure the root logger for a run.
+
+    Records are captured per URL task in memory, and written to the shared
+    log file by a background thread, so logging never waits on disk I/O.
+
+    Args:
+        log_file (str): The path of the shared log file, truncated first.
+        level (int): The logging level.
+
+    Returns:
+        logging.handlers.QueueListener: The started listener; stop it at the
+        end of the run to flush the log file.
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+
+    file_handler = logging.FileHandler(log_file, mode='w')
+    file_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+
+    task_handler = TaskLogHandler()
+    task_handler.setFormatter(formatter)
+
+    logging.basicConfig(level=level, force=True,
+                        handlers=[logging.handlers.QueueHandler(log_queue),
+                                  task_handler])
+    listener.start()
+
+    return listener
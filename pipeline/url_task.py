@@ -0,0 +1,304 @@
+import datetime
+import json
+import logging
+import threading
+
+#  import packages (modules/classes)
+from lighthouse.lighthouse_metrics import LighthouseRunner
+from lighthouse.profiles import DEFAULT_PROFILE
+from metrics.curl_metrics import CurlMetrics
+from metrics.stage_timer import capture_stage_timings, stage
+from pipeline.task_log import capture_task_log
+from url_information.information import Info
+
+logger = logging.getLogger(__name__)
+
+class UrlTask:
+    """
+    Runs every stage of the evaluation for a single URL.
+
+    Each task names its Lighthouse report after its own task id and captures
+    its log records and stage timings in memory, so tasks running side by
+    side never share output.
+    """
+
+    def __init__(self, task_id, url, description, output_directory,
+                 lighthouse_slots=None, chrome_pool=None, probe_settings=None,
+                 version_cache=None, stream_reports=False, report_archive=None,
+                 sampler=None, max_log_records=1000, warm_probe=False,
+                 profile=DEFAULT_PROFILE):
+        """
+        Initialize the UrlTask instance.
+
+        Args:
+            task_id (int): A number that is unique within the run.
+            url (str): The URL to be evaluated.
+            description (str): The description of the URL.
+            output_directory (str): The directory for audit files.
+            lighthouse_slots (threading.Semaphore or None): Bounds the number
+            of Lighthouse audits that may run at the same time.
+            chrome_pool (ChromePool or None): Long-lived browsers for
+            Lighthouse to attach to, or None to start Chrome per audit.
+            probe_settings (dict or None): Keyword arguments for
+            CurlMetrics.probe (timeouts and body limit).
+            version_cache (VersionCache or None): Shares version.txt lookups
+            with the other tasks of the run.
+            stream_reports (bool): Read the Lighthouse report from the
+            subprocess output instead of writing it to a file.
+            report_archive (ReportArchive or None): Where full reports are
+            kept, None to discard them.
+            sampler (AdaptiveSampler or None): Repeats the audit until its
+            metrics are stable, None audits once.
+            max_log_records (int): The number of log lines kept for the
+            'error_log' column.
+            warm_probe (bool): Probe the URL a second time on the same
+            connection, see CurlMetrics.probe_pair.
+            profile (str): The Lighthouse audit profile, see
+            lighthouse.profiles.AUDIT_PROFILES.
+        """
+        self.task_id = task_id
+        self.url = url
+        self.description = description
+        self.output_directory = output_directory
+        self.lighthouse_slots = lighthouse_slots or threading.Semaphore()
+        self.chrome_pool = chrome_pool
+        self.probe_settings = probe_settings or {}
+        self.version_cache = version_cache
+        self.stream_reports = stream_reports
+        self.report_archive = report_archive
+        self.sampler = sampler
+        self.max_log_records = max_log_records
+        self.warm_probe = warm_probe
+        self.profile = profile
+        self.filename = f'{task_id:05d}-{description}'
+        self._task_log = None
+
+    def run(self):
+        """
+        Evaluate the URL.
+
+        Returns:
+            dict: The URL data, ready to be stored in the database; its
+            'stage_timings' (StageTimings) hold how long each stage took.
+        """
+        with capture_task_log(self.max_log_records) as self._task_log, \
+                capture_stage_timings() as timings:
+            with stage('url'):
+                url_data = self._evaluate()
+
+        url_data['stage_timings'] = timings
+        return url_data
+
+    def _read_log(self):
+        """
+        Read everything that has been logged for this task so far.
+
+        Returns:
+            str: The task's log lines.
+        """
+        return self._task_log.getvalue()
+
+    def _evaluate(self):
+        # Get the current date and time
+        current_datetime = datetime.datetime.now()
+
+        formatted_date = f'{current_datetime.month}/{current_datetime.day}/{current_datetime.year}'
+        formatted_time = current_datetime.strftime('%I:%M %p')
+        formatted_time = formatted_time.lstrip("0").replace("AM", "AM").replace("PM", "PM")
+
+        # 1. Create a dictionary to store URL data
+        url_data = {
+            'URL': self.url,
+            'Description': self.description,
+            'Date': formatted_date,
+            'Time': formatted_time,
+            'Timestamp': current_datetime.isoformat(timespec='seconds'),
+            'Environment': None,
+            'Version': 'unknown',
+            'Branch': 'unknown',
+            'dns_lookup': None,
+            'connect_time': None,
+            'start_transfer_time': None,
+            'total_time': None,
+            'app_connect_time': None,
+            'pretransfer_time': None,
+            'redirect_time': None,
+            'redirect_count': None,
+            'size_download': None,
+            'speed_download': None,
+            'http_version': None,
+            'warm_pretransfer_time': None,
+            'warm_start_transfer_time': None,
+            'warm_total_time': None,
+            'warm_new_connections': None,
+            'Performance_score': None,
+            'Accessibility_score': None,
+            'Best_Practices_score': None,
+            'SEO_score': None,
+            'first_contentful_paint': None,
+            'speed_index': None,
+            'largest_contentful_paint': None,
+            'cumulative_layout_shift': None,
+            'total_blocking_time': None,
+            'time_to_interactive': None,
+            'error_log': None,
+            'report_hash': None,
+            'sample_count': None,
+            'metric_spread': None,
+            'audit_profile': self.profile,
+        }
+
+        logger.info(f'URL: {self.url}')
+        logger.info(f'Description: {self.description}')
+        logger.info(f"test time: {url_data['Date']}")
+
+        # 2. Gather version information
+        url_versioning = Info(self.url, cache=self.version_cache)
+        with stage('version_lookup'):
+            version_info = url_versioning.versioning()
+
+        if version_info is not None:
+            url_data['Version'] = version_info.get('version', 'unknown')
+            url_data['Branch'] = version_info.get('branch', 'unknown')
+
+        url_data['Environment'] = url_versioning.environment()
+
+        # 3. Check if the URL is 'up' and get the curl metrics, one request
+        # (and again on the same connection, if the warm probe is enabled)
+        curl_metrics = CurlMetrics(self.url)
+        if self.warm_probe:
+            ttfb = curl_metrics.probe_pair(**self.probe_settings)
+        else:
+            ttfb = curl_metrics.probe(**self.probe_settings)
+
+        if ttfb is None or not ttfb['up']:
+            # error logged in the CurlMetrics class
+            url_data['error_log'] = self._read_log()
+            return url_data
+
+        url_data['dns_lookup'] = ttfb.get('dns_lookup')
+        url_data['connect_time'] = ttfb.get('connect_time')
+        url_data['start_transfer_time'] = ttfb.get('start_transfer_time')
+        url_data['total_time'] = ttfb.get('total_time')
+        url_data['app_connect_time'] = ttfb.get('app_connect_time')
+        url_data['pretransfer_time'] = ttfb.get('pretransfer_time')
+        url_data['redirect_time'] = ttfb.get('redirect_time')
+        url_data['redirect_count'] = ttfb.get('redirect_count')
+        url_data['size_download'] = ttfb.get('size_download')
+        url_data['speed_download'] = ttfb.get('speed_download')
+        url_data['http_version'] = ttfb.get('http_version')
+
+        warm = ttfb.get('warm')
+        if warm is not None:
+            url_data['warm_pretransfer_time'] = warm.get('pretransfer_time')
+            url_data['warm_start_transfer_time'] = warm.get('start_transfer_time')
+            url_data['warm_total_time'] = warm.get('total_time')
+            url_data['warm_new_connections'] = warm.get('new_connections')
+
+        # 4. let's get some Lighthouse metrics, waiting for a free slot
+        runner = LighthouseRunner(self.output_directory,
+                                  chrome_pool=self.chrome_pool,
+                                  profile=self.profile)
+        lighthouse_metrics = self._run_audit(runner, url_data)
+
+        if lighthouse_metrics is None:
+            # error logged in the LighthouseRunner class
+            url_data['error_log'] = self._read_log()
+            return url_data
+
+        url_data['Performance_score'] = lighthouse_metrics.get('performance_score')
+        url_data['Accessibility_score'] = lighthouse_metrics.get('accessibility_score')
+        url_data['Best_Practices_score'] = lighthouse_metrics.get('best_practices_score')
+        url_data['SEO_score'] = lighthouse_metrics.get('seo_score')
+        url_data['first_contentful_paint'] = lighthouse_metrics.get('first_contentful_paint')
+        url_data['speed_index'] = lighthouse_metrics.get('speed_index')
+        url_data['largest_contentful_paint'] = lighthouse_metrics.get('largest_contentful_paint')
+        url_data['cumulative_layout_shift'] = lighthouse_metrics.get('cumulative_layout_shift')
+        url_data['total_blocking_time'] = lighthouse_metrics.get('total_blocking_time')
+        url_data['time_to_interactive'] = lighthouse_metrics.get('time_to_interactive')
+
+        return url_data
+
+    def _run_audit(self, runner, url_data):
+        """
+        Run the Lighthouse audit, repeatedly if there is a sampler, and pull
+        its metrics. With a sampler the medians are returned and
+        'sample_count' and 'metric_spread' are set.
+
+        The audit's 'network_requests' and 'resource_summary' are moved to
+        the URL data; with a sampler, those of the last successful audit.
+
+        Args:
+            runner (LighthouseRunner): The runner to audit with.
+            url_data (dict): The URL data of this task.
+
+        Returns:
+            dict or None: The audit metrics, or None if every audit failed.
+        """
+        def audit():
+            lighthouse_metrics = self._audit_once(runner, url_data)
+            if lighthouse_metrics is not None:
+                url_data['network_requests'] = lighthouse_metrics.pop('network_requests', None)
+                url_data['resource_summary'] = lighthouse_metrics.pop('resource_summary', None)
+            return lighthouse_metrics
+
+        if self.sampler is None:
+            return audit()
+
+        lighthouse_metrics, spread, runs = self.sampler.sample(audit)
+
+        url_data['sample_count'] = runs
+        url_data['metric_spread'] = json.dumps(spread) if spread else None
+
+        return lighthouse_metrics
+
+    def _audit_once(self, runner, url_data):
+        """
+        Run the Lighthouse audit once and pull its metrics. If there is a
+        report archive, the full report is archived and 'report_hash' is set.
+
+        Args:
+            runner (LighthouseRunner): The runner to audit with.
+            url_data (dict): The URL data of this task.
+
+        Returns:
+            dict or None: The audit metrics, or None if the audit failed.
+        """
+        def archive(report):
+            # archiving is optional, a failure must not cost the metrics
+            try:
+                url_data['report_hash'] = self.report_archive.store(
+                    report, self.url, url_data.get('Timestamp'))
+            except Exception as e:
+                logger.exception(f'Could not archive the report for {self.url}: {e}')
+                url_data['report_hash'] = None
+
+        with stage('lighthouse_wait'):
+            self.lighthouse_slots.acquire()
+
+        try:
+            if self.stream_reports:
+                # the report is read from the subprocess, nothing touches the disk
+                return runner.run_lighthouse_metrics(
+                    self.url,
+                    report_sink=archive if self.report_archive else None)
+
+            audit_success = runner.run_lighthouse(self.url, self.filename)
+        finally:
+            self.lighthouse_slots.release()
+
+        # ensure that the audit has created a .json file
+        # this is needed since it was created outside the python framework
+        if not audit_success or not runner.audit_exists(self.filename):
+            return None
+
+        if self.report_archive is not None:
+            report = runner.read_audit_report(self.filename)
+            if report is not None:
+                archive(report)
+
+        # pull the metrics, then delete the report, we do not need it anymore
+        lighthouse_metrics = runner.get_audit_metrics(self.filename)
+        runner.delete_audit_file(self.filename)
+
+        return lighthouse_metrics
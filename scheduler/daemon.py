@@ -0,0 +1,196 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledUrl:
+    """
+    A URL evaluated again every `interval` seconds.
+    """
+
+    def __init__(self, url, description, interval, priority=0, profile=None):
+        """
+        Initialize the ScheduledUrl.
+
+        Args:
+            url (str): The URL to be evaluated.
+            description (str): The description of the URL.
+            interval (float): Seconds between two evaluations.
+            priority (int): Higher runs first when several URLs are due.
+            profile (str or None): The Lighthouse audit profile, the
+            executor's profile if None.
+        """
+        self.url = url
+        self.description = description
+        self.interval = interval
+        self.priority = priority
+        self.profile = profile
+        self.due = None
+        self.runs = 0
+
+
+class AuditScheduler:
+    """
+    Evaluates URLs on their own intervals, for as long as it runs.
+
+    URLs wait in a heap ordered by the time they are due. Due URLs move to a
+    second heap ordered by priority, from which they are submitted to the
+    PipelineExecutor while fewer than `max_in_flight` URLs are being
+    evaluated. When the Lighthouse workers cannot keep up, due URLs therefore
+    wait here, where the most important ones go first, instead of in the
+    executor's first-come-first-served queue.
+
+    A URL is due again `interval` seconds (plus or minus the jitter) after it
+    was last due, or right after its evaluation finished if that is later; a
+    URL is never evaluated twice at the same time. A URL scheduled once per
+    audit profile (e.g. 'perf' hourly and 'full' daily) is two entries.
+    """
+
+    def __init__(self, executor, default_interval=86400, jitter=0.1,
+                 max_in_flight=None, rng=None):
+        """
+        Initialize the AuditScheduler.
+
+        Args:
+            executor (PipelineExecutor): Evaluates and stores the URLs.
+            default_interval (float): Seconds between evaluations of URLs
+            without an interval of their own.
+            jitter (float): The fraction of the interval each run is moved
+            by at random, so URLs added together do not stay in lockstep.
+            max_in_flight (int or None): The number of URLs submitted to the
+            executor at the same time, its number of I/O workers if None.
+            rng (random.Random or None): The source of the jitter.
+        """
+        self.executor = executor
+        self.default_interval = default_interval
+        self.jitter = max(0.0, min(jitter, 1.0))
+        self.max_in_flight = max(1, max_in_flight or executor.io_workers)
+        self._rng = rng or random.Random()
+        self._sequence = itertools.count()
+        self._waiting = []  # (due, sequence, ScheduledUrl)
+        self._ready = []  # (-priority, due, sequence, ScheduledUrl)
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+
+    def add(self, url, description, interval=None, priority=0, profile=None):
+        """
+        Schedule a URL. Its first run is spread over the jitter window.
+
+        Args:
+            url (str): The URL to be evaluated.
+            description (str): The description of the URL.
+            interval (float or None): Seconds between evaluations, the
+            default interval if None.
+            priority (int): Higher runs first when several URLs are due.
+            profile (str or None): The Lighthouse audit profile, the
+            executor's profile if None.
+
+        Returns:
+            ScheduledUrl: The scheduled URL.
+        """
+        entry = ScheduledUrl(url, description, interval or self.default_interval,
+                             priority, profile)
+        entry.due = time.monotonic() + self._rng.uniform(0, self.jitter * entry.interval)
+
+        with self._condition:
+            heapq.heappush(self._waiting, (entry.due, next(self._sequence), entry))
+            self._condition.notify()
+
+        return entry
+
+    def stop(self):
+        """
+        Stop submitting URLs; run() returns once the running ones finish.
+        """
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify()
+
+    def run(self, records=()):
+        """
+        Schedule the records and evaluate URLs until stop() is called.
+
+        Args:
+            records (iterable): (url, description, interval, priority) tuples,
+            optionally followed by the profile, such as
+            DataDrive.iter_schedule yields.
+        """
+        for record in records:
+            self.add(*record)
+
+        logger.info(f'Scheduling {len(self._waiting)} URLs, at most '
+                    f'{self.max_in_flight} at a time')
+
+        with self.executor:
+            while not self._stopped.is_set():
+                with self._condition:
+                    self._promote_due(time.monotonic())
+                    entries = self._take_ready()
+                    if not entries:
+                        self._condition.wait(self._seconds_to_wait())
+
+                for entry in entries:
+                    self._submit(entry)
+
+        logger.info('Scheduler stopped')
+
+    def _promote_due(self, now):
+        while self._waiting and self._waiting[0][0] <= now:
+            due, sequence, entry = heapq.heappop(self._waiting)
+            heapq.heappush(self._ready, (-entry.priority, due, sequence, entry))
+
+    def _take_ready(self):
+        """
+        Pops the ready URLs that fit under max_in_flight, most important
+        first. Called with the condition held.
+        """
+        free = self.max_in_flight - self.executor.in_flight
+        entries = []
+        while self._ready and len(entries) < free:
+            entries.append(heapq.heappop(self._ready)[3])
+
+        if self._ready and not entries:
+            logger.debug(f'{len(self._ready)} due URLs waiting for a free worker')
+
+        return entries
+
+    def _seconds_to_wait(self):
+        if self._ready:
+            # woken by a finished URL, the timeout only guards against a
+            # missed notification
+            return 1.0
+        if self._waiting:
+            return max(0.0, self._waiting[0][0] - time.monotonic())
+        return None
+
+    def _submit(self, entry):
+        late = time.monotonic() - entry.due
+        if late > 60:
+            logger.warning(f'{entry.url} started {late:.0f} seconds late, '
+                           f'the workers are saturated')
+
+        entry.runs += 1
+        try:
+            future = self.executor.submit(entry.url, entry.description, entry.profile)
+        except Exception as e:
+            logger.exception(f'Could not submit {entry.url}: {e}')
+            self._reschedule(entry)
+            return
+
+        future.add_done_callback(lambda _: self._reschedule(entry))
+
+    def _reschedule(self, entry):
+        """
+        Schedule the next run of a URL once its current run finished.
+        """
+        jitter = self._rng.uniform(-self.jitter, self.jitter) * entry.interval
+        entry.due = max(entry.due + entry.interval + jitter, time.monotonic())
+
+        with self._condition:
+            heapq.heappush(self._waiting, (entry.due, next(self._sequence), entry))
+            self._condition.notify()
@@ -1,2 +1,8 @@
 # used to automatically import the modules (classes) of the package
+import storage.schema
+import storage.rollup
+import storage.resources
 import storage.sqlite
+import storage.archive
+import storage.export
+import storage.job_queue
@@ -0,0 +1,304 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import zlib
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS report_chunks (
+        hash TEXT PRIMARY KEY,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS reports (
+        report_hash TEXT PRIMARY KEY,
+        url TEXT NOT NULL,
+        timestamp TEXT,
+        manifest BLOB NOT NULL,
+        raw_size INTEGER NOT NULL,
+        created INTEGER NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_reports_url_timestamp ON reports (url, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_reports_created ON reports (created)',
+    '''
+    CREATE TABLE IF NOT EXISTS report_chunk_refs (
+        report_hash TEXT NOT NULL,
+        chunk_hash TEXT NOT NULL,
+        PRIMARY KEY (report_hash, chunk_hash)
+    ) WITHOUT ROWID
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_report_chunk_refs_chunk ON report_chunk_refs (chunk_hash)',
+]
+
+
+def _canonical(value) -> bytes:
+    """
+    Serializes a JSON value the same way every time, so equal values always
+    hash (and reassemble) to the same bytes.
+    """
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class ReportArchive:
+    """
+    A compressed, content-addressed store for full Lighthouse reports.
+
+    A report is split into chunks, one per audit and one per other top-level
+    key, and every chunk is stored once, zlib-compressed, under its SHA-256.
+    Boilerplate that repeats from report to report (i18n strings, settings,
+    unchanged audits) is therefore stored only once. The report itself is
+    addressed by the SHA-256 of its canonical JSON, which is what
+    Lighthouse_CPS.report_hash links to.
+
+    When the stored size grows beyond `max_bytes`, the oldest reports are
+    dropped together with the chunks no other report uses.
+
+    Args:
+        db_name (str): The name of the archive SQLite database file.
+        max_bytes (int or None): The size cap of the archive, None for no cap.
+        compression_level (int): The zlib compression level.
+    """
+
+    def __init__(self, db_name: str, max_bytes: Optional[int] = None,
+                 compression_level: int = 6):
+        self.db_name = db_name
+        self.max_bytes = max_bytes
+        self.compression_level = compression_level
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(db_name, timeout=30,
+                                          check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL;')
+        self.connection.execute('PRAGMA synchronous=NORMAL;')
+
+        with self.connection:
+            for statement in ARCHIVE_SCHEMA:
+                self.connection.execute(statement)
+
+        self._stored_bytes = self._measure()
+
+    def __enter__(self) -> 'ReportArchive':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Closes the archive database.
+        """
+        with self._lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def store(self, report: bytes, url: str,
+              timestamp: Optional[str] = None) -> Optional[str]:
+        """
+        Archives a report.
+
+        Args:
+            report (bytes): The report JSON, as written by Lighthouse.
+            url (str): The audited URL.
+            timestamp (str or None): The ISO-8601 timestamp of the run.
+
+        Returns:
+            str or None: The report hash, or None if the report could not be
+            archived.
+        """
+        try:
+            loaded_json = json.loads(report)
+        except ValueError as e:
+            logger.error(f'Could not archive the report for {url}: {e}')
+            return None
+
+        report_hash = hashlib.sha256(_canonical(loaded_json)).hexdigest()
+
+        # chunks are hashed and compressed outside the lock
+        chunks = {}
+        manifest = {'keys': [], 'audits': []}
+
+        for key, value in loaded_json.items():
+            if key == 'audits' and isinstance(value, dict):
+                manifest['keys'].append([key, None])
+                for audit_id, audit in value.items():
+                    manifest['audits'].append([audit_id, self._chunk(audit, chunks)])
+            else:
+                manifest['keys'].append([key, self._chunk(value, chunks)])
+
+        manifest_blob = zlib.compress(_canonical(manifest), self.compression_level)
+
+        with self._lock:
+            try:
+                with self.connection:
+                    existing = {row[0] for row in self.connection.execute(
+                        f"SELECT hash FROM report_chunks WHERE hash IN "
+                        f"({', '.join('?' for _ in chunks)})", tuple(chunks))} \
+                        if chunks else set()
+                    new_chunks = [(chunk_hash, data, len(data))
+                                  for chunk_hash, data in chunks.items()
+                                  if chunk_hash not in existing]
+
+                    self.connection.executemany(
+                        'INSERT OR IGNORE INTO report_chunks (hash, data, size) '
+                        'VALUES (?, ?, ?)', new_chunks)
+                    inserted = self.connection.execute(
+                        'INSERT OR IGNORE INTO reports (report_hash, url, timestamp, '
+                        "manifest, raw_size, created) VALUES (?, ?, ?, ?, ?, "
+                        "CAST(strftime('%s', 'now') AS INTEGER))",
+                        (report_hash, url, timestamp, manifest_blob, len(report))
+                    ).rowcount
+                    self.connection.executemany(
+                        'INSERT OR IGNORE INTO report_chunk_refs '
+                        '(report_hash, chunk_hash) VALUES (?, ?)',
+                        [(report_hash, chunk_hash) for chunk_hash in chunks])
+            except sqlite3.Error as e:
+                logger.error(f'Could not archive the report for {url}: {e}')
+                return None
+
+            self._stored_bytes += sum(size for _, _, size in new_chunks)
+            if inserted:
+                self._stored_bytes += len(manifest_blob)
+
+            if self.max_bytes is not None and self._stored_bytes > self.max_bytes:
+                try:
+                    self._enforce_retention()
+                except sqlite3.Error as e:
+                    # the report is stored, the next one tries again
+                    logger.error(f'Archive retention failed: {e}')
+
+        logger.info(f'Archived report {report_hash[:12]} for {url} '
+                    f'({len(new_chunks)} of {len(chunks)} chunks new)')
+        return report_hash
+
+    def load(self, report_hash: str) -> Optional[bytes]:
+        """
+        Reassembles an archived report.
+
+        Args:
+            report_hash (str): The report hash.
+
+        Returns:
+            bytes or None: The report JSON, or None if it is not archived
+            (anymore).
+        """
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT manifest FROM reports WHERE report_hash = ?',
+                (report_hash,)).fetchone()
+            if row is None:
+                return None
+
+            manifest = json.loads(zlib.decompress(row[0]))
+            wanted = {chunk_hash for _, chunk_hash in manifest['keys'] if chunk_hash}
+            wanted.update(chunk_hash for _, chunk_hash in manifest['audits'])
+            chunks = {}
+            wanted = list(wanted)
+            # stay below SQLite's limit on host parameters
+            for index in range(0, len(wanted), 500):
+                batch = wanted[index:index + 500]
+                chunks.update(self.connection.execute(
+                    f"SELECT hash, data FROM report_chunks WHERE hash IN "
+                    f"({', '.join('?' for _ in batch)})", tuple(batch)).fetchall())
+
+        def value(chunk_hash):
+            return json.loads(zlib.decompress(chunks[chunk_hash]))
+
+        loaded_json = {}
+        for key, chunk_hash in manifest['keys']:
+            if chunk_hash is None:
+                loaded_json[key] = {audit_id: value(audit_hash)
+                                    for audit_id, audit_hash in manifest['audits']}
+            else:
+                loaded_json[key] = value(chunk_hash)
+
+        return _canonical(loaded_json)
+
+    def find(self, url: str, start: Optional[str] = None,
+             end: Optional[str] = None) -> List[Tuple[str, str]]:
+        """
+        Lists the archived reports of a URL, oldest first.
+
+        Args:
+            url (str): The audited URL.
+            start (str or None): The inclusive ISO-8601 lower bound.
+            end (str or None): The exclusive ISO-8601 upper bound.
+
+        Returns:
+            list: (timestamp, report_hash) tuples.
+        """
+        query = 'SELECT timestamp, report_hash FROM reports WHERE url = ? AND timestamp >= ?'
+        parameters = [url, start or '']
+
+        if end is not None:
+            query += ' AND timestamp < ?'
+            parameters.append(end)
+
+        with self._lock:
+            return self.connection.execute(query + ' ORDER BY timestamp',
+                                           tuple(parameters)).fetchall()
+
+    def stored_bytes(self) -> int:
+        """
+        Returns:
+            int: The compressed size of every stored chunk and manifest.
+        """
+        with self._lock:
+            return self._stored_bytes
+
+    def _chunk(self, value, chunks: dict) -> str:
+        data = _canonical(value)
+        chunk_hash = hashlib.sha256(data).hexdigest()
+        if chunk_hash not in chunks:
+            chunks[chunk_hash] = zlib.compress(data, self.compression_level)
+        return chunk_hash
+
+    def _measure(self) -> int:
+        chunk_bytes = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM report_chunks').fetchone()[0]
+        manifest_bytes = self.connection.execute(
+            'SELECT COALESCE(SUM(LENGTH(manifest)), 0) FROM reports').fetchone()[0]
+        return chunk_bytes + manifest_bytes
+
+    def _enforce_retention(self):
+        """
+        Drops the oldest reports, and the chunks only they used, until the
+        archive fits in `max_bytes`. The caller must hold the lock.
+        """
+        dropped = 0
+
+        while self._stored_bytes > self.max_bytes:
+            total = self.connection.execute('SELECT COUNT(*) FROM reports').fetchone()[0]
+            if total <= 1:
+                break
+
+            # drop a tenth of the reports per round, the oldest first
+            oldest = [row[0] for row in self.connection.execute(
+                'SELECT report_hash FROM reports ORDER BY created, timestamp LIMIT ?',
+                (max(1, total // 10),))]
+
+            with self.connection:
+                self.connection.executemany(
+                    'DELETE FROM reports WHERE report_hash = ?',
+                    [(report_hash,) for report_hash in oldest])
+                self.connection.executemany(
+                    'DELETE FROM report_chunk_refs WHERE report_hash = ?',
+                    [(report_hash,) for report_hash in oldest])
+                self.connection.execute(
+                    'DELETE FROM report_chunks WHERE NOT EXISTS ('
+                    'SELECT 1 FROM report_chunk_refs '
+                    'WHERE report_chunk_refs.chunk_hash = report_chunks.hash)')
+
+            dropped += len(oldest)
+            self._stored_bytes = self._measure()
+
+        if dropped:
+            logger.info(f'Archive retention dropped {dropped} reports, '
+                        f'{self._stored_bytes} bytes stored')
@@ -0,0 +1,275 @@
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# the export formats and their file extensions
+EXPORT_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+# the watermark of an export, kept next to the files it describes, so an
+# export directory that is deleted (or moved) is simply written again
+STATE_FILE = '_export_state.json'
+
+# the partition directory of rows without an environment or timestamp, which
+# Hive-partitioned readers read back as null
+HIVE_NULL = '__HIVE_DEFAULT_PARTITION__'
+
+# the Arrow types of the SQLite declared types
+ARROW_TYPES = {'INTEGER': 'int64', 'REAL': 'float64', 'TEXT': 'string'}
+
+# the child tables exported with their Lighthouse_CPS rows: the rows of the
+# results from the first to the last id, and the (name, Arrow type) of each
+# column; the first column is the Lighthouse_CPS id
+CHILD_TABLES = {
+    'stage_timings': (
+        'SELECT result_id, run_id, stage, calls, milliseconds FROM Stage_Timings '
+        'WHERE result_id BETWEEN ? AND ? ORDER BY result_id, stage;',
+        [('result_id', 'int64'), ('run_id', 'int64'), ('stage', 'string'),
+         ('calls', 'int64'), ('milliseconds', 'float64')]),
+    'network_requests': (
+        'SELECT n.result_id, n.seq, u.url, h.host, n.resource_type, n.mime_type, '
+        'n.status_code, n.protocol, n.transfer_size, n.resource_size, '
+        'n.start_time, n.duration FROM Network_Requests AS n '
+        'JOIN Resource_Urls AS u ON u.id = n.url_id '
+        'JOIN Resource_Hosts AS h ON h.id = u.host_id '
+        'WHERE n.result_id BETWEEN ? AND ? ORDER BY n.result_id, n.seq;',
+        [('result_id', 'int64'), ('seq', 'int64'), ('url', 'string'),
+         ('host', 'string'), ('resource_type', 'string'), ('mime_type', 'string'),
+         ('status_code', 'int64'), ('protocol', 'string'),
+         ('transfer_size', 'int64'), ('resource_size', 'int64'),
+         ('start_time', 'float64'), ('duration', 'float64')]),
+    'resource_summary': (
+        'SELECT result_id, resource_type, request_count, transfer_size '
+        'FROM Resource_Summary WHERE result_id BETWEEN ? AND ? '
+        'ORDER BY result_id, resource_type;',
+        [('result_id', 'int64'), ('resource_type', 'string'),
+         ('request_count', 'int64'), ('transfer_size', 'int64')]),
+}
+
+
+def partition_key(environment: Optional[str], timestamp: Optional[str]) -> Tuple[str, str]:
+    """
+    Returns:
+        tuple: The (environment, month) directory names of a Lighthouse_CPS
+        row, e.g. ('PROD', '2024-03'), URI-encoded as Hive partitioning
+        expects; missing values become the Hive null partition.
+    """
+    return (quote(environment, safe='') if environment else HIVE_NULL,
+            timestamp[:7] if timestamp else HIVE_NULL)
+
+
+def result_columns(connection: sqlite3.Connection) -> List[Tuple[str, str]]:
+    """
+    Returns:
+        list: The (name, Arrow type) of every Lighthouse_CPS column, so
+        columns added by later migrations are exported too.
+    """
+    return [(name, ARROW_TYPES.get(declared.upper(), 'string'))
+            for name, declared in connection.execute(
+                'SELECT name, type FROM pragma_table_info(?) ORDER BY cid;',
+                ('Lighthouse_CPS',))]
+
+
+def read_state(directory: str) -> dict:
+    """
+    Returns:
+        dict: The 'format' and 'last_id' of the previous export into the
+        directory, or an empty dict if there was none.
+    """
+    try:
+        with open(os.path.join(directory, STATE_FILE)) as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return {}
+
+
+class HistoryExporter:
+    """
+    Exports Lighthouse_CPS, with its stage timings, network requests and
+    resource summaries, to compressed Parquet or Arrow IPC files for
+    columnar analysis.
+
+    Every table gets a directory of Hive-style partitions by environment and
+    month, e.g. 'lighthouse_cps/environment=PROD/month=2024-03/', which
+    pyarrow.dataset, pandas, DuckDB and Spark read as columns. Network
+    requests carry their resource URL and host instead of the ids.
+
+    Exports are incremental: rows are read in chunks in id order, every
+    chunk adds new files named after the id range they hold, and the last
+    exported id is saved after each chunk. Rows are written with their child
+    rows in one transaction, so the child rows of an exported id are final.
+    pyarrow is only needed here and is imported on first use.
+
+    Args:
+        connection (sqlite3.Connection): An open, migrated connection.
+        directory (str): The export directory.
+        file_format (str): 'parquet' or 'arrow'.
+        chunk_size (int): The Lighthouse_CPS rows read at a time.
+        compression (str): The codec, 'zstd', 'lz4' or 'none'.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, directory: str,
+                 file_format: str = 'parquet', chunk_size: int = 50000,
+                 compression: str = 'zstd'):
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f'Unknown export format: {file_format}')
+
+        import pyarrow
+
+        self.pa = pyarrow
+        self.connection = connection
+        self.directory = str(directory)
+        self.file_format = file_format
+        self.chunk_size = max(1, chunk_size)
+        self.compression = None if compression == 'none' else compression
+
+    def export(self) -> Dict[str, int]:
+        """
+        Writes every row added since the previous export.
+
+        Returns:
+            dict: The rows written per table, and 'last_id', the last
+            exported Lighthouse_CPS id.
+        """
+        state = read_state(self.directory)
+        if state.get('format', self.file_format) != self.file_format:
+            raise ValueError(f"{self.directory} holds a {state['format']} export")
+
+        last_id = state.get('last_id', 0)
+        columns = result_columns(self.connection)
+        names = [name for name, _ in columns]
+        environment, timestamp = names.index('environment'), names.index('timestamp')
+        exported = dict.fromkeys(['lighthouse_cps', *CHILD_TABLES], 0)
+
+        while True:
+            rows = self.connection.execute(
+                f"SELECT {', '.join(names)} FROM Lighthouse_CPS "
+                f"WHERE id > ? ORDER BY id LIMIT ?;",
+                (last_id, self.chunk_size)).fetchall()
+            if not rows:
+                break
+
+            partition_of = {row[0]: partition_key(row[environment], row[timestamp])
+                            for row in rows}
+            exported['lighthouse_cps'] += self._write_partitions(
+                'lighthouse_cps', columns, rows, partition_of)
+
+            for table, (query, child_columns) in CHILD_TABLES.items():
+                child_rows = self.connection.execute(query, (rows[0][0], rows[-1][0])).fetchall()
+                exported[table] += self._write_partitions(table, child_columns,
+                                                          child_rows, partition_of)
+
+            last_id = rows[-1][0]
+            self._write_state(last_id)
+            logger.info(f'Exported Lighthouse_CPS rows up to id {last_id}')
+
+            if len(rows) < self.chunk_size:
+                break
+
+        exported['last_id'] = last_id
+        return exported
+
+    def _write_partitions(self, table: str, columns: List[Tuple[str, str]],
+                          rows: List[Tuple], partition_of: Dict[int, Tuple[str, str]]) -> int:
+        """
+        Writes rows (whose first column is a Lighthouse_CPS id) to one file
+        per partition.
+
+        Returns:
+            int: The number of rows written.
+        """
+        partitions = {}
+        for row in rows:
+            partitions.setdefault(partition_of[row[0]], []).append(row)
+
+        for (environment, month), partition_rows in partitions.items():
+            directory = os.path.join(self.directory, table, f'environment={environment}',
+                                     f'month={month}')
+            name = (f'part-{partition_rows[0][0]:012d}-{partition_rows[-1][0]:012d}'
+                    f'{EXPORT_FORMATS[self.file_format]}')
+            self._write_file(os.path.join(directory, name),
+                             self._table(columns, partition_rows))
+
+        return len(rows)
+
+    def _table(self, columns: List[Tuple[str, str]], rows: List[Tuple]):
+        """
+        Returns:
+            pyarrow.Table: The rows, transposed into typed columns.
+        """
+        pa = self.pa
+        arrays = []
+
+        for (name, arrow_type), values in zip(columns, zip(*rows)):
+            arrow_type = getattr(pa, arrow_type)()
+            try:
+                # a safe cast, so a REAL in an INTEGER column is not truncated
+                arrays.append(pa.array(values).cast(arrow_type, safe=True))
+            except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+                # SQLite does not enforce the declared types
+                arrays.append(pa.array([_coerce(value, arrow_type, pa) for value in values],
+                                       type=arrow_type))
+                logger.debug(f'Coerced the values of {name} to {arrow_type}')
+
+        return pa.Table.from_arrays(
+            arrays, schema=pa.schema([(name, getattr(pa, arrow_type)())
+                                      for name, arrow_type in columns]))
+
+    def _write_file(self, path: str, table):
+        """
+        Writes a table to a temporary file that is then renamed, so a reader
+        never sees half a file.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path),
+                                                 prefix='.part.', suffix='.tmp')
+        os.close(descriptor)
+
+        try:
+            if self.file_format == 'parquet':
+                import pyarrow.parquet
+
+                pyarrow.parquet.write_table(table, temporary,
+                                            compression=self.compression or 'none')
+            else:
+                import pyarrow.ipc
+
+                options = pyarrow.ipc.IpcWriteOptions(compression=self.compression)
+                with pyarrow.ipc.new_file(temporary, table.schema, options=options) as writer:
+                    writer.write_table(table)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+
+    def _write_state(self, last_id: int):
+        path = os.path.join(self.directory, STATE_FILE)
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = f'{path}.tmp'
+
+        with open(temporary, 'w') as state_file:
+            json.dump({'format': self.file_format, 'last_id': last_id}, state_file)
+        os.replace(temporary, path)
+
+
+def _coerce(value, arrow_type, pa):
+    """
+    Converts a value to an Arrow type: numbers in integer columns are
+    rounded, values that are not numbers in numeric columns become None.
+    """
+    if value is None:
+        return None
+
+    try:
+        if arrow_type == pa.string():
+            return str(value)
+        number = float(value)
+        return round(number) if arrow_type == pa.int64() else number
+    except (TypeError, ValueError, OverflowError):
+        return None
@@ -0,0 +1,272 @@
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL,
+        description TEXT,
+        profile TEXT,
+        priority INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 3,
+        lease_owner TEXT,
+        lease_expires REAL,
+        enqueued REAL NOT NULL,
+        started REAL,
+        finished REAL,
+        last_error TEXT
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_status_priority ON jobs (status, priority DESC, id)',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_status_lease ON jobs (status, lease_expires)',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_url_status ON jobs (url, status)',
+]
+
+# columns added to the jobs table since it was created, added to a queue
+# database that is older
+QUEUE_COLUMNS = [
+    ('profile', 'TEXT'),
+]
+
+# job states: 'queued' -> 'leased' -> 'done', or back to 'queued' after a
+# failed attempt, or 'failed' once max_attempts are used up
+ACTIVE_STATUSES = ('queued', 'leased')
+
+
+class Job(NamedTuple):
+    """
+    A job claimed by a worker.
+    """
+    id: int
+    url: str
+    description: str
+    attempt: int
+    profile: Optional[str]
+
+
+class JobQueue:
+    """
+    A durable queue of URL jobs in SQLite, shared by a coordinator and any
+    number of worker processes.
+
+    A worker claims jobs with a lease that expires `lease_seconds` later and
+    renews it (heartbeat) while the job runs. A job whose lease expired, its
+    worker having crashed or lost its connection, is claimed again by the
+    next worker, until it has been attempted `max_attempts` times. Claiming
+    is a single UPDATE ... RETURNING in an immediate transaction, so two
+    workers never claim the same job.
+
+    SQLite is meant for workers on one machine or for testing; workers on
+    several machines need the database on storage they can all lock.
+
+    Args:
+        db_name (str): The name of the queue SQLite database file.
+        lease_seconds (float): How long a claim is valid without a heartbeat.
+    """
+
+    def __init__(self, db_name: str, lease_seconds: float = 600):
+        self.db_name = db_name
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(db_name, timeout=30,
+                                          check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL;')
+        self.connection.execute('PRAGMA synchronous=NORMAL;')
+        self.connection.execute('PRAGMA busy_timeout=30000;')
+
+        for statement in QUEUE_SCHEMA:
+            self.connection.execute(statement)
+
+        existing = {row[0] for row in self.connection.execute(
+            "SELECT name FROM pragma_table_info('jobs')")}
+        for column, declared in QUEUE_COLUMNS:
+            if column not in existing:
+                self.connection.execute(f'ALTER TABLE jobs ADD COLUMN {column} {declared}')
+
+    def __enter__(self) -> 'JobQueue':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Closes the queue database.
+        """
+        with self._lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def enqueue(self, records: Iterable[Tuple], max_attempts: int = 3) -> int:
+        """
+        Adds jobs, skipping URLs that are already queued or running with the
+        same audit profile.
+
+        Args:
+            records (iterable): (url, description) pairs, or (url,
+            description, interval, priority, profile) tuples as
+            DataDrive.iter_schedule yields; a None profile is the worker's.
+            max_attempts (int): The number of times a job is tried.
+
+        Returns:
+            int: The number of jobs added.
+        """
+        now = time.time()
+        rows = []
+        for record in records:
+            url, description = record[0], record[1]
+            priority = record[3] if len(record) > 3 else 0
+            profile = record[4] if len(record) > 4 else None
+            rows.append((url, description, profile, priority, max_attempts, now,
+                         url, profile))
+
+        with self._lock, self._transaction():
+            before = self.connection.total_changes
+            self.connection.executemany(
+                f"INSERT INTO jobs (url, description, profile, priority, max_attempts, "
+                f"enqueued) SELECT ?, ?, ?, ?, ?, ? WHERE NOT EXISTS ("
+                f"SELECT 1 FROM jobs WHERE url = ? AND profile IS ? AND status IN "
+                f"({', '.join('?' for _ in ACTIVE_STATUSES)}))",
+                [row + ACTIVE_STATUSES for row in rows])
+            added = self.connection.total_changes - before
+
+        logger.info(f'Enqueued {added} of {len(rows)} jobs')
+        return added
+
+    def claim(self, worker: str, limit: int = 1) -> List[Job]:
+        """
+        Leases up to `limit` jobs, the highest priority and oldest first.
+        Jobs whose lease expired are claimed again, or failed if they have
+        no attempts left.
+
+        Args:
+            worker (str): The name of the claiming worker.
+            limit (int): The maximum number of jobs.
+
+        Returns:
+            list: The claimed jobs.
+        """
+        now = time.time()
+
+        with self._lock, self._transaction():
+            self.connection.execute(
+                "UPDATE jobs SET status = 'failed', finished = ?, lease_owner = NULL, "
+                "last_error = 'lease expired after the last attempt' "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= max_attempts",
+                (now, now))
+            rows = self.connection.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, started = ? "
+                "WHERE id IN ("
+                "SELECT id FROM jobs WHERE status = 'queued' "
+                "OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY priority DESC, id LIMIT ?) "
+                "RETURNING id, url, description, attempts, profile",
+                (worker, now + self.lease_seconds, now, now, limit)).fetchall()
+
+        jobs = sorted((Job(*row) for row in rows), key=lambda job: job.id)
+        for job in jobs:
+            if job.attempt > 1:
+                logger.info(f'{worker} reclaimed job {job.id} ({job.url}), '
+                            f'attempt {job.attempt}')
+        return jobs
+
+    def heartbeat(self, worker: str, job_ids: Iterable[int]) -> List[int]:
+        """
+        Extends the leases of running jobs.
+
+        Args:
+            worker (str): The name of the worker holding the leases.
+            job_ids (iterable): The ids of its running jobs.
+
+        Returns:
+            list: The ids whose lease was lost (expired and claimed by
+            another worker); their results will not be reported.
+        """
+        job_ids = list(job_ids)
+        if not job_ids:
+            return []
+
+        expires = time.time() + self.lease_seconds
+        with self._lock, self._transaction():
+            renewed = {row[0] for row in self.connection.execute(
+                f"UPDATE jobs SET lease_expires = ? WHERE lease_owner = ? "
+                f"AND status = 'leased' AND id IN ({', '.join('?' for _ in job_ids)}) "
+                f"RETURNING id", (expires, worker, *job_ids)).fetchall()}
+
+        lost = [job_id for job_id in job_ids if job_id not in renewed]
+        if lost:
+            logger.warning(f'{worker} lost the lease of jobs {lost}')
+        return lost
+
+    def complete(self, worker: str, job_id: int) -> bool:
+        """
+        Marks a job done.
+
+        Returns:
+            bool: False if the worker no longer held the lease.
+        """
+        with self._lock, self._transaction():
+            return self.connection.execute(
+                "UPDATE jobs SET status = 'done', finished = ?, lease_owner = NULL, "
+                "last_error = NULL WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (time.time(), job_id, worker)).rowcount == 1
+
+    def fail(self, worker: str, job_id: int, error: str) -> bool:
+        """
+        Records a failed attempt; the job is queued again while it has
+        attempts left.
+
+        Returns:
+            bool: False if the worker no longer held the lease.
+        """
+        with self._lock, self._transaction():
+            return self.connection.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < max_attempts "
+                "THEN 'queued' ELSE 'failed' END, finished = ?, lease_owner = NULL, "
+                "lease_expires = NULL, last_error = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (time.time(), error, job_id, worker)).rowcount == 1
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Returns:
+            dict: The number of jobs in each status.
+        """
+        with self._lock:
+            return dict(self.connection.execute(
+                'SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+
+    def pending(self) -> int:
+        """
+        Returns:
+            int: The number of queued and running jobs.
+        """
+        counts = self.counts()
+        return sum(counts.get(status, 0) for status in ACTIVE_STATUSES)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        BEGIN IMMEDIATE ... COMMIT, or ROLLBACK on an exception. Taking the
+        write lock up front means the rows a statement reads cannot change
+        before it writes them. The caller must hold the lock.
+        """
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
@@ -0,0 +1,229 @@
+import logging
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# longer resource URLs (inline data: URLs mostly) are cut to this length
+MAX_RESOURCE_URL_LENGTH = 2048
+
+# resource URLs looked up in a single query
+LOOKUP_CHUNK = 500
+
+# the Network_Requests columns top resources can be ranked by
+RANKINGS = {
+    'size': 'transfer_size',
+    'duration': 'duration',
+}
+
+INSERT_NETWORK_REQUEST_QUERY = (
+    "INSERT OR REPLACE INTO Network_Requests (result_id, seq, url_id, resource_type, "
+    "mime_type, status_code, protocol, transfer_size, resource_size, start_time, "
+    "duration) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"
+)
+
+INSERT_RESOURCE_SUMMARY_QUERY = (
+    "INSERT OR REPLACE INTO Resource_Summary (result_id, resource_type, "
+    "request_count, transfer_size) VALUES (?, ?, ?, ?);"
+)
+
+
+def resource_host(url: str) -> str:
+    """
+    Returns:
+        str: The host (with port) of a resource URL, or its scheme for URLs
+        without one, e.g. 'data'.
+    """
+    parts = urlsplit(url)
+    return parts.netloc or parts.scheme or ''
+
+
+def network_request_rows(url_data: dict) -> List[Tuple]:
+    """
+    Converts the 'network_requests' of URL data into rows for the
+    Network_Requests table, without the result and URL ids.
+
+    Args:
+        url_data (dict): A dictionary containing URL data.
+
+    Returns:
+        list: (url, resource_type, mime_type, status_code, protocol,
+        transfer_size, resource_size, start_time, duration) tuples.
+    """
+    return [((request.get('url') or '')[:MAX_RESOURCE_URL_LENGTH],
+             request.get('resource_type'), request.get('mime_type'),
+             request.get('status_code'), request.get('protocol'),
+             request.get('transfer_size'), request.get('resource_size'),
+             request.get('start_time'), request.get('duration'))
+            for request in url_data.get('network_requests') or ()]
+
+
+def resource_summary_rows(url_data: dict) -> List[Tuple]:
+    """
+    Converts the 'resource_summary' of URL data into rows for the
+    Resource_Summary table, without the result id.
+
+    Returns:
+        list: (resource_type, request_count, transfer_size) tuples.
+    """
+    return [(summary.get('resource_type'), summary.get('request_count'),
+             summary.get('transfer_size'))
+            for summary in url_data.get('resource_summary') or ()
+            if summary.get('resource_type') is not None]
+
+
+class ResourceInterner:
+    """
+    Stores every resource URL and host once, in Resource_Urls and
+    Resource_Hosts, so Network_Requests rows only hold an integer id. The
+    same bundles are requested on every evaluation of a page, so known ids
+    are cached and most batches need no lookup at all.
+
+    Args:
+        max_cached (int): The cache is emptied once it holds this many URLs.
+    """
+
+    def __init__(self, max_cached: int = 100000):
+        self.max_cached = max_cached
+        self._ids = {}
+
+    def clear(self):
+        """
+        Forgets the cached ids; called when a transaction that may have
+        added some is rolled back.
+        """
+        self._ids.clear()
+
+    def ids(self, connection, urls: Iterable[str]) -> Dict[str, int]:
+        """
+        Returns the ids of resource URLs, adding the new ones.
+
+        Args:
+            connection (sqlite3.Connection or sqlite3.Cursor): A connection in
+            the transaction the requests are inserted in.
+            urls (iterable): The resource URLs.
+
+        Returns:
+            dict: Each URL mapped to its id.
+        """
+        urls = set(urls)
+        missing = [url for url in urls if url not in self._ids]
+
+        if missing:
+            if len(self._ids) + len(missing) > self.max_cached:
+                # start over, looking up every URL of the batch again
+                self._ids.clear()
+                missing = list(urls)
+
+            hosts = [(url, resource_host(url)) for url in missing]
+            connection.executemany('INSERT OR IGNORE INTO Resource_Hosts (host) VALUES (?);',
+                                   [(host,) for host in {host for _, host in hosts}])
+            connection.executemany(
+                'INSERT OR IGNORE INTO Resource_Urls (url, host_id) '
+                'SELECT ?, id FROM Resource_Hosts WHERE host = ?;', hosts)
+
+            for start in range(0, len(missing), LOOKUP_CHUNK):
+                chunk = missing[start:start + LOOKUP_CHUNK]
+                self._ids.update(connection.execute(
+                    f"SELECT url, id FROM Resource_Urls "
+                    f"WHERE url IN ({', '.join('?' for _ in chunk)});", chunk).fetchall())
+
+        return {url: self._ids[url] for url in urls}
+
+
+def insert_resources(connection, interner: ResourceInterner,
+                     results: Iterable[Tuple[int, List[Tuple], List[Tuple]]]):
+    """
+    Inserts the network requests and resource summaries of Lighthouse_CPS
+    rows, with one executemany per table for the whole batch.
+
+    Args:
+        connection (sqlite3.Connection or sqlite3.Cursor): Where to insert.
+        interner (ResourceInterner): Turns resource URLs into ids.
+        results (iterable): (result_id, network request rows, resource
+        summary rows) tuples, see network_request_rows and
+        resource_summary_rows.
+    """
+    requests = []
+    summaries = []
+
+    for result_id, request_rows, summary_rows in results:
+        requests += [(result_id, seq, *row) for seq, row in enumerate(request_rows)]
+        summaries += [(result_id, *row) for row in summary_rows]
+
+    if requests:
+        ids = interner.ids(connection, (row[2] for row in requests))
+        connection.executemany(INSERT_NETWORK_REQUEST_QUERY,
+                               [(result_id, seq, ids[url], *rest)
+                                for result_id, seq, url, *rest in requests])
+    if summaries:
+        connection.executemany(INSERT_RESOURCE_SUMMARY_QUERY, summaries)
+
+
+def fetch_top_resources(connection: sqlite3.Connection, url: str, by: str = 'size',
+                        limit: int = 10, evaluations: int = 20,
+                        environment: Optional[str] = None, start: Optional[str] = None,
+                        end: Optional[str] = None,
+                        profile: Optional[str] = None) -> List[dict]:
+    """
+    Reads the heaviest or slowest resources of each evaluation of a page.
+
+    Args:
+        connection (sqlite3.Connection): An open connection.
+        url (str): The page URL.
+        by (str): 'size' (transfer size) or 'duration'.
+        limit (int): The resources per evaluation.
+        evaluations (int): The latest evaluations read.
+        environment (str or None): Only this environment, every environment
+        if None.
+        start (str or None): The inclusive lower bound of the timestamp.
+        end (str or None): The exclusive upper bound of the timestamp.
+        profile (str or None): Only evaluations with this audit profile,
+        every profile if None.
+
+    Returns:
+        list: One dict per resource, oldest evaluation first and by rank,
+        with 'timestamp', 'environment', 'audit_profile', 'version', 'rank',
+        'url', 'host', 'resource_type', 'transfer_size', 'resource_size' and
+        'duration'.
+    """
+    if by not in RANKINGS:
+        raise ValueError(f'Unknown ranking: {by}')
+
+    conditions = ['url = ?']
+    parameters = [url]
+    for condition, value in (('environment = ?', environment),
+                             ('audit_profile = ?', profile),
+                             ('timestamp >= ?', start), ('timestamp < ?', end)):
+        if value is not None:
+            conditions.append(condition)
+            parameters.append(value)
+
+    rows = connection.execute(f'''
+        WITH results AS (
+            SELECT id, timestamp, environment, audit_profile, version
+            FROM Lighthouse_CPS
+            WHERE {' AND '.join(conditions)}
+            ORDER BY timestamp DESC LIMIT ?
+        ), ranked AS (
+            SELECT n.result_id, n.url_id, n.resource_type, n.transfer_size,
+                   n.resource_size, n.duration,
+                   ROW_NUMBER() OVER (PARTITION BY n.result_id
+                                      ORDER BY n.{RANKINGS[by]} DESC) AS rank
+            FROM Network_Requests AS n JOIN results AS r ON r.id = n.result_id
+            WHERE n.{RANKINGS[by]} IS NOT NULL
+        )
+        SELECT r.timestamp, r.environment, r.audit_profile, r.version, k.rank,
+               u.url, h.host, k.resource_type, k.transfer_size, k.resource_size, k.duration
+        FROM ranked AS k
+        JOIN results AS r ON r.id = k.result_id
+        JOIN Resource_Urls AS u ON u.id = k.url_id
+        JOIN Resource_Hosts AS h ON h.id = u.host_id
+        WHERE k.rank <= ?
+        ORDER BY r.timestamp, r.id, k.rank;
+    ''', (*parameters, evaluations, limit)).fetchall()
+
+    keys = ('timestamp', 'environment', 'audit_profile', 'version', 'rank', 'url', 'host',
+            'resource_type', 'transfer_size', 'resource_size', 'duration')
+    return [dict(zip(keys, row)) for row in rows]
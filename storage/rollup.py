@@ -0,0 +1,307 @@
+import functools
+import logging
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+from metrics.histogram import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# the Lighthouse_CPS columns that are rolled up
+ROLLUP_METRICS = [
+    'performance_score', 'accessibility_score', 'best_practices_score',
+    'seo_score', 'first_contentful_paint', 'speed_index',
+    'largest_contentful_paint', 'cumulative_layout_shift',
+    'total_blocking_time', 'time_to_interactive', 'start_transfer_time',
+    'total_time',
+]
+
+# granularity: (table, key columns)
+ROLLUP_TABLES = {
+    'hour': ('Rollup_Hourly', ['hour']),
+    'day': ('Rollup_Daily', ['day']),
+    'version': ('Rollup_Version', ['version', 'branch']),
+}
+
+# the name of the Lighthouse_CPS watermark in Rollup_State
+WATERMARK = 'Lighthouse_CPS'
+
+
+def rollup_keys(timestamp: Optional[str], version: str, branch: str) -> Dict[str, Tuple]:
+    """
+    Returns:
+        dict: The key of a row in each rollup table, by granularity; rows
+        without a timestamp are only rolled up per version.
+    """
+    keys = {'version': (version, branch)}
+    if timestamp:
+        keys['hour'] = (f'{timestamp[:13]}:00:00',)
+        keys['day'] = (timestamp[:10],)
+    return keys
+
+
+class _Rollup:
+    """
+    The count, sum, extremes and percentile sketch of one metric in one
+    bucket. LatencyHistogram is a general log-linear sketch, so it is reused
+    for every metric (milliseconds, scores and layout shift alike); values
+    keep three decimals and percentiles are within 1%.
+    """
+
+    def __init__(self, sketch=None, first_seen=None, last_seen=None):
+        self.sketch = sketch or LatencyHistogram()
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+
+    def add(self, value, timestamp):
+        self.sketch.record(value)
+        if timestamp:
+            self.first_seen = min(self.first_seen or timestamp, timestamp)
+            self.last_seen = max(self.last_seen or timestamp, timestamp)
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        for seen in (other.first_seen, other.last_seen):
+            if seen:
+                self.first_seen = min(self.first_seen or seen, seen)
+                self.last_seen = max(self.last_seen or seen, seen)
+
+    def row(self):
+        sketch = self.sketch
+        return (sketch.total_count, sketch.total_value / 1000,
+                None if sketch.min_value is None else sketch.min_value / 1000,
+                None if sketch.max_value is None else sketch.max_value / 1000,
+                sketch.to_json(), self.first_seen, self.last_seen)
+
+
+def update_rollups(connection: sqlite3.Connection, chunk_size: int = 5000,
+                   max_rows: Optional[int] = None) -> int:
+    """
+    Adds the Lighthouse_CPS rows written since the last call to the rollup
+    tables.
+
+    Rows are read after the id kept in Rollup_State, and the rollups and
+    the new watermark are committed together, so every row is counted
+    exactly once however often (or from however many processes) this runs.
+    Every audit profile is rolled up apart, as the metrics of e.g. mobile
+    emulation are not comparable with the desktop ones.
+
+    Args:
+        connection (sqlite3.Connection): An open, migrated connection with no
+        transaction in progress.
+        chunk_size (int): The number of rows per transaction.
+        max_rows (int or None): Stop after about this many rows, so a
+        backlog (e.g. the first run on an existing database) is worked off
+        a little at a time; None processes every new row.
+
+    Returns:
+        int: The number of rows rolled up.
+    """
+    processed = 0
+
+    while max_rows is None or processed < max_rows:
+        limit = chunk_size if max_rows is None else min(chunk_size, max_rows - processed)
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            last_id = _watermark(connection)
+            rows = connection.execute(
+                f"SELECT id, url, COALESCE(environment, ''), "
+                f"COALESCE(audit_profile, ''), timestamp, "
+                f"COALESCE(version, ''), COALESCE(branch, ''), "
+                f"{', '.join(ROLLUP_METRICS)} "
+                f"FROM Lighthouse_CPS WHERE id > ? ORDER BY id LIMIT ?;",
+                (last_id, limit)).fetchall()
+
+            if rows:
+                _apply(connection, _aggregate(rows))
+                connection.execute(
+                    'INSERT OR REPLACE INTO Rollup_State (name, last_id) VALUES (?, ?);',
+                    (WATERMARK, rows[-1][0]))
+            connection.commit()
+        except sqlite3.Error:
+            connection.rollback()
+            raise
+
+        processed += len(rows)
+        if len(rows) < limit:
+            break
+
+    if processed:
+        logger.debug(f'Rolled up {processed} rows')
+    return processed
+
+
+def rebuild_rollups(connection: sqlite3.Connection) -> int:
+    """
+    Empties the rollup tables and rolls up every Lighthouse_CPS row again.
+
+    Returns:
+        int: The number of rows rolled up.
+    """
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        for table, _ in ROLLUP_TABLES.values():
+            connection.execute(f'DELETE FROM {table};')
+        connection.execute('DELETE FROM Rollup_State WHERE name = ?;', (WATERMARK,))
+        connection.commit()
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+
+    return update_rollups(connection)
+
+
+def fetch_trend(connection: sqlite3.Connection, url: str, metric: str,
+                granularity: str = 'day', environment: Optional[str] = None,
+                start: Optional[str] = None, end: Optional[str] = None,
+                percentiles=(50, 90, 99), profile: Optional[str] = None) -> List[dict]:
+    """
+    Reads the trend of one metric of a URL from the rollups, never from
+    Lighthouse_CPS.
+
+    Args:
+        connection (sqlite3.Connection): An open connection.
+        url (str): The URL.
+        metric (str): One of ROLLUP_METRICS.
+        granularity (str): 'hour', 'day' or 'version'.
+        environment (str or None): Only this environment, every environment
+        if None.
+        start (str or None): The inclusive lower bound of the hour or day.
+        end (str or None): The exclusive upper bound of the hour or day.
+        percentiles (tuple): The percentiles read from each sketch.
+        profile (str or None): Only this audit profile, every profile if
+        None.
+
+    Returns:
+        list: One dict per bucket, environment and audit profile, oldest
+        first, with the key columns, 'environment', 'audit_profile',
+        'count', 'mean', 'min', 'max', 'first_seen', 'last_seen' and
+        'p<percentile>' values.
+    """
+    if metric not in ROLLUP_METRICS:
+        raise ValueError(f'Unknown metric: {metric}')
+    if granularity not in ROLLUP_TABLES:
+        raise ValueError(f'Unknown granularity: {granularity}')
+
+    table, key_columns = ROLLUP_TABLES[granularity]
+    query = (f"SELECT environment, audit_profile, {', '.join(key_columns)}, count, "
+             f"total, min, max, first_seen, last_seen, sketch FROM {table} "
+             f"WHERE url = ? AND metric = ?")
+    parameters = [url, metric]
+
+    if environment is not None:
+        query += ' AND environment = ?'
+        parameters.append(environment)
+    if profile is not None:
+        query += ' AND audit_profile = ?'
+        parameters.append(profile)
+    if granularity != 'version':
+        if start is not None:
+            query += f' AND {key_columns[0]} >= ?'
+            parameters.append(start)
+        if end is not None:
+            query += f' AND {key_columns[0]} < ?'
+            parameters.append(end)
+
+    order = 'first_seen' if granularity == 'version' else key_columns[0]
+    trend = []
+
+    for row in connection.execute(f'{query} ORDER BY {order}, environment, audit_profile;',
+                                  parameters):
+        environment_name, profile_name = row[:2]
+        keys = row[2:2 + len(key_columns)]
+        count, total, minimum, maximum, first_seen, last_seen, sketch = \
+            row[2 + len(key_columns):]
+        histogram = LatencyHistogram.from_json(sketch)
+
+        point = dict(zip(key_columns, keys))
+        point.update({
+            'environment': environment_name,
+            'audit_profile': profile_name,
+            'count': count,
+            'mean': round(total / count, 3) if count else None,
+            'min': minimum,
+            'max': maximum,
+            'first_seen': first_seen,
+            'last_seen': last_seen,
+        })
+        for q in percentiles:
+            point[f'p{q:g}'] = histogram.percentile(q)
+        trend.append(point)
+
+    return trend
+
+
+def _watermark(connection: sqlite3.Connection) -> int:
+    row = connection.execute('SELECT last_id FROM Rollup_State WHERE name = ?;',
+                             (WATERMARK,)).fetchone()
+    return row[0] if row else 0
+
+
+def _aggregate(rows: List[Tuple]) -> Dict[Tuple, _Rollup]:
+    """
+    Groups new rows by (granularity, url, environment, audit profile,
+    metric, key).
+    """
+    rollups = {}
+
+    for row in rows:
+        _, url, environment, profile, timestamp, version, branch = row[:7]
+        keys = rollup_keys(timestamp, version, branch)
+
+        for metric, value in zip(ROLLUP_METRICS, row[7:]):
+            if value is None:
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+
+            for granularity, key in keys.items():
+                rollup_key = (granularity, url, environment, profile, metric) + key
+                rollup = rollups.get(rollup_key)
+                if rollup is None:
+                    rollup = rollups[rollup_key] = _Rollup()
+                rollup.add(value, timestamp)
+
+    return rollups
+
+
+def _apply(connection: sqlite3.Connection, rollups: Dict[Tuple, _Rollup]):
+    """
+    Merges new rollups into the stored ones.
+    """
+    rows = {granularity: [] for granularity in ROLLUP_TABLES}
+
+    for (granularity, url, environment, profile, metric, *key), rollup in rollups.items():
+        select_query, _ = _queries(granularity)
+        stored = connection.execute(select_query,
+                                    (url, environment, profile, metric, *key)).fetchone()
+        if stored is not None:
+            rollup.merge(_Rollup(LatencyHistogram.from_json(stored[0]), *stored[1:]))
+
+        rows[granularity].append((url, environment, profile, metric, *key, *rollup.row()))
+
+    for granularity, granularity_rows in rows.items():
+        _, insert_query = _queries(granularity)
+        connection.executemany(insert_query, granularity_rows)
+
+
+@functools.lru_cache(maxsize=None)
+def _queries(granularity: str) -> Tuple[str, str]:
+    """
+    Returns:
+        tuple: The queries reading the stored rollup of a key and replacing
+        it, for one granularity.
+    """
+    table, key_columns = ROLLUP_TABLES[granularity]
+    condition = ' AND '.join(f'{column} = ?' for column in key_columns)
+    columns = ['url', 'environment', 'audit_profile', 'metric', *key_columns, 'count',
+               'total', 'min', 'max', 'sketch', 'first_seen', 'last_seen']
+
+    return (f'SELECT sketch, first_seen, last_seen FROM {table} '
+            f'WHERE url = ? AND environment = ? AND audit_profile = ? AND metric = ? '
+            f'AND {condition};',
+            f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)});")
@@ -0,0 +1,509 @@
+import datetime
+import logging
+import sqlite3
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# The Lighthouse_CPS table of migration 1, as it has always been filled by
+# main.py, with the id later tables and the rollups refer to
+LIGHTHOUSE_CPS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL,
+        description TEXT,
+        date TEXT,
+        time TEXT,
+        environment TEXT,
+        version TEXT,
+        branch TEXT,
+        dns_lookup INTEGER,
+        connect_time INTEGER,
+        start_transfer_time INTEGER,
+        total_time INTEGER,
+        performance_score INTEGER,
+        accessibility_score INTEGER,
+        best_practices_score INTEGER,
+        seo_score INTEGER,
+        first_contentful_paint REAL,
+        speed_index REAL,
+        largest_contentful_paint REAL,
+        cumulative_layout_shift REAL,
+        total_blocking_time REAL,
+        time_to_interactive REAL,
+        error_log TEXT
+    )
+    '''
+
+
+def add_result_id(connection: sqlite3.Connection):
+    """
+    Rebuilds a Lighthouse_CPS table created before there were migrations
+    without an id column: the rows are copied, in insertion order, into a
+    new table with the schema of migration 1 (and any other column the old
+    table had), which then takes its name.
+
+    Args:
+        connection (sqlite3.Connection): A connection in the migration's
+        transaction.
+    """
+    columns = connection.execute(
+        'SELECT name, type FROM pragma_table_info(?) ORDER BY cid;',
+        ('Lighthouse_CPS',)).fetchall()
+    if any(name.lower() == 'id' for name, _ in columns):
+        return
+
+    connection.execute('DROP TABLE IF EXISTS Lighthouse_CPS_rebuild')
+    connection.execute(LIGHTHOUSE_CPS_TABLE.format(name='Lighthouse_CPS_rebuild'))
+    known = {name.lower() for (name,) in connection.execute(
+        'SELECT name FROM pragma_table_info(?);', ('Lighthouse_CPS_rebuild',))}
+    for name, declared in columns:
+        if name.lower() not in known:
+            connection.execute(f'ALTER TABLE Lighthouse_CPS_rebuild '
+                               f'ADD COLUMN "{name}" {declared}')
+
+    names = ', '.join(f'"{name}"' for name, _ in columns)
+    connection.execute(f'INSERT INTO Lighthouse_CPS_rebuild ({names}) '
+                       f'SELECT {names} FROM Lighthouse_CPS ORDER BY rowid')
+    connection.execute('DROP TABLE Lighthouse_CPS')
+    connection.execute('ALTER TABLE Lighthouse_CPS_rebuild RENAME TO Lighthouse_CPS')
+    logger.info('Rebuilt the Lighthouse_CPS table with an id column')
+
+
+# Each migration is a list of statements, applied in order and in a single
+# transaction; a statement may also be a function called with the
+# connection. The number of applied migrations is kept in PRAGMA
+# user_version, so new migrations must only ever be appended.
+MIGRATIONS = [
+    # 1. the Lighthouse_CPS table; a table that predates the migrations
+    # without an id gets one
+    [
+        LIGHTHOUSE_CPS_TABLE.format(name='Lighthouse_CPS'),
+        add_result_id,
+    ],
+    # 2. a sortable ISO-8601 timestamp, backfilled from 'date' and 'time'
+    [
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN timestamp TEXT',
+        '''
+        UPDATE Lighthouse_CPS SET timestamp = iso_timestamp(date, time)
+        WHERE timestamp IS NULL
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_lighthouse_cps_url_timestamp
+        ON Lighthouse_CPS (url, timestamp)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_lighthouse_cps_environment_version
+        ON Lighthouse_CPS (environment, version)
+        ''',
+    ],
+    # 3. the hash of the full report in the report archive
+    [
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN report_hash TEXT',
+    ],
+    # 4. adaptive sampling: the number of runs and the spread of each metric
+    [
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN sample_count INTEGER',
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN metric_spread TEXT',
+    ],
+    # 5. load test runs and their per-URL results
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS Load_Test_Runs (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            concurrency INTEGER,
+            rate REAL,
+            duration REAL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Load_Test_Results (
+            id INTEGER PRIMARY KEY,
+            run_id INTEGER NOT NULL REFERENCES Load_Test_Runs (id),
+            url TEXT NOT NULL,
+            description TEXT,
+            timestamp TEXT NOT NULL,
+            requests INTEGER,
+            errors INTEGER,
+            throughput REAL,
+            error_rate REAL,
+            p50 REAL,
+            p95 REAL,
+            p99 REAL,
+            p999 REAL,
+            min REAL,
+            max REAL,
+            mean REAL,
+            histogram TEXT
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_load_test_results_url_timestamp
+        ON Load_Test_Results (url, timestamp)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_load_test_results_run
+        ON Load_Test_Results (run_id)
+        ''',
+    ],
+    # 6. hourly, daily and per-version rollups, see storage/rollup.py
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS Rollup_Hourly (
+            url TEXT NOT NULL,
+            environment TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            hour TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            total REAL NOT NULL,
+            min REAL,
+            max REAL,
+            sketch TEXT NOT NULL,
+            first_seen TEXT,
+            last_seen TEXT,
+            PRIMARY KEY (url, environment, metric, hour)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Rollup_Daily (
+            url TEXT NOT NULL,
+            environment TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            total REAL NOT NULL,
+            min REAL,
+            max REAL,
+            sketch TEXT NOT NULL,
+            first_seen TEXT,
+            last_seen TEXT,
+            PRIMARY KEY (url, environment, metric, day)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Rollup_Version (
+            url TEXT NOT NULL,
+            environment TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            version TEXT NOT NULL,
+            branch TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            total REAL NOT NULL,
+            min REAL,
+            max REAL,
+            sketch TEXT NOT NULL,
+            first_seen TEXT,
+            last_seen TEXT,
+            PRIMARY KEY (url, environment, metric, version, branch)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Rollup_State (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL
+        )
+        ''',
+    ],
+    # 7. runs and the per-URL checkpoints that --resume reads
+    [
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN run_id INTEGER',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_lighthouse_cps_run
+        ON Lighthouse_CPS (run_id)
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Runs (
+            id INTEGER PRIMARY KEY,
+            started TEXT NOT NULL,
+            finished TEXT,
+            status TEXT NOT NULL,
+            source TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Run_Urls (
+            run_id INTEGER NOT NULL REFERENCES Runs (id),
+            url TEXT NOT NULL,
+            description TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            updated TEXT,
+            PRIMARY KEY (run_id, url, description)
+        ) WITHOUT ROWID
+        ''',
+    ],
+    # 8. how long each stage of a URL's evaluation took
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS Stage_Timings (
+            result_id INTEGER NOT NULL REFERENCES Lighthouse_CPS (id),
+            run_id INTEGER,
+            stage TEXT NOT NULL,
+            calls INTEGER NOT NULL,
+            milliseconds REAL NOT NULL,
+            PRIMARY KEY (result_id, stage)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_stage_timings_run
+        ON Stage_Timings (run_id, stage)
+        ''',
+    ],
+    # 9. the full curl timing breakdown and the warm (reused connection) probe
+    [
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN app_connect_time INTEGER',
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN pretransfer_time INTEGER',
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN redirect_time INTEGER',
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN redirect_count INTEGER',
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN size_download INTEGER',
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN speed_download INTEGER',
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN http_version TEXT',
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN warm_pretransfer_time INTEGER',
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN warm_start_transfer_time INTEGER',
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN warm_total_time INTEGER',
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN warm_new_connections INTEGER',
+    ],
+    # 10. the network requests and resource summary of each Lighthouse report,
+    # resource URLs and hosts are stored once and referenced by id
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS Resource_Hosts (
+            id INTEGER PRIMARY KEY,
+            host TEXT NOT NULL UNIQUE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Resource_Urls (
+            id INTEGER PRIMARY KEY,
+            host_id INTEGER NOT NULL REFERENCES Resource_Hosts (id),
+            url TEXT NOT NULL UNIQUE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Network_Requests (
+            result_id INTEGER NOT NULL REFERENCES Lighthouse_CPS (id),
+            seq INTEGER NOT NULL,
+            url_id INTEGER NOT NULL REFERENCES Resource_Urls (id),
+            resource_type TEXT,
+            mime_type TEXT,
+            status_code INTEGER,
+            protocol TEXT,
+            transfer_size INTEGER,
+            resource_size INTEGER,
+            start_time REAL,
+            duration REAL,
+            PRIMARY KEY (result_id, seq)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_network_requests_url
+        ON Network_Requests (url_id)
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS Resource_Summary (
+            result_id INTEGER NOT NULL REFERENCES Lighthouse_CPS (id),
+            resource_type TEXT NOT NULL,
+            request_count INTEGER,
+            transfer_size INTEGER,
+            PRIMARY KEY (result_id, resource_type)
+        ) WITHOUT ROWID
+        ''',
+    ],
+    # 11. the Lighthouse audit profile of each row; every earlier audit ran
+    # the 'full' profile
+    [
+        'ALTER TABLE Lighthouse_CPS ADD COLUMN audit_profile TEXT',
+        "UPDATE Lighthouse_CPS SET audit_profile = 'full'",
+    ],
+    # 12. the rollups keep each audit profile apart; they are derived from
+    # Lighthouse_CPS, so they are dropped and rolled up again from the first
+    # row (gradually by the writer, or at once by `perf-test rollup`)
+    [
+        'DROP TABLE IF EXISTS Rollup_Hourly',
+        'DROP TABLE IF EXISTS Rollup_Daily',
+        'DROP TABLE IF EXISTS Rollup_Version',
+        '''
+        CREATE TABLE Rollup_Hourly (
+            url TEXT NOT NULL,
+            environment TEXT NOT NULL,
+            audit_profile TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            hour TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            total REAL NOT NULL,
+            min REAL,
+            max REAL,
+            sketch TEXT NOT NULL,
+            first_seen TEXT,
+            last_seen TEXT,
+            PRIMARY KEY (url, environment, audit_profile, metric, hour)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE Rollup_Daily (
+            url TEXT NOT NULL,
+            environment TEXT NOT NULL,
+            audit_profile TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            total REAL NOT NULL,
+            min REAL,
+            max REAL,
+            sketch TEXT NOT NULL,
+            first_seen TEXT,
+            last_seen TEXT,
+            PRIMARY KEY (url, environment, audit_profile, metric, day)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE Rollup_Version (
+            url TEXT NOT NULL,
+            environment TEXT NOT NULL,
+            audit_profile TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            version TEXT NOT NULL,
+            branch TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            total REAL NOT NULL,
+            min REAL,
+            max REAL,
+            sketch TEXT NOT NULL,
+            first_seen TEXT,
+            last_seen TEXT,
+            PRIMARY KEY (url, environment, audit_profile, metric, version, branch)
+        ) WITHOUT ROWID
+        ''',
+        "DELETE FROM Rollup_State WHERE name = 'Lighthouse_CPS'",
+    ],
+    # 13. a run checkpoints each audit profile of a URL apart; the existing
+    # checkpoints take the profile of the URL's latest row in the run
+    [
+        '''
+        CREATE TABLE Run_Urls_rebuild (
+            run_id INTEGER NOT NULL REFERENCES Runs (id),
+            url TEXT NOT NULL,
+            description TEXT NOT NULL,
+            audit_profile TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 1,
+            updated TEXT,
+            PRIMARY KEY (run_id, url, description, audit_profile)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT INTO Run_Urls_rebuild (run_id, url, description, audit_profile,
+                                      status, attempts, updated)
+        SELECT run_id, url, description, COALESCE((
+            SELECT audit_profile FROM Lighthouse_CPS AS result
+            WHERE result.run_id = Run_Urls.run_id AND result.url = Run_Urls.url
+            AND COALESCE(result.description, '') = Run_Urls.description
+            ORDER BY result.id DESC LIMIT 1), 'full'), status, attempts, updated
+        FROM Run_Urls
+        ''',
+        'DROP TABLE Run_Urls',
+        'ALTER TABLE Run_Urls_rebuild RENAME TO Run_Urls',
+    ],
+]
+
+
+def iso_timestamp(date: Optional[str], time: Optional[str]) -> Optional[str]:
+    """
+    Converts the legacy 'M/D/YYYY' date and 'H:MM PM' time strings into an
+    ISO-8601 timestamp.
+
+    Args:
+        date (str or None): The date, e.g. '7/4/2023'.
+        time (str or None): The time, e.g. '3:05 PM'.
+
+    Returns:
+        str or None: The timestamp, e.g. '2023-07-04T15:05:00', or None if
+        the date could not be parsed.
+    """
+    if not date:
+        return None
+
+    try:
+        if time:
+            parsed = datetime.datetime.strptime(f'{date} {time}',
+                                                '%m/%d/%Y %I:%M %p')
+        else:
+            parsed = datetime.datetime.strptime(date, '%m/%d/%Y')
+    except ValueError:
+        return None
+
+    return parsed.isoformat(timespec='seconds')
+
+
+def schema_version(connection: sqlite3.Connection) -> int:
+    """
+    Returns:
+        int: The number of migrations applied to the database.
+    """
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+
+def check_schema(connection: sqlite3.Connection) -> int:
+    """
+    Checks, without migrating, that the database has every migration.
+
+    Returns:
+        int: The schema version.
+
+    Raises:
+        RuntimeError: If the database is behind.
+    """
+    current = schema_version(connection)
+    if current < len(MIGRATIONS):
+        raise RuntimeError(
+            f'The database is at schema version {current}, this version needs '
+            f'{len(MIGRATIONS)}; the next run, schedule or worker migrates it')
+    return current
+
+
+def migrate(connection: sqlite3.Connection) -> int:
+    """
+    Creates the tables and applies every migration the database is missing.
+    Each migration holds the write lock, so processes migrating the same
+    database at once apply it only once.
+
+    Args:
+        connection (sqlite3.Connection): An open database connection.
+
+    Returns:
+        int: The schema version after migrating.
+    """
+    current = schema_version(connection)
+
+    if current >= len(MIGRATIONS):
+        return current
+
+    connection.create_function('iso_timestamp', 2, iso_timestamp,
+                               deterministic=True)
+
+    for version, statements in enumerate(MIGRATIONS[current:], start=current + 1):
+        try:
+            # take the write lock first and look again: another process
+            # (a worker, the writer thread) may have migrated in between
+            connection.execute('BEGIN IMMEDIATE')
+            if schema_version(connection) >= version:
+                connection.rollback()
+                continue
+
+            for statement in statements:
+                if callable(statement):
+                    statement(connection)
+                else:
+                    connection.execute(statement)
+            connection.execute(f'PRAGMA user_version = {version}')
+            connection.commit()
+        except Exception as e:
+            connection.rollback()
+            logger.error(f'Error applying schema migration {version}: {e}')
+            raise
+
+        logger.info(f'Applied schema migration {version}')
+
+    return len(MIGRATIONS)
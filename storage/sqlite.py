@@ -1,18 +1,170 @@
 import logging
+import queue
 import sqlite3
-from typing import List, Optional, Tuple
+import threading
+import time
+from typing import Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from metrics.stage_timer import capture_stage_timings, timed
+from storage.resources import (ResourceInterner, fetch_top_resources, insert_resources,
+                               network_request_rows, resource_summary_rows)
+from storage.rollup import fetch_trend, update_rollups
+from storage.schema import check_schema, migrate
 
-#  set the logging behaviour
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s '
-                                                '- %(name)s:%(message)s')
 logger = logging.getLogger(__name__)
 
+# 'url_data' keys and the Lighthouse_CPS columns they are stored in
+URL_DATA_COLUMNS = [
+    ('URL', 'url'), ('Description', 'description'), ('Date', 'date'),
+    ('Time', 'time'), ('Environment', 'environment'), ('Version', 'version'),
+    ('Branch', 'branch'), ('dns_lookup', 'dns_lookup'),
+    ('connect_time', 'connect_time'),
+    ('start_transfer_time', 'start_transfer_time'),
+    ('total_time', 'total_time'), ('Performance_score', 'performance_score'),
+    ('Accessibility_score', 'accessibility_score'),
+    ('Best_Practices_score', 'best_practices_score'),
+    ('SEO_score', 'seo_score'),
+    ('first_contentful_paint', 'first_contentful_paint'),
+    ('speed_index', 'speed_index'),
+    ('largest_contentful_paint', 'largest_contentful_paint'),
+    ('cumulative_layout_shift', 'cumulative_layout_shift'),
+    ('total_blocking_time', 'total_blocking_time'),
+    ('time_to_interactive', 'time_to_interactive'), ('error_log', 'error_log'),
+    ('Timestamp', 'timestamp'), ('report_hash', 'report_hash'),
+    ('sample_count', 'sample_count'), ('metric_spread', 'metric_spread'),
+    ('run_id', 'run_id'), ('app_connect_time', 'app_connect_time'),
+    ('pretransfer_time', 'pretransfer_time'), ('redirect_time', 'redirect_time'),
+    ('redirect_count', 'redirect_count'), ('size_download', 'size_download'),
+    ('speed_download', 'speed_download'), ('http_version', 'http_version'),
+    ('warm_pretransfer_time', 'warm_pretransfer_time'),
+    ('warm_start_transfer_time', 'warm_start_transfer_time'),
+    ('warm_total_time', 'warm_total_time'),
+    ('warm_new_connections', 'warm_new_connections'),
+    ('audit_profile', 'audit_profile')
+]
+
+# the most rows rolled up after one write, so a database that has never been
+# rolled up catches up gradually (`perf-test rollup` catches up at once)
+ROLLUP_ROWS_PER_WRITE = 1000
+
+INSERT_URL_DATA_QUERY = (
+    f"INSERT INTO Lighthouse_CPS "
+    f"({', '.join(column for _, column in URL_DATA_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in URL_DATA_COLUMNS)});"
+)
+
+
+# marks a URL of a run finished; a URL evaluated again (--resume) counts
+# another attempt
+UPSERT_CHECKPOINT_QUERY = (
+    "INSERT INTO Run_Urls (run_id, url, description, audit_profile, status, updated) "
+    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (run_id, url, description, audit_profile) "
+    "DO UPDATE "
+    "SET status = excluded.status, attempts = attempts + 1, "
+    "updated = excluded.updated;"
+)
+
+
+def url_data_row(url_data: dict) -> Tuple:
+    """
+    Converts URL data into a row for the Lighthouse_CPS table.
+
+    Args:
+        url_data (dict): A dictionary containing URL data.
+
+    Returns:
+        tuple: The values in the order of URL_DATA_COLUMNS.
+    """
+    return tuple(url_data.get(key) for key, _ in URL_DATA_COLUMNS)
+
+
+def checkpoint_row(url_data: dict) -> Optional[Tuple]:
+    """
+    Converts URL data into a row for the Run_Urls table.
+
+    Args:
+        url_data (dict): A dictionary containing URL data.
+
+    Returns:
+        tuple or None: (run_id, url, description, audit_profile, status,
+        updated), None if the URL was not evaluated as part of a run.
+    """
+    if url_data.get('run_id') is None:
+        return None
+
+    status = 'failed' if url_data.get('error_log') else 'succeeded'
+    return (url_data['run_id'], url_data.get('URL'), url_data.get('Description') or '',
+            url_data.get('audit_profile') or '', status, url_data.get('Timestamp'))
+
+
+INSERT_STAGE_TIMING_QUERY = (
+    "INSERT OR REPLACE INTO Stage_Timings (result_id, run_id, stage, calls, milliseconds) "
+    "VALUES (?, ?, ?, ?, ?);"
+)
+
+
+class ResultDetails(NamedTuple):
+    """
+    The child rows of one Lighthouse_CPS row, without its id, which is only
+    known once the row is inserted.
+    """
+    stage_timings: List[Tuple]
+    network_requests: List[Tuple]
+    resource_summary: List[Tuple]
+
+
+def result_details(url_data: dict) -> ResultDetails:
+    """
+    Converts the stage timings, network requests and resource summary of URL
+    data into rows for the Stage_Timings, Network_Requests and
+    Resource_Summary tables.
+
+    Args:
+        url_data (dict): A dictionary containing URL data.
+
+    Returns:
+        ResultDetails: The rows; stage timings are (run_id, stage, calls,
+        milliseconds) tuples, see network_request_rows and
+        resource_summary_rows for the others.
+    """
+    timings = url_data.get('stage_timings')
+    return ResultDetails(
+        [(url_data.get('run_id'), *row) for row in timings.rows()] if timings else [],
+        network_request_rows(url_data),
+        resource_summary_rows(url_data))
+
+
+def insert_result_details(connection, interner: ResourceInterner,
+                          results: Iterable[Tuple[int, ResultDetails]]):
+    """
+    Inserts the child rows of Lighthouse_CPS rows, with one executemany per
+    table for the whole batch.
+
+    Args:
+        connection (sqlite3.Connection or sqlite3.Cursor): Where to insert.
+        interner (ResourceInterner): Turns resource URLs into ids.
+        results (iterable): (Lighthouse_CPS id, ResultDetails) tuples.
+    """
+    results = list(results)
+
+    timings = [(result_id, *row) for result_id, details in results
+               for row in details.stage_timings]
+    if timings:
+        connection.executemany(INSERT_STAGE_TIMING_QUERY, timings)
+
+    insert_resources(connection, interner,
+                     [(result_id, details.network_requests, details.resource_summary)
+                      for result_id, details in results])
+
+
 class SQLiteDatabase:
     """
     A class for managing SQLite database operations.
 
     Args:
         db_name (str): The name of the SQLite database file.
+        read_only (bool): Open the database read-only, for the commands
+        that only read it.
 
     Attributes:
         db_name (str): The name of the SQLite database file.
@@ -26,12 +178,38 @@ class SQLiteDatabase:
             Fetches data from the database.
         insert_url_data(url_data: dict):
             Inserts URL data into the Lighthouse_CPS table.
+        ensure_schema() -> int:
+            Creates or migrates the tables.
+        check_schema() -> int:
+            Checks that the tables are migrated, without migrating them.
+        fetch_url_history(url: str, start: Optional[str], end: Optional[str]) -> List[Tuple]:
+            Fetches the rows of one URL, oldest first.
+        insert_load_test_run(timestamp: str, mode: str, concurrency: int, rate: Optional[float], duration: float) -> int:
+            Inserts a load test run into the Load_Test_Runs table.
+        insert_load_test_result(run_id: int, result: dict):
+            Inserts the load test result of one URL into Load_Test_Results.
+        fetch_trend(url: str, metric: str, granularity: str, ...) -> List[dict]:
+            Fetches the trend of one metric from the rollup tables.
+        start_run(started: str, source: Optional[str]) -> int:
+            Inserts a run into the Runs table.
+        finish_run(run_id: int, finished: str, status: str):
+            Records the end of a run.
+        fetch_run(run_id: Optional[int]) -> Optional[Tuple]:
+            Fetches a run, or the latest one.
+        fetch_succeeded_urls(run_id: int) -> Set[Tuple[str, str, str]]:
+            Fetches the URLs a run has evaluated successfully.
+        fetch_run_progress(run_id: int) -> dict:
+            Counts the URLs of a run by status.
+        fetch_top_resources(url: str, by: str, limit: int, ...) -> List[dict]:
+            Fetches the heaviest or slowest resources of each evaluation of a page.
     """
 
-    def __init__(self, db_name: str):
+    def __init__(self, db_name: str, read_only: bool = False):
         self.db_name = db_name
+        self.read_only = read_only
         self.connection = None
         self.cursor = None
+        self.interner = ResourceInterner()
 
     def __enter__(self) -> 'SQLiteDatabase':
         """
@@ -40,7 +218,10 @@ class SQLiteDatabase:
         Returns:
             SQLiteDatabase: The SQLiteDatabase instance.
         """
-        self.connection = sqlite3.connect(self.db_name)
+        if self.read_only:
+            self.connection = sqlite3.connect(f'file:{self.db_name}?mode=ro', uri=True)
+        else:
+            self.connection = sqlite3.connect(self.db_name)
         self.cursor = self.connection.cursor()
         return self
 
@@ -112,42 +293,508 @@ class SQLiteDatabase:
             logging.error(f'Error fetching data: {e}')
             raise
 
+    def ensure_schema(self) -> int:
+        """
+        Creates the tables, or migrates them to the current schema.
+
+        Returns:
+            int: The schema version.
+        """
+        return migrate(self.connection)
+
+    def check_schema(self) -> int:
+        """
+        Checks that the tables are migrated, without migrating them.
+
+        Returns:
+            int: The schema version.
+
+        Raises:
+            RuntimeError: If the database needs migrating first.
+        """
+        return check_schema(self.connection)
+
+    def fetch_url_history(self, url: str, start: Optional[str] = None,
+                          end: Optional[str] = None) -> List[Tuple]:
+        """
+        Fetches the rows of one URL within a time range, oldest first. The
+        (url, timestamp) index keeps this fast however large the table grows.
+
+        Args:
+            url (str): The URL.
+            start (str or None): The inclusive ISO-8601 lower bound.
+            end (str or None): The exclusive ISO-8601 upper bound.
+
+        Returns:
+            list: A list of tuples representing the fetched rows.
+        """
+        query = 'SELECT * FROM Lighthouse_CPS WHERE url = ? AND timestamp >= ?'
+        parameters = [url, start or '']
+
+        if end is not None:
+            query += ' AND timestamp < ?'
+            parameters.append(end)
+
+        return self.fetch_data(query + ' ORDER BY timestamp;', tuple(parameters))
+
+    @timed('sqlite_insert')
     def insert_url_data(self, url_data: dict):
         """
-        Inserts URL data into the Lighthouse_CPS table.
+        Inserts URL data into the Lighthouse_CPS table, with its stage
+        timings, network requests and resource summary.
 
         Args:
             url_data (dict): A dictionary containing URL data.
         """
-        url_data_keys = [
-            'URL', 'Description', 'Date', 'Time', 'Environment', 'Version',
-            'Branch', 'dns_lookup', 'connect_time',
-            'start_transfer_time', 'total_time', 'Performance_score',
-            'Accessibility_score', 'Best_Practices_score',
-            'SEO_score', 'first_contentful_paint', 'speed_index',
-            'largest_contentful_paint', 'cumulative_layout_shift',
-            'total_blocking_time', 'time_to_interactive', 'error_log'
-        ]
-
         # create a tuple with the values to be inserted
-        session_info = tuple(url_data.get(key) for key in url_data_keys)
-
-        # construct the insert query
-        insert_data_query = '''
-            INSERT INTO Lighthouse_CPS (
-                url, description, date, time, environment, version, branch, 
-                dns_lookup, connect_time, start_transfer_time, total_time, 
-                performance_score, accessibility_score, best_practices_score, 
-                seo_score, first_contentful_paint, speed_index, 
-                largest_contentful_paint, cumulative_layout_shift, 
-                total_blocking_time, time_to_interactive, error_log
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-        '''
+        session_info = url_data_row(url_data)
+        checkpoint = checkpoint_row(url_data)
 
         try:
-            # Execute the query
-            self.execute_query(insert_data_query, session_info)
+            # Execute the queries, the checkpoint and the child rows are
+            # committed in the same transaction
+            if checkpoint is not None:
+                self.cursor.execute(UPSERT_CHECKPOINT_QUERY, checkpoint)
+            self.cursor.execute(INSERT_URL_DATA_QUERY, session_info)
+            insert_result_details(self.cursor, self.interner,
+                                  [(self.cursor.lastrowid, result_details(url_data))])
+            self.connection.commit()
         except Exception as e:
             # Log the error message
             logging.error(f'Error inserting URL data: {e}')
+            self.connection.rollback()
+            self.interner.clear()
             raise
+
+        SQLiteWriter._roll_up(self.connection)
+
+    def fetch_trend(self, url: str, metric: str, granularity: str = 'day',
+                    environment: Optional[str] = None, start: Optional[str] = None,
+                    end: Optional[str] = None, profile: Optional[str] = None) -> List[dict]:
+        """
+        Fetches the trend of one metric of a URL from the rollup tables,
+        without scanning Lighthouse_CPS.
+
+        Args:
+            url (str): The URL.
+            metric (str): The metric column, e.g. 'largest_contentful_paint'.
+            granularity (str): 'hour', 'day' or 'version'.
+            environment (str or None): Only this environment.
+            start (str or None): The inclusive lower bound of the hour or day.
+            end (str or None): The exclusive upper bound of the hour or day.
+            profile (str or None): Only this audit profile.
+
+        Returns:
+            list: One dict per bucket, see storage.rollup.fetch_trend.
+        """
+        return fetch_trend(self.connection, url, metric, granularity,
+                           environment=environment, start=start, end=end,
+                           profile=profile)
+
+    def start_run(self, started: str, source: Optional[str] = None) -> int:
+        """
+        Inserts a run into the Runs table.
+
+        Args:
+            started (str): The ISO-8601 start time.
+            source (str or None): The CSV the URLs are read from.
+
+        Returns:
+            int: The id of the run.
+        """
+        self.execute_query(
+            "INSERT INTO Runs (started, status, source) VALUES (?, 'running', ?);",
+            (started, source))
+        return self.cursor.lastrowid
+
+    def finish_run(self, run_id: int, finished: str, status: str = 'finished'):
+        """
+        Records the end of a run.
+
+        Args:
+            run_id (int): The id of the run.
+            finished (str): The ISO-8601 end time.
+            status (str): 'finished', or 'interrupted' if it was stopped.
+        """
+        self.execute_query('UPDATE Runs SET finished = ?, status = ? WHERE id = ?;',
+                           (finished, status, run_id))
+
+    def fetch_run(self, run_id: Optional[int] = None) -> Optional[Tuple]:
+        """
+        Fetches a run.
+
+        Args:
+            run_id (int or None): The id of the run, the latest run if None.
+
+        Returns:
+            tuple or None: (id, started, finished, status, source), None if
+            there is no such run.
+        """
+        if run_id is None:
+            rows = self.fetch_data('SELECT id, started, finished, status, source '
+                                   'FROM Runs ORDER BY id DESC LIMIT 1;')
+        else:
+            rows = self.fetch_data('SELECT id, started, finished, status, source '
+                                   'FROM Runs WHERE id = ?;', (run_id,))
+        return rows[0] if rows else None
+
+    def fetch_succeeded_urls(self, run_id: int) -> Set[Tuple[str, str, str]]:
+        """
+        Fetches the URLs a run has evaluated successfully, per audit profile.
+
+        Args:
+            run_id (int): The id of the run.
+
+        Returns:
+            set: (url, description, audit_profile) tuples.
+        """
+        return set(self.fetch_data(
+            "SELECT url, description, audit_profile FROM Run_Urls "
+            "WHERE run_id = ? AND status = 'succeeded';", (run_id,)))
+
+    def fetch_run_progress(self, run_id: int) -> dict:
+        """
+        Counts the URLs of a run by status.
+
+        Args:
+            run_id (int): The id of the run.
+
+        Returns:
+            dict: 'succeeded' and 'failed' mapped to their number of URLs.
+        """
+        return dict(self.fetch_data(
+            'SELECT status, COUNT(*) FROM Run_Urls WHERE run_id = ? GROUP BY status;',
+            (run_id,)))
+
+    def fetch_top_resources(self, url: str, by: str = 'size', limit: int = 10,
+                            evaluations: int = 20, environment: Optional[str] = None,
+                            start: Optional[str] = None, end: Optional[str] = None,
+                            profile: Optional[str] = None) -> List[dict]:
+        """
+        Fetches the heaviest or slowest resources of each evaluation of a page.
+
+        Args:
+            url (str): The page URL.
+            by (str): 'size' or 'duration'.
+            limit (int): The resources per evaluation.
+            evaluations (int): The latest evaluations read.
+            environment (str or None): Only this environment.
+            start (str or None): The inclusive lower bound of the timestamp.
+            end (str or None): The exclusive upper bound of the timestamp.
+            profile (str or None): Only this audit profile.
+
+        Returns:
+            list: One dict per resource, see storage.resources.fetch_top_resources.
+        """
+        return fetch_top_resources(self.connection, url, by=by, limit=limit,
+                                   evaluations=evaluations, environment=environment,
+                                   start=start, end=end, profile=profile)
+
+    def insert_load_test_run(self, timestamp: str, mode: str, concurrency: int,
+                             rate: Optional[float], duration: float) -> int:
+        """
+        Inserts a load test run into the Load_Test_Runs table.
+
+        Args:
+            timestamp (str): The ISO-8601 start time of the run.
+            mode (str): 'concurrency' (closed loop) or 'rate' (open loop).
+            concurrency (int): The maximum number of requests in flight.
+            rate (float or None): The request rate of an open loop run.
+            duration (float): Seconds of load per URL.
+
+        Returns:
+            int: The id of the run.
+        """
+        self.execute_query(
+            'INSERT INTO Load_Test_Runs (timestamp, mode, concurrency, rate, '
+            'duration) VALUES (?, ?, ?, ?, ?);',
+            (timestamp, mode, concurrency, rate, duration))
+        return self.cursor.lastrowid
+
+    def insert_load_test_result(self, run_id: int, result: dict):
+        """
+        Inserts the load test result of one URL into Load_Test_Results.
+
+        Args:
+            run_id (int): The id of the run, see insert_load_test_run.
+            result (dict): The result returned by LoadTestEngine.run_url.
+        """
+        keys = ['url', 'description', 'timestamp', 'requests', 'errors',
+                'throughput', 'error_rate', 'p50', 'p95', 'p99', 'p999', 'min',
+                'max', 'mean']
+        histogram = result.get('histogram')
+
+        self.execute_query(
+            f"INSERT INTO Load_Test_Results (run_id, {', '.join(keys)}, histogram) "
+            f"VALUES ({', '.join('?' for _ in range(len(keys) + 2))});",
+            (run_id, *(result.get(key) for key in keys),
+             histogram.to_json() if histogram is not None else None))
+
+
+class SQLiteWriter:
+    """
+    A long-lived, batched writer for the Lighthouse_CPS table.
+
+    Rows passed to insert_url_data are queued and written by a single
+    background thread that keeps one WAL-mode connection open. A batch is
+    written with executemany in one transaction once `batch_size` rows are
+    queued or `flush_interval` seconds after its first row, whichever comes
+    first. Any number of threads may call insert_url_data concurrently.
+    After each batch the new rows are added to the rollup tables.
+
+    A row the database rejects (a constraint or a value it cannot store) is
+    logged and skipped. Any other failure is raised (as RuntimeError) by the
+    next insert_url_data, flush or close, so a run never loses its rows
+    silently: a batch that failed is reported once and the writer goes on
+    with the next one, a writer that stopped (e.g. it could not open the
+    database) fails every later call.
+
+    Args:
+        db_name (str): The name of the SQLite database file.
+        batch_size (int): The number of rows written per transaction.
+        flush_interval (float): The maximum seconds a row waits to be written.
+        stage_histograms (StageHistograms or None): Where the duration of
+        each batch is recorded, as the 'sqlite_write' stage.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_name: str, batch_size: int = 50,
+                 flush_interval: float = 5.0, stage_histograms=None):
+        self.db_name = db_name
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.stage_histograms = stage_histograms
+        self.interner = ResourceInterner()
+        self._queue = queue.Queue()
+        self._thread = None
+        # the error that stopped the writer thread, and the last batch
+        # failure not yet reported
+        self._error = None
+        self._batch_error = None
+        self._error_lock = threading.Lock()
+
+    def __enter__(self) -> 'SQLiteWriter':
+        """
+        Context manager entry point.
+
+        Returns:
+            SQLiteWriter: The started SQLiteWriter instance.
+        """
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """
+        Context manager exit point, flushes and closes the writer.
+        """
+        self.close()
+
+    def start(self):
+        """
+        Starts the background writer thread.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name='sqlite-writer', daemon=True)
+            self._thread.start()
+
+    def insert_url_data(self, url_data: dict):
+        """
+        Queues URL data for insertion into the Lighthouse_CPS table. Its stage
+        timings, network requests and resource summary, and the run's
+        checkpoint if it has a 'run_id', are written in the same transaction.
+
+        Args:
+            url_data (dict): A dictionary containing URL data.
+
+        Raises:
+            RuntimeError: If the writer failed.
+        """
+        self._raise_error()
+        self._queue.put((url_data_row(url_data), checkpoint_row(url_data),
+                         result_details(url_data)))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Writes every queued row and waits until they are committed.
+
+        Args:
+            timeout (float or None): The maximum seconds to wait.
+
+        Returns:
+            bool: True if the rows were committed in time.
+
+        Raises:
+            RuntimeError: If the writer failed.
+        """
+        self._raise_error()
+        done = threading.Event()
+        self._queue.put(done)
+        committed = done.wait(timeout)
+        self._raise_error()
+        return committed
+
+    def close(self):
+        """
+        Writes every queued row durably and closes the connection.
+
+        Raises:
+            RuntimeError: If the writer failed.
+        """
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+    def _raise_error(self):
+        error = self._error
+        if error is not None:
+            raise RuntimeError(f'The SQLite writer stopped: {error}') from error
+
+        with self._error_lock:
+            error, self._batch_error = self._batch_error, None
+        if error is not None:
+            raise RuntimeError(f'The SQLite writer lost a batch: {error}') from error
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.db_name, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL;')
+        # in WAL mode NORMAL only syncs at checkpoints, close() syncs fully
+        connection.execute('PRAGMA synchronous=NORMAL;')
+        connection.execute('PRAGMA busy_timeout=30000;')
+        connection.execute('PRAGMA temp_store=MEMORY;')
+        connection.execute('PRAGMA cache_size=-16000;')
+        return connection
+
+    def _run(self):
+        if self.stage_histograms is None:
+            self._write_batches()
+            return
+
+        with capture_stage_timings(self.stage_histograms):
+            self._write_batches()
+
+    def _write_batches(self):
+        connection = None
+        pending = []
+        deadline = None
+
+        try:
+            connection = self._connect()
+            migrate(connection)
+
+            while True:
+                wait = None if deadline is None \
+                    else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=wait)
+                except queue.Empty:
+                    item = None
+
+                if item is self._STOP:
+                    break
+
+                if isinstance(item, threading.Event):
+                    self._write_batch(connection, pending)
+                    pending, deadline = [], None
+                    item.set()
+                    continue
+
+                if item is not None:
+                    pending.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+
+                if len(pending) >= self.batch_size or \
+                        (deadline is not None and time.monotonic() >= deadline):
+                    self._write_batch(connection, pending)
+                    pending, deadline = [], None
+
+            # durable flush on shutdown
+            connection.execute('PRAGMA synchronous=FULL;')
+            self._write_batch(connection, pending)
+            connection.execute('PRAGMA wal_checkpoint(TRUNCATE);')
+        except Exception as e:
+            logger.exception(f'SQLite writer stopped: {e}')
+            self._error = e
+        finally:
+            if connection is not None:
+                connection.close()
+            # release anyone still waiting on a flush
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _write_batch(self, connection: sqlite3.Connection, items: List[Tuple]):
+        """
+        Writes a batch and rolls it up. A failure is kept to be reported
+        once to the callers, and the writer goes on with the next batch.
+        """
+        try:
+            self._write(connection, items)
+            self._roll_up(connection)
+        except Exception as e:
+            logger.exception(f'Error writing a batch of {len(items)} rows: {e}')
+            with self._error_lock:
+                self._batch_error = e
+
+    @staticmethod
+    @timed('sqlite_rollup')
+    def _roll_up(connection: sqlite3.Connection):
+        """
+        Adds the rows just written to the rollup tables. A failure is only
+        logged: the rows stay after the watermark and are rolled up next time.
+        """
+        try:
+            update_rollups(connection, max_rows=ROLLUP_ROWS_PER_WRITE)
+        except sqlite3.Error as e:
+            logger.error(f'Error updating the rollups: {e}')
+
+    @timed('sqlite_write')
+    def _write(self, connection: sqlite3.Connection, items: List[Tuple]):
+        """
+        Inserts a batch of (row, checkpoint, ResultDetails) items in a single
+        transaction. If the batch fails, the items are retried one at a time
+        so one bad row does not lose the others; only rows the database
+        rejects are skipped, any other error (a locked database, a full disk)
+        is raised.
+        """
+        if not items:
+            return
+
+        try:
+            with connection:
+                connection.executemany(INSERT_URL_DATA_QUERY,
+                                       [row for row, _, _ in items])
+                # the transaction holds the write lock, so the batch got the
+                # consecutive ids up to the last one inserted
+                last_id = connection.execute('SELECT last_insert_rowid();').fetchone()[0]
+                insert_result_details(
+                    connection, self.interner,
+                    [(result_id, details) for result_id, (_, _, details)
+                     in enumerate(items, last_id - len(items) + 1)])
+                connection.executemany(UPSERT_CHECKPOINT_QUERY,
+                                       [checkpoint for _, checkpoint, _ in items
+                                        if checkpoint is not None])
+            return
+        except sqlite3.Error as e:
+            # the rolled back transaction may have added resource URLs
+            self.interner.clear()
+            logger.error(f'Error inserting a batch of {len(items)} rows: {e}')
+
+        for row, checkpoint, details in items:
+            try:
+                with connection:
+                    result_id = connection.execute(INSERT_URL_DATA_QUERY, row).lastrowid
+                    insert_result_details(connection, self.interner, [(result_id, details)])
+                    if checkpoint is not None:
+                        connection.execute(UPSERT_CHECKPOINT_QUERY, checkpoint)
+            except (sqlite3.IntegrityError, sqlite3.DataError, sqlite3.InterfaceError) as e:
+                self.interner.clear()
+                logger.error(f'Error inserting URL data for {row[0]}: {e}')
+            except Exception:
+                self.interner.clear()
+                raise
@@ -1,2 +1,3 @@
 # used to automatically import the modules (classes) of the package
 import url_information.information
+import url_information.version_cache
@@ -1,10 +1,6 @@
 import logging
 import re
-import requests
 
-#  set the logging behaviour
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s '
-                                                '- %(name)s:%(message)s')
 logger = logging.getLogger(__name__)
 
 ENVIRONMENT_URLS = {
@@ -16,14 +12,19 @@ ENVIRONMENT_URLS = {
 
 
 class Info:
-    def __init__(self, url):
+    def __init__(self, url, cache=None, timeout=(10, 30)):
         """
         Initializes an instance of the Info class.
 
         Args:
             url (str): The URL to be stored.
+            cache (VersionCache or None): Shares version lookups between URLs
+            of the same environment; None fetches version.txt every time.
+            timeout (tuple): The connect and read timeouts in seconds.
         """
         self.url = url
+        self.cache = cache
+        self.timeout = timeout
 
     def environment(self):
         """
@@ -54,19 +55,60 @@ class Info:
             be determined.
         """
         environment_name = self.environment()
+
+        if self.cache is None:
+            return self.fetch_versioning(environment_name, self.timeout)
+
+        fetched = []
+
+        def load():
+            fetched.append(environment_name)
+            return self.fetch_versioning(environment_name, self.timeout)
+
+        version_info = self.cache.get(environment_name, load)
+
+        if fetched:
+            # the lookup was made (and logged) on behalf of this URL
+            return version_info
+
+        if version_info is None:
+            logger.warning('Could not determine application version')
+            logger.warning('Could not determine application branch')
+        else:
+            logger.info(f"Version: {version_info['version']}")
+            logger.info(f"Branch: {version_info['branch']}")
+
+        return version_info
+
+    @classmethod
+    def fetch_versioning(cls, environment_name, timeout=(10, 30)):
+        """
+        Requests and parses the version.txt of an environment.
+
+        Args:
+            environment_name (str): The environment name, e.g. 'PROD'.
+            timeout (tuple): The connect and read timeouts in seconds.
+
+        Returns:
+            dict or None: A dictionary containing the version and branch if
+            successfully retrieved, or None if the version and branch could not
+            be determined.
+        """
+        import requests  # imported on first use, it is slow to import
+
         version_checker = ENVIRONMENT_URLS.get(environment_name,
                                                ENVIRONMENT_URLS['PROD'])
 
         try:
-            response = requests.get(version_checker)
+            response = requests.get(version_checker, timeout=timeout)
             response.raise_for_status()
         except (requests.RequestException, ValueError):
             logger.warning('Could not determine application version')
             logger.warning('Could not determine application branch')
             return None
 
-        version = self.extract_version(response.text)
-        branch = self.extract_branch(response.text)
+        version = cls.extract_version(response.text)
+        branch = cls.extract_branch(response.text)
 
         return {'version': version, 'branch': branch}
 
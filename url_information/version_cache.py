@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class VersionCache:
+    """
+    A thread-safe cache of version information, keyed by environment.
+
+    Only one lookup per environment is in flight at any time; concurrent
+    callers for the same environment wait for it and share its result.
+    """
+
+    def __init__(self, ttl=300, failure_ttl=30):
+        """
+        Initializes an instance of the VersionCache class.
+
+        Args:
+            ttl (float): Seconds a successful lookup stays cached.
+            failure_ttl (float): Seconds a failed lookup stays cached, so an
+            unreachable version.txt is not requested for every URL.
+        """
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self._entries = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def get(self, environment, loader):
+        """
+        Returns the cached version information for an environment, calling
+        the loader if there is no valid entry.
+
+        Args:
+            environment (str): The environment name, e.g. 'PROD'.
+            loader (callable): Returns the version information (or None)
+            when called without arguments.
+
+        Returns:
+            dict or None: The version information returned by the loader.
+        """
+        with self._lock:
+            cached = self._lookup(environment)
+            if cached is not None:
+                return cached[0]
+            environment_lock = self._loading.setdefault(environment,
+                                                        threading.Lock())
+
+        with environment_lock:
+            # another thread may have loaded it while we were waiting
+            with self._lock:
+                cached = self._lookup(environment)
+            if cached is not None:
+                return cached[0]
+
+            value = loader()
+            ttl = self.ttl if value is not None else self.failure_ttl
+
+            with self._lock:
+                self._entries[environment] = (time.monotonic() + ttl, value)
+
+        return value
+
+    def clear(self):
+        """
+        Removes every cached entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def _lookup(self, environment):
+        """
+        Returns a 1-tuple holding the cached value, or None if there is no
+        valid entry. The caller must hold the lock.
+        """
+        entry = self._entries.get(environment)
+
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+
+        logger.debug(f'Using cached version information for {environment}')
+        return (entry[1],)
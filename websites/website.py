@@ -1,26 +1,27 @@
 import logging
-import requests
 
-#  set the logging behaviour
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s '
-                                                '- %(name)s:%(message)s')
 logger = logging.getLogger(__name__)
 
 
 class Website:
     @staticmethod
-    def website_up(url):
+    def website_up(url, timeout=(10, 30)):
         """
         Check if a website is up and running.
 
+        Only the response headers are read, the body is never downloaded.
+
         :param url: The URL of the website being checked.
+        :param timeout: The connect and read timeouts in seconds.
         :return: True if the website is up and the response status code is between
         200 and 399 (inclusive), False otherwise
         :rtype: bool
         """
+        import requests  # imported on first use, it is slow to import
+
         try:
-            response = requests.get(url)
-            return 200 <= response.status_code < 400
+            with requests.get(url, timeout=timeout, stream=True) as response:
+                return 200 <= response.status_code < 400
         except requests.exceptions.RequestException as e:
             logger.error(f'Failed to make a request: {str(e)}')
             return False